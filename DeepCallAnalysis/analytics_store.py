@@ -0,0 +1,505 @@
+# analytics_store.py
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, time as dt_time, timezone
+from typing import Dict, List, Optional, Sequence
+
+import search_index
+from models import (
+    AnalyticsPeriod, AudioAnalysis, CallAnalysis, CategoryRate, OverallCallAnalysisResult, SearchField, SearchHit,
+    SearchSort, StoredCall, TurnBreakdown, TurnCategory, TurnGroupBy, TurnSentiment,
+)
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_ENABLED = os.getenv("ANALYTICS_ENABLED", "true").lower() in ("1", "true", "yes")
+ANALYTICS_DB_PATH = os.getenv("ANALYTICS_DB_PATH", ".cache/analytics.sqlite3")
+# Results are buffered and written in one transaction this often (or sooner once the buffer is full).
+ANALYTICS_FLUSH_SECONDS = float(os.getenv("ANALYTICS_FLUSH_SECONDS", "1.0"))
+ANALYTICS_FLUSH_CALLS = int(os.getenv("ANALYTICS_FLUSH_CALLS", "200"))
+# A batch whose write fails is kept and retried on the next flushes, up to this many attempts per call.
+ANALYTICS_FLUSH_ATTEMPTS = int(os.getenv("ANALYTICS_FLUSH_ATTEMPTS", "3"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    call_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    audio_digest TEXT,
+    filename TEXT,
+    turn_count INTEGER NOT NULL,
+    duration_ms INTEGER NOT NULL,
+    analyzed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_calls_created ON calls (created_at);
+CREATE INDEX IF NOT EXISTS idx_calls_analyzed ON calls (analyzed, created_at);
+
+CREATE TABLE IF NOT EXISTS turns (
+    call_id TEXT NOT NULL,
+    turn_index INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    speaker TEXT NOT NULL,
+    speaker_role TEXT NOT NULL,
+    start_ms INTEGER NOT NULL,
+    end_ms INTEGER NOT NULL,
+    emotion TEXT NOT NULL,
+    transcript TEXT NOT NULL,
+    PRIMARY KEY (call_id, turn_index)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_turns_speaker ON turns (speaker_role, created_at);
+
+-- speaker_role / emotion are copied from turns so aggregates never need a join
+CREATE TABLE IF NOT EXISTS turn_analysis (
+    call_id TEXT NOT NULL,
+    turn_index INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    speaker_role TEXT NOT NULL,
+    emotion TEXT NOT NULL,
+    category TEXT NOT NULL,
+    sentiment TEXT NOT NULL,
+    translation TEXT NOT NULL,
+    PRIMARY KEY (call_id, turn_index)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_turn_analysis_category ON turn_analysis (category, created_at);
+CREATE INDEX IF NOT EXISTS idx_turn_analysis_sentiment ON turn_analysis (sentiment, created_at);
+
+-- Analysed turn counts per UTC day and dimension combination, kept in step with
+-- turn_analysis by write_batch; turn breakdowns read only this table
+CREATE TABLE IF NOT EXISTS turn_rollup (
+    day TEXT NOT NULL,
+    category TEXT NOT NULL,
+    sentiment TEXT NOT NULL,
+    speaker_role TEXT NOT NULL,
+    emotion TEXT NOT NULL,
+    turns INTEGER NOT NULL,
+    PRIMARY KEY (day, category, sentiment, speaker_role, emotion)
+) WITHOUT ROWID;
+
+-- Per-call category counts, so call-level rates never scan turns
+CREATE TABLE IF NOT EXISTS call_categories (
+    call_id TEXT NOT NULL,
+    category TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    turns INTEGER NOT NULL,
+    PRIMARY KEY (call_id, category)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_call_categories_category ON call_categories (category, created_at);
+
+CREATE TABLE IF NOT EXISTS call_summaries (
+    call_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    summarization TEXT NOT NULL,
+    call_purpose TEXT NOT NULL,
+    topics_keywords TEXT NOT NULL,
+    action_taken TEXT NOT NULL,
+    next_action TEXT
+);
+"""
+
+# SQL expression for the start of the period containing the 'YYYY-MM-DD' date `day` (weeks start on Monday)
+_PERIOD_SQL = {
+    AnalyticsPeriod.day: "{day}",
+    AnalyticsPeriod.week: "date({day}, 'weekday 0', '-6 days')",
+    AnalyticsPeriod.month: "strftime('%Y-%m-01', {day})",
+}
+
+_GROUP_BY_COLUMN = {
+    TurnGroupBy.category: "category",
+    TurnGroupBy.sentiment: "sentiment",
+    TurnGroupBy.speaker: "speaker_role",
+    TurnGroupBy.emotion: "emotion",
+}
+
+# Adds (sign=+1) or removes (sign=-1) the current turn_analysis rows of a set of calls from turn_rollup
+_ROLLUP_DELTA_SQL = """
+INSERT INTO turn_rollup (day, category, sentiment, speaker_role, emotion, turns)
+SELECT date(created_at, 'unixepoch'), category, sentiment, speaker_role, emotion, {sign} * COUNT(*)
+FROM turn_analysis WHERE call_id IN (SELECT value FROM json_each(?))
+GROUP BY 1, 2, 3, 4, 5
+ON CONFLICT (day, category, sentiment, speaker_role, emotion) DO UPDATE SET turns = turns + excluded.turns
+"""
+
+
+def transcript_call_id(conversation: AudioAnalysis) -> str:
+    """Stable ID for a call: /transcribe, /analyze-turns and /analyze-call all see the same transcript."""
+    return hashlib.sha256(conversation.model_dump_json().encode()).hexdigest()
+
+
+def _epoch(day: Optional[date], default: float) -> float:
+    """Start of `day` (UTC) as a Unix timestamp."""
+    if day is None:
+        return default
+    return datetime.combine(day, dt_time.min, tzinfo=timezone.utc).timestamp()
+
+
+def speaker_role(speaker: str) -> str:
+    """'Agent (Mohammed)' -> 'Agent'."""
+    return speaker.split("(", 1)[0].strip() or speaker
+
+
+class AnalyticsStore:
+    """SQLite tables for calls, turns, turn analysis and summaries, plus the aggregate queries over them."""
+
+    def __init__(self, db_path: str = ANALYTICS_DB_PATH):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.executescript(search_index.SEARCH_SCHEMA)
+            backlog = search_index.unindexed_calls(self._conn)
+            if backlog:
+                logger.info(f"Indexing {len(backlog)} stored calls for search")
+                search_index.index_calls(self._conn, backlog, reindex_keywords=backlog)
+
+    # --- Writes ---
+
+    def write_batch(self, pending: List["PendingCall"]) -> None:
+        """
+        Upserts a batch of calls and whatever results were recorded for them, in
+        one transaction. Re-analysing a call replaces its turn analysis, and the
+        rollup is corrected by first subtracting the rows being replaced.
+        """
+        calls = [
+            (
+                call.call_id, call.created_at, call.audio_digest, call.filename, len(call.conversation.conversation),
+                max((t.endTime for t in call.conversation.conversation), default=0)
+                - min((t.startTime for t in call.conversation.conversation), default=0),
+            )
+            for call in pending
+        ]
+        analyzed = [call for call in pending if call.analysis is not None]
+        analyzed_ids = json.dumps([call.call_id for call in analyzed])
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO calls (call_id, created_at, audio_digest, filename, turn_count, duration_ms) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (call_id) DO UPDATE SET "
+                "audio_digest = COALESCE(excluded.audio_digest, calls.audio_digest), "
+                "filename = COALESCE(excluded.filename, calls.filename)",
+                calls,
+            )
+            # Child rows carry the call's first-seen time, which may predate this batch
+            created_at = dict(self._conn.execute(
+                "SELECT call_id, created_at FROM calls WHERE call_id IN (SELECT value FROM json_each(?))",
+                (json.dumps([call.call_id for call in pending]),),
+            ).fetchall())
+
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO turns (call_id, turn_index, created_at, speaker, speaker_role, start_ms, end_ms, "
+                "emotion, transcript) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (call.call_id, i, created_at[call.call_id], t.speaker, speaker_role(t.speaker), t.startTime,
+                     t.endTime, t.emotion, t.transcript)
+                    for call in pending
+                    for i, t in enumerate(call.conversation.conversation)
+                ),
+            )
+
+            if analyzed:
+                self._conn.execute(_ROLLUP_DELTA_SQL.format(sign=-1), (analyzed_ids,))
+                self._conn.execute("DELETE FROM turn_analysis WHERE call_id IN (SELECT value FROM json_each(?))", (analyzed_ids,))
+                self._conn.execute("DELETE FROM call_categories WHERE call_id IN (SELECT value FROM json_each(?))", (analyzed_ids,))
+                self._conn.executemany(
+                    "INSERT INTO turn_analysis (call_id, turn_index, created_at, speaker_role, emotion, category, "
+                    "sentiment, translation) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        (call.call_id, i, created_at[call.call_id], speaker_role(t.speaker), t.emotion,
+                         a.category.value, a.sentiment.value, a.translation)
+                        for call in analyzed
+                        for i, (t, a) in enumerate(zip(call.conversation.conversation, call.analysis.conversation_analysis))
+                    ),
+                )
+                self._conn.execute(_ROLLUP_DELTA_SQL.format(sign=1), (analyzed_ids,))
+                self._conn.execute("DELETE FROM turn_rollup WHERE turns = 0")
+                self._conn.execute(
+                    "INSERT INTO call_categories (call_id, category, created_at, turns) "
+                    "SELECT call_id, category, created_at, COUNT(*) FROM turn_analysis "
+                    "WHERE call_id IN (SELECT value FROM json_each(?)) GROUP BY call_id, category",
+                    (analyzed_ids,),
+                )
+                self._conn.execute(
+                    "UPDATE calls SET analyzed = 1 WHERE call_id IN (SELECT value FROM json_each(?))", (analyzed_ids,)
+                )
+
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO call_summaries (call_id, created_at, summarization, call_purpose, "
+                "topics_keywords, action_taken, next_action) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (call.call_id, created_at[call.call_id], call.overall.summarization, call.overall.call_purpose,
+                     json.dumps(call.overall.topics_keywords), call.overall.action_taken, call.overall.next_action)
+                    for call in pending
+                    if call.overall is not None
+                ),
+            )
+            search_index.index_calls(
+                self._conn,
+                [call.call_id for call in pending],
+                reindex_turns=[call.call_id for call in analyzed],
+                reindex_keywords=[call.call_id for call in pending if call.overall is not None],
+            )
+
+    # --- Queries ---
+
+    def category_rate(
+        self,
+        category: TurnCategory,
+        period: AnalyticsPeriod = AnalyticsPeriod.week,
+        since: Optional[date] = None,
+        until: Optional[date] = None,
+    ) -> List[CategoryRate]:
+        """Share of analysed calls with at least one turn in `category`, per period."""
+        bucket = _PERIOD_SQL[period].format(day="date(c.created_at, 'unixepoch')")
+        query = (
+            f"SELECT {bucket} AS period_start, COUNT(*) AS calls, COUNT(cc.call_id) AS hits, "
+            "COALESCE(SUM(cc.turns), 0) AS category_turns "
+            "FROM calls c LEFT JOIN call_categories cc ON cc.call_id = c.call_id AND cc.category = ? "
+            "WHERE c.analyzed = 1 AND c.created_at >= ? AND c.created_at < ? "
+            "GROUP BY period_start ORDER BY period_start"
+        )
+        with self._lock:
+            rows = self._conn.execute(
+                query, (category.value, _epoch(since, 0), _epoch(until, float("inf")))
+            ).fetchall()
+        return [
+            CategoryRate(
+                period_start=row["period_start"],
+                calls=row["calls"],
+                calls_with_category=row["hits"],
+                rate=row["hits"] / row["calls"],
+                category_turns=row["category_turns"],
+            )
+            for row in rows
+        ]
+
+    def turn_breakdown(
+        self,
+        group_by: TurnGroupBy,
+        period: Optional[AnalyticsPeriod] = None,
+        since: Optional[date] = None,
+        until: Optional[date] = None,
+        speaker: Optional[str] = None,
+        category: Optional[TurnCategory] = None,
+        sentiment: Optional[TurnSentiment] = None,
+    ) -> List[TurnBreakdown]:
+        """
+        Analysed turns counted by category / sentiment / speaker role / emotion,
+        optionally per period. Served from the daily rollup, so cost depends on
+        the number of days, not turns.
+        """
+        conditions = ["day >= ?", "day < ?"]
+        params: list = [since.isoformat() if since else "", until.isoformat() if until else "9999-12-31"]
+        if speaker is not None:
+            conditions.append("speaker_role = ?")
+            params.append(speaker)
+        if category is not None:
+            conditions.append("category = ?")
+            params.append(category.value)
+        if sentiment is not None:
+            conditions.append("sentiment = ?")
+            params.append(sentiment.value)
+
+        bucket = _PERIOD_SQL[period].format(day="day") if period else "NULL"
+        query = (
+            f"SELECT {bucket} AS period_start, {_GROUP_BY_COLUMN[group_by]} AS key, SUM(turns) AS turns "
+            f"FROM turn_rollup WHERE {' AND '.join(conditions)} "
+            "GROUP BY period_start, key HAVING SUM(turns) > 0 ORDER BY period_start, turns DESC"
+        )
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [TurnBreakdown(period_start=row["period_start"], key=row["key"], turns=row["turns"]) for row in rows]
+
+    def list_calls(
+        self,
+        category: Optional[TurnCategory] = None,
+        since: Optional[date] = None,
+        until: Optional[date] = None,
+        limit: int = 100,
+    ) -> List[StoredCall]:
+        """Most recent calls first, optionally only those with a turn in `category`."""
+        query = (
+            "SELECT c.*, s.call_purpose, s.summarization FROM calls c "
+            "LEFT JOIN call_summaries s ON s.call_id = c.call_id "
+            "WHERE c.created_at >= ? AND c.created_at < ?"
+        )
+        params: list = [_epoch(since, 0), _epoch(until, float("inf"))]
+        if category is not None:
+            query += " AND c.call_id IN (SELECT call_id FROM call_categories WHERE category = ?)"
+            params.append(category.value)
+        query += " ORDER BY c.created_at DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(query, params + [limit]).fetchall()
+        return [
+            StoredCall(
+                call_id=row["call_id"],
+                created_at=row["created_at"],
+                filename=row["filename"],
+                turn_count=row["turn_count"],
+                duration_ms=row["duration_ms"],
+                call_purpose=row["call_purpose"],
+                summarization=row["summarization"],
+            )
+            for row in rows
+        ]
+
+
+    def search(
+        self,
+        query: str,
+        fields: Sequence[SearchField] = tuple(SearchField),
+        speaker: Optional[str] = None,
+        since: Optional[date] = None,
+        until: Optional[date] = None,
+        limit: int = 50,
+        offset: int = 0,
+        sort: SearchSort = SearchSort.relevance,
+    ) -> List[SearchHit]:
+        """Full-text search over transcripts, translations and topic keywords; see search_index.search."""
+        with self._lock:
+            return search_index.search(
+                self._conn, query, fields, speaker, _epoch(since, 0), _epoch(until, float("inf")), limit, offset, sort
+            )
+
+
+class PendingCall:
+    """Everything recorded for one call since the last flush."""
+
+    def __init__(self, call_id: str, conversation: AudioAnalysis):
+        self.call_id = call_id
+        self.conversation = conversation
+        self.created_at = time.time()
+        self.audio_digest: Optional[str] = None
+        self.filename: Optional[str] = None
+        self.analysis: Optional[CallAnalysis] = None
+        self.overall: Optional[OverallCallAnalysisResult] = None
+        self.failed_writes = 0
+
+    def absorb(self, older: "PendingCall") -> None:
+        """Fills in what this (newer) entry lacks from an older one for the same call."""
+        self.created_at = min(self.created_at, older.created_at)
+        self.audio_digest = self.audio_digest or older.audio_digest
+        self.filename = self.filename or older.filename
+        self.analysis = self.analysis or older.analysis
+        self.overall = self.overall or older.overall
+        self.failed_writes = max(self.failed_writes, older.failed_writes)
+
+
+class AnalyticsRecorder:
+    """
+    Buffers results in memory and writes them to the AnalyticsStore in bulk
+    from a background task, so request handlers never wait on SQLite.
+    Results for the same call that arrive close together are merged into one row set.
+    """
+
+    def __init__(
+        self,
+        store: AnalyticsStore,
+        flush_seconds: float = ANALYTICS_FLUSH_SECONDS,
+        flush_calls: int = ANALYTICS_FLUSH_CALLS,
+        enabled: bool = ANALYTICS_ENABLED,
+        flush_attempts: int = ANALYTICS_FLUSH_ATTEMPTS,
+    ):
+        self.store = store
+        self.enabled = enabled
+        self.flush_seconds = flush_seconds
+        self.flush_calls = flush_calls
+        self.flush_attempts = flush_attempts
+        self.dropped = 0
+        self._pending: Dict[str, PendingCall] = {}
+        self._lock = threading.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(
+        self,
+        conversation: AudioAnalysis,
+        analysis: Optional[CallAnalysis] = None,
+        overall: Optional[OverallCallAnalysisResult] = None,
+        audio_digest: Optional[str] = None,
+        filename: Optional[str] = None,
+    ) -> str:
+        """Queues a transcript and any results for it; returns its call_id."""
+        call_id = transcript_call_id(conversation)
+        if not self.enabled:
+            return call_id
+        with self._lock:
+            call = self._pending.get(call_id)
+            if call is None:
+                call = self._pending[call_id] = PendingCall(call_id, conversation)
+            call.audio_digest = audio_digest or call.audio_digest
+            call.filename = filename or call.filename
+            call.analysis = analysis or call.analysis
+            call.overall = overall or call.overall
+            full = len(self._pending) >= self.flush_calls
+        if full:
+            self._wakeup.set()
+        return call_id
+
+    def flush(self) -> int:
+        """
+        Writes everything buffered so far. If the write fails, the batch goes back
+        into the buffer for the next flush; a call that has failed
+        `flush_attempts` times is dropped so a bad row cannot block the writer.
+        """
+        with self._lock:
+            pending, self._pending = list(self._pending.values()), {}
+        if not pending:
+            return 0
+        try:
+            self.store.write_batch(pending)
+        except Exception:
+            self._requeue(pending)
+            raise
+        return len(pending)
+
+    def _requeue(self, failed: List[PendingCall]) -> None:
+        with self._lock:
+            for call in failed:
+                call.failed_writes += 1
+                if call.failed_writes >= self.flush_attempts:
+                    self.dropped += 1
+                    logger.error(f"Dropping call {call.call_id} after {call.failed_writes} failed analytics writes")
+                    continue
+                newer = self._pending.get(call.call_id)
+                if newer is None:
+                    self._pending[call.call_id] = call
+                else:
+                    # Recorded again while the write was running: keep the newer results
+                    newer.absorb(call)
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await asyncio.to_thread(self.flush)
+        except Exception as e:
+            # Shutdown must carry on closing the other stores even if the last batch is lost
+            logger.error(f"Analytics flush failed on shutdown: {type(e).__name__}: {e}", exc_info=True)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                written = await asyncio.to_thread(self.flush)
+                if written:
+                    logger.debug(f"Wrote {written} calls to the analytics store")
+            except Exception as e:
+                logger.error(f"Analytics flush failed: {type(e).__name__}: {e}", exc_info=True)
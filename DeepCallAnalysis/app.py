@@ -4,13 +4,12 @@ import streamlit as st
 import requests
 import pandas as pd
 import io
+import json
 
 # --- Configuration ---
 # Replace with your actual FastAPI backend URL if it's not running locally on port 8000
 BACKEND_URL = "http://localhost:8001"
-TRANSCRIBE_URL = f"{BACKEND_URL}/transcribe"
-ANALYZE_TURNS_URL = f"{BACKEND_URL}/analyze-turns"
-ANALYZE_CALL_URL = f"{BACKEND_URL}/analyze-call"
+TRANSCRIBE_STREAM_URL = f"{BACKEND_URL}/transcribe-stream"
 
 # --- Helper Functions ---
 def reset_analysis_state():
@@ -20,6 +19,24 @@ def reset_analysis_state():
         if key in st.session_state:
             del st.session_state[key]
 
+def format_ms(ms):
+    """Formats integer milliseconds as HH:MM:SS for display."""
+    total = int(ms) // 1000
+    return f"{total // 3600:02d}:{total % 3600 // 60:02d}:{total % 60:02d}"
+
+def transcript_table(turns):
+    """Transcript turns as a display DataFrame."""
+    return pd.DataFrame([
+        {
+            "Start": format_ms(turn.get('startTime', 0)),
+            "End": format_ms(turn.get('endTime', 0)),
+            "Speaker": turn.get('speaker', 'Unknown'),
+            "Emotion": turn.get('emotion', ''),
+            "Transcript": turn.get('transcript', ''),
+        }
+        for turn in turns
+    ])
+
 # --- Streamlit App Layout ---
 st.set_page_config(page_title="Audio Analysis App", layout="wide")
 st.title("🎙️ Audio Call Analysis")
@@ -48,35 +65,35 @@ if uploaded_file is not None:
         files = {'file': (uploaded_file.name, io.BytesIO(audio_bytes), uploaded_file.type)}
 
         try:
-            # --- Step 1: Transcription ---
-            with st.spinner("Step 1/3: Transcribing audio... (This may take a while)"):
-                response_transcribe = requests.post(TRANSCRIBE_URL, files=files)
-                response_transcribe.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-                st.session_state.transcription_result = response_transcribe.json()
-            st.success("Step 1/3: Transcription complete!")
-
-            # --- Step 2: Overall Call Analysis ---
-            if 'transcription_result' in st.session_state:
-                 with st.spinner("Step 2/3: Generating overall call summary..."):
-                    # The backend expects the transcription result as JSON payload
-                    payload_turns = st.session_state.transcription_result
-                    headers = {'Content-Type': 'application/json'}
-                    response_overall = requests.post(ANALYZE_CALL_URL, json=payload_turns,headers=headers)
-                    response_overall.raise_for_status()
-                    st.session_state.overall_analysis_result = response_overall.json()
-                 st.success("Step 2/3: Overall analysis complete!")
-            # --- Step 3: Turn Analysis ---
-            if 'transcription_result' in st.session_state:
-                with st.spinner("Step 3/3: Analyzing conversation turns..."):
-                    # The backend expects the transcription result as JSON payload
-                    payload_turns = st.session_state.transcription_result
-                    headers = {'Content-Type': 'application/json'}
-                    response_turns = requests.post(ANALYZE_TURNS_URL, json=payload_turns,headers=headers)
-                    response_turns.raise_for_status()
-                    st.session_state.turn_analysis_result = response_turns.json()
-                st.success("Step 3/3: Turn analysis complete!")
-
-
+            # --- Single streaming round trip ---
+            # Turns are rendered as soon as the backend emits them; the turn and
+            # overall analyses follow on the same stream once the transcript is complete.
+            st.subheader("🗣️ Live Transcript")
+            transcript_placeholder = st.empty()
+            status_placeholder = st.empty()
+            streamed_turns = []
+            status_placeholder.info("Transcribing audio... turns will appear as they are recognised.")
+
+            with requests.post(TRANSCRIBE_STREAM_URL, params={"analyze": "true"}, files=files, stream=True) as response_stream:
+                response_stream.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+                for line in response_stream.iter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    event_type = event.pop('type')
+                    if event_type == 'turn':
+                        streamed_turns.append(event['turn'])
+                        transcript_placeholder.dataframe(transcript_table(streamed_turns), use_container_width=True)
+                    elif event_type == 'transcription':
+                        st.session_state.transcription_result = event
+                        status_placeholder.info("Transcription complete. Analyzing conversation...")
+                    elif event_type == 'overall_analysis':
+                        st.session_state.overall_analysis_result = event
+                    elif event_type == 'turn_analysis':
+                        st.session_state.turn_analysis_result = event
+                    elif event_type == 'error':
+                        raise RuntimeError(event.get('detail', 'Unknown backend error'))
+            status_placeholder.success("Transcription, overall analysis and turn analysis complete!")
 
         except requests.exceptions.RequestException as e:
             st.session_state.error = f"An error occurred during API communication: {e}"
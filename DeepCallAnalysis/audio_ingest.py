@@ -0,0 +1,130 @@
+# audio_ingest.py
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+import tempfile
+import time
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile
+
+from observability import observe_upload
+
+logger = logging.getLogger(__name__)
+
+# Uploads larger than this are rejected with 413 before they reach the model.
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(500 * 1024 * 1024)))
+# Size of each read from the incoming upload; this bounds per-request buffering.
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+# Where spooled uploads live while a request is being processed (None = system temp dir).
+SPOOL_DIR: Optional[str] = os.getenv("AUDIO_SPOOL_DIR") or None
+
+
+class SpooledAudio:
+    """
+    An uploaded audio file spooled to a temp file on disk.
+
+    The SHA-256 digest is computed while streaming, so cache lookups never need
+    the whole file in memory.
+    """
+
+    def __init__(self, path: str, size: int, digest: str, media_type: str, filename: Optional[str] = None):
+        self.path = path
+        self.size = size
+        self.digest = digest
+        self.media_type = media_type
+        self.filename = filename
+
+    def read_bytes(self) -> bytes:
+        """
+        Materializes the audio as a single bytes object.
+        Only call this at the model boundary: BinaryContent needs real bytes.
+        """
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def close(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _hash_and_write(hasher, out, chunk: bytes) -> None:
+    hasher.update(chunk)
+    out.write(chunk)
+
+
+async def spool_upload(
+    file: UploadFile,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    chunk_size: int = UPLOAD_CHUNK_BYTES,
+    spool_dir: Optional[str] = SPOOL_DIR,
+) -> SpooledAudio:
+    """
+    Streams an UploadFile to disk in fixed-size chunks, hashing as it goes.
+    Raises HTTPException 400 for an empty upload and 413 when max_bytes is exceeded.
+    """
+    started = time.perf_counter()
+    hasher = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(prefix="upload-", suffix=".audio", dir=spool_dir)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Uploaded file exceeds the maximum size of {max_bytes} bytes.",
+                    )
+                # Hashing and the disk write run off the event loop
+                await asyncio.to_thread(_hash_and_write, hasher, out, chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty.")
+    except BaseException:
+        os.remove(path)
+        raise
+
+    observe_upload(size, time.perf_counter() - started)
+    logger.info(f"Spooled {size} bytes from {file.filename} to {path}")
+    return SpooledAudio(
+        path=path,
+        size=size,
+        digest=hasher.hexdigest(),
+        media_type=file.content_type,
+        filename=file.filename,
+    )
+
+
+def open_audio_path(path: str, media_type: Optional[str] = None, chunk_size: int = UPLOAD_CHUNK_BYTES) -> SpooledAudio:
+    """
+    Wraps an existing file on disk (e.g. a batch job source) as SpooledAudio.
+    The file is hashed in chunks; do not close() the result unless the caller owns the file.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+            size += len(chunk)
+    if size == 0:
+        raise ValueError(f"Audio file is empty: {path}")
+    return SpooledAudio(
+        path=path,
+        size=size,
+        digest=hasher.hexdigest(),
+        media_type=media_type or mimetypes.guess_type(path)[0] or "application/octet-stream",
+        filename=os.path.basename(path),
+    )
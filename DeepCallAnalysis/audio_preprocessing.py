@@ -0,0 +1,346 @@
+# audio_preprocessing.py
+import io
+import logging
+import os
+import tempfile
+import wave
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from audio_ingest import SPOOL_DIR
+from models import AudioAnalysis, ConversationTurn
+from windowed_transcription import WAV_MEDIA_TYPES
+
+try:
+    import soundfile
+except ImportError:  # Optional: only needed for AUDIO_PREPROCESS_CODEC=flac
+    soundfile = None
+
+logger = logging.getLogger(__name__)
+
+AUDIO_PREPROCESS = os.getenv("AUDIO_PREPROCESS", "true").lower() in ("1", "true", "yes")
+# Speech does not need more than 16 kHz; lower-rate recordings are never upsampled.
+AUDIO_TARGET_SAMPLE_RATE = int(os.getenv("AUDIO_TARGET_SAMPLE_RATE", "16000"))
+# "wav" (16-bit PCM) or "flac" (lossless, roughly half the size; needs the soundfile package).
+AUDIO_PREPROCESS_CODEC = os.getenv("AUDIO_PREPROCESS_CODEC", "wav").lower()
+VAD_FRAME_MS = int(os.getenv("VAD_FRAME_MS", "30"))
+# A frame is speech if it is this much louder than the call's noise floor ...
+VAD_MARGIN_DB = float(os.getenv("VAD_MARGIN_DB", "12"))
+# ... and louder than this absolute level (dBFS).
+VAD_MIN_THRESHOLD_DBFS = float(os.getenv("VAD_MIN_THRESHOLD_DBFS", "-55"))
+# Anything louder than this is always kept, so steady loud audio (no quiet floor) is never cut.
+VAD_MAX_THRESHOLD_DBFS = float(os.getenv("VAD_MAX_THRESHOLD_DBFS", "-35"))
+# Speech is extended by this much on both sides so word edges are not clipped.
+VAD_HANGOVER_MS = int(os.getenv("VAD_HANGOVER_MS", "200"))
+# Silences at least this long are collapsed down to VAD_KEEP_SILENCE_MS.
+VAD_MIN_SILENCE_MS = int(os.getenv("VAD_MIN_SILENCE_MS", "1500"))
+VAD_KEEP_SILENCE_MS = int(os.getenv("VAD_KEEP_SILENCE_MS", "500"))
+
+# Audio is decoded and resampled this many seconds at a time.
+_DECODE_CHUNK_SECONDS = 10
+
+
+# --- Offset Map ---
+
+class OffsetMap:
+    """
+    Maps timestamps on the preprocessed (silence-collapsed) audio back to the
+    original recording. Each kept segment starts at processed_starts[k] in the
+    processed audio and original_starts[k] in the original; time runs at the
+    same speed inside a segment.
+    """
+
+    def __init__(self, processed_starts: List[int], original_starts: List[int]):
+        self.processed_starts = processed_starts
+        self.original_starts = original_starts
+
+    @classmethod
+    def identity(cls) -> "OffsetMap":
+        return cls([0], [0])
+
+    def is_identity(self) -> bool:
+        return len(self.processed_starts) == 1 and self.original_starts[0] == 0
+
+    def to_original(self, ms: int, is_end: bool = False) -> int:
+        """
+        An end time that falls exactly on a cut belongs to the segment before
+        the cut, so a turn never stretches over removed silence.
+        """
+        if is_end:
+            k = bisect_left(self.processed_starts, ms) - 1
+        else:
+            k = bisect_right(self.processed_starts, ms) - 1
+        k = max(k, 0)
+        return self.original_starts[k] + ms - self.processed_starts[k]
+
+    def remap_turn(self, turn: ConversationTurn) -> ConversationTurn:
+        start = self.to_original(turn.startTime)
+        end = max(self.to_original(turn.endTime, is_end=True), start)
+        return turn.model_copy(update={"startTime": start, "endTime": end})
+
+    def remap(self, analysis: AudioAnalysis) -> AudioAnalysis:
+        if self.is_identity():
+            return analysis
+        return AudioAnalysis(conversation=[self.remap_turn(turn) for turn in analysis.conversation])
+
+
+# --- Decoding / Resampling ---
+
+def _pcm_to_float(frames: bytes, sample_width: int, channels: int) -> np.ndarray:
+    """Interleaved PCM frames -> float32 array of shape (n, channels) in [-1, 1)."""
+    if sample_width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif sample_width == 2:
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 2**15
+    elif sample_width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        ints = np.where(ints >= 2**23, ints - 2**24, ints)
+        samples = ints.astype(np.float32) / 2**23
+    elif sample_width == 4:
+        samples = np.frombuffer(frames, dtype="<i4").astype(np.float32) / 2**31
+    else:
+        raise ValueError(f"Unsupported sample width: {sample_width}")
+    return samples.reshape(-1, channels)
+
+
+def _resample(mono: np.ndarray, in_rate: int, out_rate: int) -> np.ndarray:
+    """
+    Downsamples with a box anti-aliasing filter. Integer ratios (48k -> 16k)
+    average whole blocks; other ratios (44.1k -> 16k) smooth then interpolate.
+    """
+    if in_rate == out_rate:
+        return mono
+    ratio = in_rate / out_rate
+    if ratio.is_integer():
+        r = int(ratio)
+        usable = len(mono) // r * r
+        return mono[:usable].reshape(-1, r).mean(axis=1)
+    width = int(np.ceil(ratio))
+    smoothed = np.convolve(mono, np.full(width, 1.0 / width, dtype=np.float32), mode="same")
+    positions = np.arange(int(len(mono) / ratio)) * ratio
+    return np.interp(positions, np.arange(len(mono)), smoothed).astype(np.float32)
+
+
+def decode_wav_chunks(path: str, target_rate: int) -> Iterator[Tuple[np.ndarray, int, tuple]]:
+    """
+    Reads a PCM WAV _DECODE_CHUNK_SECONDS at a time, downmixes to mono and
+    resamples to min(source rate, target_rate). Yields (int16 samples, their
+    rate, source parameters) per chunk, so only one chunk is in memory at once.
+    Decoding is deterministic: reading the file twice yields the same samples.
+    """
+    with wave.open(path, "rb") as src:
+        params = src.getparams()
+        out_rate = min(params.framerate, target_rate)
+        chunk_frames = params.framerate * _DECODE_CHUNK_SECONDS
+        while True:
+            frames = src.readframes(chunk_frames)
+            if not frames:
+                break
+            mono = _pcm_to_float(frames, params.sampwidth, params.nchannels).mean(axis=1)
+            samples = _resample(mono, params.framerate, out_rate)
+            yield (np.clip(samples, -1.0, 1.0 - 1 / 2**15) * 2**15).astype(np.int16), out_rate, params
+
+
+def wav_params(path: str) -> tuple:
+    with wave.open(path, "rb") as src:
+        return src.getparams()
+
+
+# --- Voice Activity Detection ---
+
+def frame_energies(chunks: Iterable[np.ndarray], frame: int) -> Tuple[np.ndarray, int]:
+    """
+    Energy (dBFS) of each whole `frame`-sample frame across a stream of int16
+    chunks, plus the total sample count. Samples left over at the end of a chunk
+    are carried into the next one.
+    """
+    energies = []
+    carry = np.zeros(0, dtype=np.int16)
+    n_samples = 0
+    for chunk in chunks:
+        n_samples += len(chunk)
+        samples = np.concatenate((carry, chunk)) if len(carry) else chunk
+        n_frames = len(samples) // frame
+        if n_frames:
+            frames = samples[:n_frames * frame].reshape(n_frames, frame).astype(np.float32) / 2**15
+            energies.append(10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10))
+        carry = samples[n_frames * frame:]
+    energy_db = np.concatenate(energies) if energies else np.zeros(0, dtype=np.float32)
+    return energy_db, n_samples
+
+
+def speech_mask(energy_db: np.ndarray, frame_ms: int = VAD_FRAME_MS) -> np.ndarray:
+    """Per-frame speech/non-speech decision from frame energy against an adaptive noise floor."""
+    if len(energy_db) == 0:
+        return np.ones(0, dtype=bool)
+    noise_floor = np.percentile(energy_db, 10)
+    threshold = min(max(noise_floor + VAD_MARGIN_DB, VAD_MIN_THRESHOLD_DBFS), VAD_MAX_THRESHOLD_DBFS)
+    voiced = energy_db > threshold
+    hangover = VAD_HANGOVER_MS // frame_ms
+    if hangover:
+        voiced = np.convolve(voiced, np.ones(2 * hangover + 1), mode="same") > 0
+    return voiced
+
+
+def kept_segments(
+    n_samples: int,
+    rate: int,
+    voiced: np.ndarray,
+    frame_ms: int = VAD_FRAME_MS,
+    min_silence_ms: int = VAD_MIN_SILENCE_MS,
+    keep_silence_ms: int = VAD_KEEP_SILENCE_MS,
+) -> List[Tuple[int, int]]:
+    """
+    [start, end) sample ranges to keep. Every silent run of at least
+    min_silence_ms loses its middle, leaving keep_silence_ms split across its
+    two edges so turn boundaries stay audible.
+    """
+    frame = max(rate * frame_ms // 1000, 1)
+    silent = np.concatenate(([0], (~voiced).astype(np.int8), [0]))
+    edges = np.diff(silent)
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)
+    long_runs = (run_ends - run_starts) * frame_ms >= min_silence_ms
+    half_keep = rate * keep_silence_ms // 2000
+
+    segments = []
+    position = 0
+    for run_start, run_end in zip(run_starts[long_runs] * frame, run_ends[long_runs] * frame):
+        cut_start = int(run_start) + half_keep
+        cut_end = min(int(run_end), n_samples) - half_keep
+        if cut_end <= cut_start:
+            continue
+        segments.append((position, cut_start))
+        position = cut_end
+    segments.append((position, n_samples))
+    return [(s, e) for s, e in segments if e > s]
+
+
+# --- Pipeline ---
+
+class PreprocessedAudio:
+    """
+    Mono, resampled, silence-collapsed audio written to a temp WAV, with the
+    OffsetMap back to the original timeline. The WAV stays PCM so long calls
+    can still be windowed; encode() produces the bytes sent to the model.
+    """
+
+    def __init__(self, wav_path: str, offset_map: OffsetMap, duration: float, codec: str):
+        self.wav_path = wav_path
+        self.offset_map = offset_map
+        self.duration = duration
+        self.codec = codec
+
+    def encode(self) -> Tuple[bytes, str]:
+        """
+        (audio bytes, media type) in the configured codec. Only used below the
+        windowing threshold, so the clip is bounded; FLAC is encoded block by block.
+        """
+        if self.codec == "flac":
+            buf = io.BytesIO()
+            with soundfile.SoundFile(self.wav_path) as src, soundfile.SoundFile(
+                buf, "w", samplerate=src.samplerate, channels=1, format="FLAC", subtype="PCM_16",
+            ) as dst:
+                for block in src.blocks(blocksize=src.samplerate * _DECODE_CHUNK_SECONDS, dtype="int16"):
+                    dst.write(block)
+            return buf.getvalue(), "audio/flac"
+        with open(self.wav_path, "rb") as f:
+            return f.read(), "audio/wav"
+
+    def close(self) -> None:
+        try:
+            os.remove(self.wav_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def preprocess_audio(
+    path: str,
+    media_type: Optional[str],
+    target_rate: int = AUDIO_TARGET_SAMPLE_RATE,
+    codec: str = AUDIO_PREPROCESS_CODEC,
+) -> Optional[PreprocessedAudio]:
+    """
+    Downmixes, resamples and collapses silences of a PCM WAV file. Returns None
+    (send the original) when preprocessing is disabled, the file is not PCM WAV,
+    or there would be nothing to gain.
+    """
+    if not AUDIO_PREPROCESS or media_type not in WAV_MEDIA_TYPES:
+        return None
+    if codec == "flac" and soundfile is None:
+        logger.warning("AUDIO_PREPROCESS_CODEC=flac needs the soundfile package; using wav")
+        codec = "wav"
+    try:
+        params = wav_params(path)
+        rate = min(params.framerate, target_rate)
+        # Pass 1: frame energies only, to find the silences
+        frame = max(rate * VAD_FRAME_MS // 1000, 1)
+        energy_db, n_samples = frame_energies((c for c, _, _ in decode_wav_chunks(path, target_rate)), frame)
+    except (wave.Error, EOFError, ValueError) as e:
+        logger.info(f"Skipping preprocessing for {path}: {e}")
+        return None
+
+    segments = kept_segments(n_samples, rate, speech_mask(energy_db))
+    already_compact = params.nchannels == 1 and params.sampwidth == 2 and rate == params.framerate
+    if already_compact and len(segments) == 1 and segments[0] == (0, n_samples) and codec == "wav":
+        return None
+
+    processed_starts, original_starts = [], []
+    kept = 0
+    for start, end in segments:
+        processed_starts.append(kept * 1000 // rate)
+        original_starts.append(start * 1000 // rate)
+        kept += end - start
+    if not segments:
+        processed_starts, original_starts = [0], [0]  # empty audio
+
+    # Pass 2: decode again and write only the kept ranges, one chunk at a time
+    fd, wav_path = tempfile.mkstemp(prefix="preprocessed-", suffix=".wav", dir=SPOOL_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f, wave.open(f, "wb") as dst:
+            dst.setnchannels(1)
+            dst.setsampwidth(2)
+            dst.setframerate(rate)
+            position = 0
+            for chunk, _, _ in decode_wav_chunks(path, target_rate):
+                chunk_end = position + len(chunk)
+                for start, end in segments:
+                    if end <= position:
+                        continue
+                    if start >= chunk_end:
+                        break
+                    dst.writeframes(chunk[max(start, position) - position:min(end, chunk_end) - position]
+                                    .astype("<i2").tobytes())
+                position = chunk_end
+    except BaseException:
+        os.remove(wav_path)
+        raise
+
+    original_seconds = params.nframes / params.framerate
+    duration = kept / rate
+    logger.info(
+        f"Preprocessed {path}: {params.nchannels}ch {params.framerate} Hz {original_seconds:.1f}s -> "
+        f"mono {rate} Hz {duration:.1f}s ({len(segments) - 1} silences collapsed)"
+    )
+    return PreprocessedAudio(wav_path, OffsetMap(processed_starts, original_starts), duration, codec)
+
+
+def preprocessing_tag(codec: str = AUDIO_PREPROCESS_CODEC) -> str:
+    """Settings that change the audio sent to the model; part of the transcription cache key."""
+    if not AUDIO_PREPROCESS:
+        return "raw"
+    if codec == "flac" and soundfile is None:
+        codec = "wav"
+    return (
+        f"{codec}:{AUDIO_TARGET_SAMPLE_RATE}:{VAD_FRAME_MS}:{VAD_MARGIN_DB:g}:{VAD_MIN_THRESHOLD_DBFS:g}:"
+        f"{VAD_MAX_THRESHOLD_DBFS:g}:{VAD_HANGOVER_MS}:{VAD_MIN_SILENCE_MS}:{VAD_KEEP_SILENCE_MS}"
+    )
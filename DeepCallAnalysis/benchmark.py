@@ -0,0 +1,388 @@
+# benchmark.py
+# python benchmark.py --endpoints analyze-full,transcribe --rate 20 --requests 200 --latency-ms 800
+# python benchmark.py --compare-prompts --turns 300 --prefill-ms-per-1k-tokens 40
+"""
+Load-testing harness for the call-analysis API.
+
+Runs the FastAPI app in-process with all three agents swapped for
+deterministic local stub models (configurable latency and output size), drives
+it with an open-loop async load generator and reports latency percentiles,
+throughput and peak memory per endpoint. No model quota is used.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import wave
+from typing import Dict, List
+
+# Isolate caches/job state from a real deployment before main is imported
+_BENCH_DIR = tempfile.mkdtemp(prefix="callbench-")
+os.environ.setdefault("TRANSCRIPTION_CACHE_DIR", os.path.join(_BENCH_DIR, "transcriptions"))
+os.environ.setdefault("JOBS_DB_PATH", os.path.join(_BENCH_DIR, "jobs.sqlite3"))
+os.environ.setdefault("JOBS_UPLOAD_DIR", os.path.join(_BENCH_DIR, "job_uploads"))
+os.environ.setdefault("ANALYTICS_DB_PATH", os.path.join(_BENCH_DIR, "analytics.sqlite3"))
+# Stub turns are short filler the pre-classifier would resolve locally; measure the model path unless asked
+os.environ.setdefault("PRECLASSIFIER_ENABLED", "false")
+# Load requests repeat the same payloads; coalescing them would measure the coalescer, not the model path
+os.environ.setdefault("REQUEST_COALESCING", "false")
+# One stub stands in for every tier, so escalating would only call it twice
+os.environ.setdefault("TURN_ANALYZER_MODELS", "google-gla:gemini-2.5-flash")
+os.environ.setdefault("OVERALL_ANALYZER_MODELS", "google-gla:gemini-2.5-flash")
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark-stub")
+
+import httpx
+from pydantic_ai.messages import ModelMessage, ModelResponse, ToolCallPart
+from pydantic_ai.models.function import AgentInfo, DeltaToolCall, FunctionModel
+
+import main
+from compact_transcript import approx_tokens, prompt_turn_count
+from models import AudioAnalysis
+
+PROMPT_FORMATS = ["json", "compact"]
+ENDPOINTS = ["transcribe", "transcribe-stream", "analyze-turns", "analyze-call", "analyze-full", "call-metrics"]
+AUDIO_ENDPOINTS = {"transcribe", "transcribe-stream", "analyze-full"}
+
+
+# === Stub Models ===
+
+def make_transcript(turns: int, words_per_turn: int) -> Dict:
+    conversation = []
+    for i in range(turns):
+        start = i * 4000
+        conversation.append({
+            "speaker": "Agent" if i % 2 == 0 else "Customer",
+            "startTime": f"{start // 3600000:02d}:{start // 60000 % 60:02d}:{start // 1000 % 60:02d}",
+            "endTime": f"{(start + 3000) // 3600000:02d}:{(start + 3000) // 60000 % 60:02d}:{(start + 3000) // 1000 % 60:02d}",
+            "transcript": " ".join(["word"] * words_per_turn),
+            "emotion": "Neutral",
+        })
+    return {"conversation": conversation}
+
+
+def last_prompt(messages: List[ModelMessage]) -> str:
+    return messages[-1].parts[-1].content
+
+
+def count_prompt_turns(messages: List[ModelMessage]) -> int:
+    """Number of turns in the conversation an analysis agent was given."""
+    return prompt_turn_count(last_prompt(messages))
+
+
+class StubModels:
+    """Deterministic FunctionModels standing in for the three Gemini agents."""
+
+    def __init__(self, latency_ms: float, jitter_ms: float, turns: int, words_per_turn: int, seed: int = 0,
+                 prefill_ms_per_1k_tokens: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        # Input-size dependent latency for the analysis agents, so prompt encodings can be compared
+        self.prefill_ms_per_1k_tokens = prefill_ms_per_1k_tokens
+        self.transcript = make_transcript(turns, words_per_turn)
+        self.random = random.Random(seed)
+
+    async def _sleep(self, prompt: str = ""):
+        delay = self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        if prompt and self.prefill_ms_per_1k_tokens:
+            delay += approx_tokens(prompt) / 1000 * self.prefill_ms_per_1k_tokens
+        await asyncio.sleep(max(delay, 0) / 1000)
+
+    def _tool_call(self, info: AgentInfo, args: Dict) -> ModelResponse:
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, args)])
+
+    def transcriber(self) -> FunctionModel:
+        async def run(messages, info):
+            await self._sleep()
+            return self._tool_call(info, self.transcript)
+
+        async def stream(messages, info):
+            # Emit one turn per chunk so partial-output streaming is exercised
+            await self._sleep()
+            name = info.output_tools[0].name
+            turns = self.transcript["conversation"]
+            yield {0: DeltaToolCall(name=name, json_args='{"conversation": [')}
+            for i, turn in enumerate(turns):
+                await asyncio.sleep(self.latency_ms / 1000 / max(len(turns), 1))
+                yield {0: DeltaToolCall(json_args=(", " if i else "") + json.dumps(turn))}
+            yield {0: DeltaToolCall(json_args="]}")}
+
+        return FunctionModel(run, stream_function=stream)
+
+    def turn_analyzer(self) -> FunctionModel:
+        async def run(messages, info):
+            await self._sleep(last_prompt(messages))
+            n = count_prompt_turns(messages)
+            return self._tool_call(info, {"conversation_analysis": [
+                {"category": "None", "sentiment": "Neutral", "translation": "stub translation"}
+            ] * n})
+
+        return FunctionModel(run)
+
+    def overall_analyzer(self) -> FunctionModel:
+        async def run(messages, info):
+            await self._sleep(last_prompt(messages))
+            return self._tool_call(info, {
+                # Long enough to pass overall_analysis_doubt when tiers are configured
+                "summarization": "The customer called about a stub issue and the agent resolved it on the call.",
+                "call_purpose": "Stub purpose.",
+                "topics_keywords": ["stub", "benchmark"],
+                "action_taken": "None.",
+                "next_action": None,
+            })
+
+        return FunctionModel(run)
+
+    @contextlib.contextmanager
+    def installed(self):
+        with main.Transcritor_agent.override(model=self.transcriber()), \
+                main.call_analyzer_agent.override(model=self.turn_analyzer()), \
+                main.overallcall_analyzer_agent.override(model=self.overall_analyzer()):
+            yield
+
+
+# === Load Generation ===
+
+# Seeds for generated uploads; never reused in a process, so no endpoint or run sees another's audio
+_audio_seeds = itertools.count(1)
+
+
+def make_wav(size_kb: int, seed: int) -> bytes:
+    """Mono 16 kHz WAV of roughly size_kb; each seed gives a different file (no cache hits)."""
+    rng = random.Random(seed)
+    frames = bytes(rng.getrandbits(8) for _ in range(64)) * max(size_kb * 1024 // 64, 1)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(frames)
+    return buf.getvalue()
+
+
+async def send(client: httpx.AsyncClient, endpoint: str, payload, audio: bytes) -> int:
+    if endpoint in AUDIO_ENDPOINTS:
+        files = {"file": ("bench.wav", audio, "audio/wav")}
+        if endpoint == "transcribe-stream":
+            async with client.stream("POST", f"/{endpoint}", files=files, params={"analyze": "true"}) as response:
+                async for _ in response.aiter_lines():
+                    pass
+                return response.status_code
+        response = await client.post(f"/{endpoint}", files=files)
+    else:
+        response = await client.post(f"/{endpoint}", json=payload)
+    return response.status_code
+
+
+async def run_endpoint(endpoint: str, args, payload) -> Dict:
+    """Open-loop load: requests start on schedule at args.rate/s regardless of how slow responses are."""
+    transport = httpx.ASGITransport(app=main.app)
+    latencies: List[float] = []
+    errors = 0
+    repeated_audio = make_wav(args.audio_kb, 0) if args.repeat_audio else None
+
+    # Counted so a run that re-sends one file is reported as cache hits, not transcription
+    cache_hits = 0
+    cache_get = main.transcription_cache.get
+
+    def counting_get(key):
+        nonlocal cache_hits
+        result = cache_get(key)
+        cache_hits += result is not None
+        return result
+
+    async def one(i: int):
+        nonlocal errors
+        audio = repeated_audio if repeated_audio is not None else make_wav(args.audio_kb, next(_audio_seeds))
+        started = time.perf_counter()
+        try:
+            status = await send(client, endpoint, payload, audio)
+        except Exception:
+            status = 599
+        latencies.append(time.perf_counter() - started)
+        if status >= 400:
+            errors += 1
+
+    if args.tracemalloc:
+        tracemalloc.reset_peak()
+    main.transcription_cache.get = counting_get
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            started = time.perf_counter()
+            tasks = []
+            for i in range(args.requests):
+                tasks.append(asyncio.create_task(one(i)))
+                await asyncio.sleep(1 / args.rate)
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - started
+    finally:
+        del main.transcription_cache.get
+    peak_traced_mb = tracemalloc.get_traced_memory()[1] / 2**20 if args.tracemalloc else None
+
+    latencies.sort()
+    cached = repeated_audio is not None and endpoint in AUDIO_ENDPOINTS
+    return {
+        "endpoint": f"{endpoint} (cached)" if cached else endpoint,
+        "requests": args.requests,
+        "errors": errors,
+        "transcription_cache_hits": cache_hits,
+        "throughput_rps": args.requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        # Process-wide high-water mark so far; per-endpoint Python peak needs --tracemalloc
+        "max_rss_mb": max_rss_mb(),
+        "peak_traced_mb": peak_traced_mb,
+    }
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 1024
+
+
+def print_report(rows: List[Dict]) -> None:
+    header = (
+        f"{'endpoint':<26}{'req':>6}{'err':>5}{'hits':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        f"{'RSS MB':>9}{'traced MB':>11}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        traced = f"{r['peak_traced_mb']:.1f}" if r["peak_traced_mb"] is not None else "-"
+        print(
+            f"{r['endpoint']:<26}{r['requests']:>6}{r['errors']:>5}{r['transcription_cache_hits']:>6}"
+            f"{r['throughput_rps']:>9.1f}"
+            f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['max_rss_mb']:>9.1f}{traced:>11}"
+        )
+
+
+def find_regressions(rows: List[Dict], baseline_path: str, tolerance: float) -> List[str]:
+    """Endpoints whose p95 latency grew by more than tolerance (e.g. 0.2 = 20%) over a saved --json run."""
+    with open(baseline_path) as f:
+        baseline = {row["endpoint"]: row for row in json.load(f)}
+    regressions = []
+    for row in rows:
+        before = baseline.get(row["endpoint"])
+        if before and row["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{row['endpoint']}: p95 {before['p95_ms']:.1f} ms -> {row['p95_ms']:.1f} ms")
+    return regressions
+
+
+def prompt_sizes(conversation: AudioAnalysis) -> List[Dict]:
+    """Characters and approximate tokens of each analysis prompt, per encoding."""
+    rows = []
+    for prompt_format in PROMPT_FORMATS:
+        main.ANALYSIS_PROMPT_FORMAT = prompt_format
+        prompts = {
+            "turn_analyzer": main.analysis_prompt(conversation, include_times=False),
+            "overall_analyzer": main.analysis_prompt(conversation),
+        }
+        for agent, prompt in prompts.items():
+            rows.append({"format": prompt_format, "agent": agent, "chars": len(prompt), "approx_tokens": approx_tokens(prompt)})
+    return rows
+
+
+def print_prompt_sizes(rows: List[Dict]) -> None:
+    json_tokens = {r["agent"]: r["approx_tokens"] for r in rows if r["format"] == "json"}
+    print(f"{'agent':<18}{'format':<10}{'chars':>10}{'~tokens':>10}{'vs json':>10}")
+    for r in rows:
+        baseline = json_tokens.get(r["agent"])
+        change = f"{r['approx_tokens'] / baseline - 1:+.1%}" if baseline and r["format"] != "json" else "-"
+        print(f"{r['agent']:<18}{r['format']:<10}{r['chars']:>10}{r['approx_tokens']:>10}{change:>10}")
+    print()
+
+
+async def run_benchmark(args) -> List[Dict]:
+    stubs = StubModels(args.latency_ms, args.jitter_ms, args.turns, args.words_per_turn, seed=args.seed,
+                       prefill_ms_per_1k_tokens=args.prefill_ms_per_1k_tokens)
+    conversation = AudioAnalysis.model_validate(stubs.transcript)
+    payload = conversation.model_dump(mode="json")
+    # Each run is repeated per prompt encoding when comparing them
+    prompt_formats = PROMPT_FORMATS if args.compare_prompts else [main.ANALYSIS_PROMPT_FORMAT]
+    if args.compare_prompts:
+        print_prompt_sizes(prompt_sizes(conversation))
+    rows = []
+    if args.tracemalloc:
+        tracemalloc.start()
+    with stubs.installed():
+        for prompt_format in prompt_formats:
+            main.ANALYSIS_PROMPT_FORMAT = prompt_format
+            for endpoint in args.endpoints:
+                row = await run_endpoint(endpoint, args, payload)
+                if args.compare_prompts:
+                    row["endpoint"] = f"{endpoint} ({prompt_format})"
+                rows.append(row)
+    if args.tracemalloc:
+        tracemalloc.stop()
+    return rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", help="Comma-separated endpoints to benchmark (default: all)")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint")
+    parser.add_argument("--rate", type=float, default=20.0, help="Request arrival rate per second (open loop)")
+    parser.add_argument("--audio-kb", type=int, default=512, help="Size of the generated WAV upload")
+    parser.add_argument("--repeat-audio", action="store_true",
+                        help="Send the same WAV on every request; audio endpoints then mostly measure transcription "
+                             "cache hits and are labelled '(cached)' (default: unique audio per request)")
+    parser.add_argument("--latency-ms", type=float, default=500.0, help="Simulated model latency per agent call")
+    parser.add_argument("--jitter-ms", type=float, default=100.0, help="Uniform +/- jitter on the simulated latency")
+    parser.add_argument("--turns", type=int, default=40, help="Turns in the stub transcript")
+    parser.add_argument("--words-per-turn", type=int, default=20, help="Words per stub transcript turn")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--prefill-ms-per-1k-tokens", type=float, default=0.0,
+                        help="Extra simulated analysis-agent latency per 1k prompt tokens")
+    parser.add_argument("--compare-prompts", action="store_true",
+                        help="Report prompt sizes and run each endpoint with the json and compact analysis encodings "
+                             "(defaults --endpoints to analyze-turns,analyze-call)")
+    parser.add_argument("--tracemalloc", action="store_true", help="Track per-endpoint peak Python allocations (slows requests down)")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file")
+    parser.add_argument("--baseline", help="Results JSON from an earlier run; exit non-zero on p95 regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 growth vs. --baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+    if args.endpoints is None:
+        args.endpoints = "analyze-turns,analyze-call" if args.compare_prompts else ",".join(ENDPOINTS)
+    args.endpoints = [e.strip().strip("/") for e in args.endpoints.split(",") if e.strip()]
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {sorted(unknown)}")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    results = asyncio.run(run_benchmark(args))
+    print_report(results)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+    failed = any(r["errors"] for r in results)
+    if args.baseline:
+        regressions = find_regressions(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
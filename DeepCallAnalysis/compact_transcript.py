@@ -0,0 +1,74 @@
+# compact_transcript.py
+import json
+import re
+from typing import Dict
+
+from models import AudioAnalysis
+
+# Characters that would break the one-row-per-turn layout
+_CELL_BREAKS = re.compile(r"[\t\r\n]+")
+# Characters that would break the "S0=name; S1=name" speaker dictionary
+_SPEAKER_BREAKS = re.compile(r'[;="\\]')
+# Rough BPE-style count (words and punctuation); good enough to compare encodings
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def _cell(text: str) -> str:
+    return _CELL_BREAKS.sub(" ", text).strip()
+
+
+def _speaker(name: str) -> str:
+    """Speaker names containing ';', '=', quotes or backslashes are written as JSON strings."""
+    name = _cell(name)
+    return json.dumps(name, ensure_ascii=False) if _SPEAKER_BREAKS.search(name) else name
+
+
+def _clock(ms: int) -> str:
+    seconds = ms // 1000
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+def encode_conversation(conversation: AudioAnalysis, include_times: bool = True) -> str:
+    """
+    Token-minimal prompt form of a transcript: a speaker dictionary, then one
+    tab-separated row per turn in input order, prefixed by its 0-based index.
+
+        turns: 2
+        speakers: S0=Agent (Mohammed); S1=Customer; S2="Smith; John"
+        #	spk	start	end	emotion	text
+        0	S0	0:00	0:04	Polite	Hello, how can I help?
+        1	S1	0:03	0:09	Frustrated	I want to cancel
+
+    The row count is stated up front so the model can return exactly one
+    analysis per row.
+    """
+    speakers: Dict[str, str] = {}
+    for turn in conversation.conversation:
+        speakers.setdefault(turn.speaker, f"S{len(speakers)}")
+
+    columns = ["#", "spk", "start", "end", "emotion", "text"] if include_times else ["#", "spk", "emotion", "text"]
+    lines = [
+        f"turns: {len(conversation.conversation)}",
+        "speakers: " + "; ".join(f"{code}={_speaker(name)}" for name, code in speakers.items()),
+        "\t".join(columns),
+    ]
+    for i, turn in enumerate(conversation.conversation):
+        row = [str(i), speakers[turn.speaker]]
+        if include_times:
+            row += [_clock(turn.startTime), _clock(turn.endTime)]
+        row += [_cell(turn.emotion), _cell(turn.transcript)]
+        lines.append("\t".join(row))
+    return "\n".join(lines)
+
+
+def prompt_turn_count(prompt: str) -> int:
+    """Number of turns in an analysis prompt, in either the compact or the JSON encoding."""
+    if prompt.startswith("turns: "):
+        return int(prompt.split("\n", 1)[0][len("turns: "):])
+    return len(json.loads(prompt)["conversation"])
+
+
+def approx_tokens(text: str) -> int:
+    return len(_TOKEN_RE.findall(text))
@@ -0,0 +1,143 @@
+# conversation_metrics.py
+import os
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from models import AudioAnalysis, CallMetrics, EmotionBin, SpeakerMetrics
+from timeline import sweep_order
+
+# Gaps longer than this count as a "long silence" (dead air, hold).
+LONG_SILENCE_MS = int(os.getenv("LONG_SILENCE_MS", "5000"))
+# Width of the buckets in the emotion-over-time histogram.
+EMOTION_BIN_MS = int(os.getenv("EMOTION_BIN_MS", "60000"))
+
+
+def compute_metrics(conversation: AudioAnalysis, **kwargs) -> CallMetrics:
+    return compute_metrics_batch([conversation], **kwargs)[0]
+
+
+def compute_metrics_batch(
+    conversations: Sequence[AudioAnalysis],
+    long_silence_ms: int = LONG_SILENCE_MS,
+    emotion_bin_ms: int = EMOTION_BIN_MS,
+) -> List[CallMetrics]:
+    """
+    Talk time, silence, overlap/interruption and emotion statistics for many calls at once.
+
+    All turns of all calls are flattened into one set of arrays and every metric
+    is computed with grouped NumPy reductions keyed by call, so the cost per call
+    is a handful of array operations rather than a Python loop over its turns.
+    """
+    n_calls = len(conversations)
+    if n_calls == 0:
+        return []
+
+    # --- Flatten: one row per turn, with integer codes for call / speaker / emotion ---
+    speaker_codes: Dict[str, int] = {}
+    emotion_codes: Dict[str, int] = {}
+    counts = np.fromiter((len(c.conversation) for c in conversations), dtype=np.int64, count=n_calls)
+    n_turns = int(counts.sum())
+    start = np.empty(n_turns, dtype=np.int64)
+    end = np.empty(n_turns, dtype=np.int64)
+    speaker = np.empty(n_turns, dtype=np.int64)
+    emotion = np.empty(n_turns, dtype=np.int64)
+    k = 0
+    for conversation in conversations:
+        for turn in conversation.conversation:
+            start[k] = turn.startTime
+            end[k] = turn.endTime
+            speaker[k] = speaker_codes.setdefault(turn.speaker, len(speaker_codes))
+            emotion[k] = emotion_codes.setdefault(turn.emotion.strip().capitalize(), len(emotion_codes))
+            k += 1
+    call = np.repeat(np.arange(n_calls), counts)
+    n_speakers = max(len(speaker_codes), 1)
+    n_emotions = max(len(emotion_codes), 1)
+
+    # --- Sort turns chronologically within each call, with the running max end per call ---
+    order, floor_end = sweep_order(start, end, call)
+    start, end, speaker, emotion, call = start[order], end[order], speaker[order], emotion[order], call[order]
+    duration = end - start
+
+    # --- Transitions between consecutive turns of the same call ---
+    same_call = call[1:] == call[:-1]
+    prev_floor_end = floor_end[:-1]
+    gap = np.where(same_call, start[1:] - prev_floor_end, 0)
+    silence = np.clip(gap, 0, None)
+    overlap = np.where(same_call, np.clip(np.minimum(prev_floor_end, end[1:]) - start[1:], 0, None), 0)
+    interrupted = (overlap > 0) & (speaker[1:] != speaker[:-1])
+    transition_call = call[1:]
+
+    silence_ms = np.bincount(transition_call, weights=silence, minlength=n_calls)
+    longest_silence_ms = np.zeros(n_calls, dtype=np.int64)
+    np.maximum.at(longest_silence_ms, transition_call, silence)
+    long_silence_count = np.bincount(transition_call, weights=silence > long_silence_ms, minlength=n_calls)
+    overlap_ms = np.bincount(transition_call, weights=overlap, minlength=n_calls)
+    interruption_count = np.bincount(transition_call, weights=interrupted, minlength=n_calls)
+
+    # --- Per call x speaker ---
+    call_speaker = call * n_speakers + speaker
+    grid = n_calls * n_speakers
+    talk_ms = np.bincount(call_speaker, weights=duration, minlength=grid).reshape(n_calls, n_speakers)
+    turn_counts = np.bincount(call_speaker, minlength=grid).reshape(n_calls, n_speakers)
+    interruptions_by = np.bincount(
+        call_speaker[1:][interrupted], minlength=grid
+    ).reshape(n_calls, n_speakers)
+    total_talk_ms = talk_ms.sum(axis=1)
+
+    call_start = np.full(n_calls, np.iinfo(np.int64).max)
+    np.minimum.at(call_start, call, start)
+    call_end = np.zeros(n_calls, dtype=np.int64)
+    np.maximum.at(call_end, call, end)
+
+    # --- Emotion histogram over time (bucketed by turn start) ---
+    time_bin = start // emotion_bin_ms
+    n_bins = int(time_bin.max()) + 1 if n_turns else 0
+    emotion_key = (call * max(n_bins, 1) + time_bin) * n_emotions + emotion
+    keys, key_counts = np.unique(emotion_key, return_counts=True)
+    key_call, rest = np.divmod(keys, max(n_bins, 1) * n_emotions)
+    key_bin, key_emotion = np.divmod(rest, n_emotions)
+
+    # --- Assemble models (loops are over calls/speakers/bins, not turns) ---
+    speaker_names = list(speaker_codes)
+    emotion_names = list(emotion_codes)
+    bins_by_call: List[Dict[int, Dict[str, int]]] = [{} for _ in range(n_calls)]
+    for c, b, e, n in zip(key_call.tolist(), key_bin.tolist(), key_emotion.tolist(), key_counts.tolist()):
+        bins_by_call[c].setdefault(b, {})[emotion_names[e]] = n
+
+    results = []
+    for c in range(n_calls):
+        if counts[c] == 0:
+            results.append(CallMetrics(
+                duration_ms=0, turn_count=0, total_talk_ms=0, silence_ms=0, longest_silence_ms=0,
+                long_silence_count=0, overlap_ms=0, interruption_count=0, speakers=[], emotion_timeline=[],
+            ))
+            continue
+        total = float(total_talk_ms[c])
+        speakers = [
+            SpeakerMetrics(
+                speaker=speaker_names[s],
+                talk_time_ms=int(talk_ms[c, s]),
+                talk_ratio=float(talk_ms[c, s]) / total if total else 0.0,
+                turn_count=int(turn_counts[c, s]),
+                mean_turn_ms=float(talk_ms[c, s]) / turn_counts[c, s],
+                interruptions=int(interruptions_by[c, s]),
+            )
+            for s in np.flatnonzero(turn_counts[c]).tolist()
+        ]
+        results.append(CallMetrics(
+            duration_ms=int(call_end[c] - call_start[c]),
+            turn_count=int(counts[c]),
+            total_talk_ms=int(total),
+            silence_ms=int(silence_ms[c]),
+            longest_silence_ms=int(longest_silence_ms[c]),
+            long_silence_count=int(long_silence_count[c]),
+            overlap_ms=int(overlap_ms[c]),
+            interruption_count=int(interruption_count[c]),
+            speakers=speakers,
+            emotion_timeline=[
+                EmotionBin(start_ms=b * emotion_bin_ms, counts=emotions)
+                for b, emotions in sorted(bins_by_call[c].items())
+            ],
+        ))
+    return results
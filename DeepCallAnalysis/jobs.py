@@ -0,0 +1,261 @@
+# jobs.py
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from models import FullCallAnalysis, JobInfo, JobStatus
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", ".cache/jobs.sqlite3")
+# Uploaded job files are kept here until their job finishes, so a restart can resume them.
+JOBS_UPLOAD_DIR = os.getenv("JOBS_UPLOAD_DIR", ".cache/job_uploads")
+JOBS_MAX_CONCURRENCY = int(os.getenv("JOBS_MAX_CONCURRENCY", "4"))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+# A failed job waits this long before its first retry, doubling with each further attempt.
+JOBS_RETRY_DELAY_SECONDS = float(os.getenv("JOBS_RETRY_DELAY_SECONDS", "5"))
+# /jobs/paths only accepts files under this directory; unset disables path jobs.
+JOBS_INPUT_ROOT = os.getenv("JOBS_INPUT_ROOT", "")
+
+TERMINAL_STATUSES = {JobStatus.succeeded, JobStatus.failed}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    source_path TEXT NOT NULL,
+    media_type TEXT,
+    filename TEXT,
+    owns_source INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    error TEXT,
+    result_json TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+"""
+
+
+class JobSource:
+    """Where a job's audio lives. owns_source means the file is deleted once the job succeeds or finally fails."""
+
+    def __init__(self, path: str, media_type: Optional[str], filename: Optional[str] = None, owns_source: bool = False):
+        self.path = path
+        self.media_type = media_type
+        self.filename = filename or os.path.basename(path)
+        self.owns_source = owns_source
+
+
+class JobStore:
+    """SQLite-backed job table. Safe to share between the event loop and worker threads."""
+
+    def __init__(self, db_path: str = JOBS_DB_PATH):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    def create(self, sources: List[JobSource]) -> List[str]:
+        now = time.time()
+        rows = [
+            (uuid.uuid4().hex, JobStatus.queued.value, s.path, s.media_type, s.filename, int(s.owns_source), now, now)
+            for s in sources
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO jobs (job_id, status, source_path, media_type, filename, owns_source, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return [row[0] for row in rows]
+
+    def get(self, job_id: str, include_result: bool = True) -> Optional[JobInfo]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._to_info(row, include_result) if row else None
+
+    def list(self, status: Optional[JobStatus] = None, limit: int = 100) -> List[JobInfo]:
+        query = "SELECT * FROM jobs"
+        params: tuple = ()
+        if status is not None:
+            query += " WHERE status = ?"
+            params = (status.value,)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(query, params + (limit,)).fetchall()
+        return [self._to_info(row, include_result=False) for row in rows]
+
+    def source(self, job_id: str) -> JobSource:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT source_path, media_type, filename, owns_source FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return JobSource(row["source_path"], row["media_type"], row["filename"], bool(row["owns_source"]))
+
+    def queued_ids(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id FROM jobs WHERE status = ? ORDER BY created_at", (JobStatus.queued.value,)
+            ).fetchall()
+        return [row["job_id"] for row in rows]
+
+    def requeue_interrupted(self) -> int:
+        """Jobs left 'running' by a crash or restart go back to the queue."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?",
+                (JobStatus.queued.value, time.time(), JobStatus.running.value),
+            )
+        return cursor.rowcount
+
+    def mark_running(self, job_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE job_id = ?",
+                (JobStatus.running.value, time.time(), job_id),
+            )
+
+    def mark_succeeded(self, job_id: str, result: FullCallAnalysis) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result_json = ?, error = NULL, updated_at = ? WHERE job_id = ?",
+                (JobStatus.succeeded.value, result.model_dump_json(), time.time(), job_id),
+            )
+
+    def mark_failed(self, job_id: str, error: str, retry: bool) -> None:
+        status = JobStatus.queued if retry else JobStatus.failed
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                (status.value, error, time.time(), job_id),
+            )
+
+    @staticmethod
+    def _to_info(row: sqlite3.Row, include_result: bool) -> JobInfo:
+        result = None
+        if include_result and row["result_json"]:
+            result = FullCallAnalysis.model_validate_json(row["result_json"])
+        return JobInfo(
+            job_id=row["job_id"],
+            status=JobStatus(row["status"]),
+            filename=row["filename"],
+            attempts=row["attempts"],
+            created_at=row["created_at"],
+            updated_at=row["updated_at"],
+            error=row["error"],
+            result=result,
+        )
+
+
+class JobQueue:
+    """
+    Bounded pool of asyncio workers draining the job table.
+
+    The asyncio.Queue only holds job IDs; all state lives in SQLite, so start()
+    can rebuild the queue after a restart. Store calls run in worker threads so
+    a busy queue never blocks the event loop.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        process: Callable[[JobSource], Awaitable[FullCallAnalysis]],
+        max_concurrency: int = JOBS_MAX_CONCURRENCY,
+        max_attempts: int = JOBS_MAX_ATTEMPTS,
+        retry_delay: float = JOBS_RETRY_DELAY_SECONDS,
+    ):
+        self.store = store
+        self.process = process
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+        self._retries: Set[asyncio.TimerHandle] = set()
+
+    async def start(self) -> None:
+        resumed = await asyncio.to_thread(self.store.requeue_interrupted)
+        for job_id in await asyncio.to_thread(self.store.queued_ids):
+            self._queue.put_nowait(job_id)
+        logger.info(f"Job queue started: {self._queue.qsize()} queued ({resumed} resumed), {self.max_concurrency} workers")
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.max_concurrency)]
+
+    async def stop(self) -> None:
+        for handle in self._retries:
+            handle.cancel()  # still 'queued' in the store, so the next start() picks them up
+        self._retries.clear()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, sources: List[JobSource]) -> List[str]:
+        job_ids = await asyncio.to_thread(self.store.create, sources)
+        for job_id in job_ids:
+            self._queue.put_nowait(job_id)
+        return job_ids
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        source = await asyncio.to_thread(self.store.source, job_id)
+        await asyncio.to_thread(self.store.mark_running, job_id)
+        try:
+            result = await self.process(source)
+        except asyncio.CancelledError:
+            # Shutting down: leave the job 'running' so the next start() requeues it
+            raise
+        except Exception as e:
+            attempts = (await asyncio.to_thread(self.store.get, job_id, include_result=False)).attempts
+            retry = attempts < self.max_attempts
+            logger.error(f"Job {job_id} failed (attempt {attempts}/{self.max_attempts}): {type(e).__name__}: {e}")
+            await asyncio.to_thread(self.store.mark_failed, job_id, f"{type(e).__name__}: {e}", retry=retry)
+            if retry:
+                self._schedule_retry(job_id, self.retry_delay * 2 ** (attempts - 1))
+            else:
+                await asyncio.to_thread(self._remove_source, source)
+            return
+
+        # Writes the whole result JSON
+        await asyncio.to_thread(self.store.mark_succeeded, job_id, result)
+        logger.info(f"Job {job_id} succeeded ({source.filename})")
+        await asyncio.to_thread(self._remove_source, source)
+
+    def _schedule_retry(self, job_id: str, delay: float) -> None:
+        def requeue():
+            self._retries.discard(handle)
+            self._queue.put_nowait(job_id)
+
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._retries.add(handle)
+
+    @staticmethod
+    def _remove_source(source: JobSource) -> None:
+        """Spooled uploads are only needed while the job can still run."""
+        if source.owns_source:
+            try:
+                os.remove(source.path)
+            except FileNotFoundError:
+                pass
+
+
+def pending_statuses(store: JobStore, job_ids: List[str]) -> Tuple[List[JobInfo], bool]:
+    """Current status of job_ids (without results) and whether all of them have finished."""
+    infos = [info for info in (store.get(job_id, include_result=False) for job_id in job_ids) if info]
+    return infos, all(info.status in TERMINAL_STATUSES for info in infos)
@@ -1,15 +1,41 @@
 # main.py
 import os
-from fastapi import FastAPI, File, UploadFile, HTTPException
+import asyncio
+import json
+import math
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import AsyncIterator, List, Optional
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import ValidationError
 from pydantic_ai import Agent, BinaryContent
-from models import AudioAnalysis, CallAnalysis, OverallCallAnalysisResult 
+from pydantic_ai.exceptions import ModelAPIError, UnexpectedModelBehavior
+from models import AudioAnalysis, ConversationTurn, CallAnalysis, OverallCallAnalysisResult, FullCallAnalysis, JobInfo, JobPathsRequest, JobStatus, CallMetrics
+from models import AnalyticsPeriod, CategoryRate, StoredCall, TurnBreakdown, TurnCategory, TurnGroupBy, TurnSentiment
+from models import SearchField, SearchHit, SearchSort
+from transcription_cache import TranscriptionCache, prompt_version
+from audio_ingest import SpooledAudio, open_audio_path, spool_upload
+from audio_preprocessing import OffsetMap, preprocess_audio, preprocessing_tag
+from windowed_transcription import long_audio_duration, transcribe_windowed
+from compact_transcript import encode_conversation
+from turn_sharding import ShardCountMismatch, analyze_turns_sharded
+from conversation_metrics import compute_metrics, compute_metrics_batch
+from resilience import AgentResilience, CircuitBreaker, CircuitOpenError
+from observability import MetricsMiddleware, instrumented_run, metrics_response_body, track_agent_run
+from analytics_store import AnalyticsRecorder, AnalyticsStore, transcript_call_id
+from single_flight import SingleFlight
+from model_tiers import (
+    FAST_MODEL, PRO_MODEL, ModelTiers, overall_analysis_doubt, transcription_doubt, turn_analysis_doubt,
+)
+from turn_classifier import analyze_with_preclassifier
+from jobs import JOBS_INPUT_ROOT, JOBS_UPLOAD_DIR, JobQueue, JobSource, JobStore, pending_statuses
 import google.generativeai as genai
 from dotenv import load_dotenv
 import uvicorn
 import logging # Added for better error logging
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
 load_dotenv()
 
@@ -17,7 +43,20 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Resume any batch jobs left queued/running by a previous process
+    await job_queue.start()
+    await analytics_recorder.start()
+    yield
+    await job_queue.stop()
+    # Writes out whatever is still buffered
+    await analytics_recorder.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+# Per-endpoint latency / in-flight metrics, exposed on /metrics
+app.add_middleware(MetricsMiddleware)
 
 # Add CORS middleware if your Streamlit app runs on a different origin
 app.add_middleware(
@@ -31,10 +70,8 @@ app.add_middleware(
 # === Agent Configurations ===
 
 # --- Configure the Agent ---
-Transcritor_agent = Agent(
-    'google-gla:gemini-2.5-pro-exp-03-25', # Ensure this model supports audio input directly
-    output_type=AudioAnalysis,
-    system_prompt="""
+TRANSCRIBER_MODEL = 'google-gla:gemini-2.5-pro-exp-03-25' # Ensure this model supports audio input directly
+TRANSCRIBER_SYSTEM_PROMPT = """
         You are an advanced AI conversation analyzer specializing in call center interactions.
         Analyze the provided audio file thoroughly.
 
@@ -42,17 +79,36 @@ Transcritor_agent = Agent(
         1.  **Transcription:** Provide a full transcript of the conversation.
         2.  **Speaker Identification:** Identify and label each speaker. Use "Agent" and "Customer". If a name is clearly mentioned (e.g., "My name is Mohammed"), include it in parentheses like "Agent (Mohammed)" or "Customer (Sarah)". If no name is mentioned, just use "Agent" or "Customer".
         3.  **Timestamps:** For each distinct utterance or sentence, provide the start and end time in HH:MM:SS format relative to the beginning of the audio. Ensure `startTime` and `endTime` are accurate for each segment.
-        4.  **Emotion Detection:** For each utterance, determine the primary emotion conveyed (e.g., Neutral, Happy, Sad, Angry, Frustrated, Confused, Polite, Empathetic).""",
+        4.  **Emotion Detection:** For each utterance, determine the primary emotion conveyed (e.g., Neutral, Happy, Sad, Angry, Frustrated, Confused, Polite, Empathetic)."""
+
+Transcritor_agent = Agent(
+    TRANSCRIBER_MODEL,
+    output_type=AudioAnalysis,
+    system_prompt=TRANSCRIBER_SYSTEM_PROMPT,
     name='Call_Transcritor',
     # Consider adding error handling/retry logic if needed via pydantic-ai config
 )
 
+# --- Transcription Cache ---
+# Identical recordings (re-uploads, QA reviews, client retries) are served from
+# here instead of going back to the model.
+transcription_cache = TranscriptionCache(
+    cache_dir=os.getenv("TRANSCRIPTION_CACHE_DIR", ".cache/transcriptions"),
+    max_entries=int(os.getenv("TRANSCRIPTION_CACHE_SIZE", "256")),
+)
+TRANSCRIBER_PROMPT_VERSION = prompt_version(TRANSCRIBER_SYSTEM_PROMPT)
+# How often partial structured output is re-validated while streaming.
+TRANSCRIBE_STREAM_DEBOUNCE_SECONDS = float(os.getenv("TRANSCRIBE_STREAM_DEBOUNCE_SECONDS", "0.1"))
+
 # --- Configure the Agent ---
 call_analyzer_agent = Agent(
     model='google-gla:gemini-2.5-pro-exp-03-25',
     output_type=CallAnalysis,
     system_prompt=(
         "You are an expert conversation analyst. Your task is to analyze each turn in a customer service call.\n\n"
+        "**Input Format:**\n"
+        "The turns are given as a compact table: a `turns: N` line, a `speakers:` line mapping codes (S0, S1, ...) "
+        "to speaker names, then a tab-separated header and one row per turn (index, speaker code, emotion, text).\n\n"
         "For each conversation turn, return the following fields:\n"
         "1. category: One of the following - 'PII Stated', 'Product Issues', 'Complaint', 'Churn Indicators', 'Suggestion', or 'None'\n"
         "2. sentiment: One of - 'Positive', 'Negative', or 'Neutral'\n"
@@ -60,7 +116,7 @@ call_analyzer_agent = Agent(
         "**Output Format:**\n"
         "Respond with a single JSON object in the following format:\n\n"
         "{\n"
-        "  \"conversation\": [\n"
+        "  \"conversation_analysis\": [\n"
         "    {\n"
         "      \"category\": \"...\",\n"
         "      \"sentiment\": \"...\",\n"
@@ -69,6 +125,7 @@ call_analyzer_agent = Agent(
         "    ...\n"
         "  ]\n"
         "}\n\n"
+        "Return exactly N items, in row order: item i analyses the row with index i.\n"
         "Only output valid JSON. Do not include any explanations or commentary. Do not include markdown."
     ),
     name='Call_Analyzer'
@@ -79,7 +136,7 @@ overallcall_analyzer_agent = Agent(
     'google-gla:gemini-2.5-pro-exp-03-25',
     output_type=OverallCallAnalysisResult,
     instructions=[
-        "Based *only* on the provided transcript data (input is a JSON object conforming to the AudioAnalysis schema), extract the following information and structure your response according to the OverallCallAnalysisResult schema:",
+        "Based *only* on the provided transcript data (input is a compact table: a `speakers:` line mapping codes like S0 to speaker names, then one tab-separated row per turn with index, speaker code, start, end, emotion and text), extract the following information and structure your response according to the OverallCallAnalysisResult schema:",
         "1.Summarization: Provide a concise summary of the entire call, focusing on the main reason, key points, decisions, and outcome.",
         "2.Call Purpose: State the primary reason for the call (e.g., Inquire about billing discrepancy, Request password reset).",
         "3.Topics & Keywords: List the main topics discussed and significant keywords (e.g., 'billing', 'invoice #12345', 'password reset').",
@@ -90,6 +147,293 @@ overallcall_analyzer_agent = Agent(
     name='Overall_Call_Analyzer',
 )
 
+# --- Resilience ---
+# All three agents call the same provider, so they share one circuit breaker.
+# Deadlines, retries and hedging are set per agent. Audio requests are
+# expensive, so the transcriber is never hedged.
+provider_breaker = CircuitBreaker("gemini")
+transcriber_resilience = AgentResilience.from_env(
+    "Call_Transcritor", "TRANSCRIBER", provider_breaker, timeout_seconds=300, max_attempts=2, hedge=False,
+)
+turn_analyzer_resilience = AgentResilience.from_env(
+    "Call_Analyzer", "TURN_ANALYZER", provider_breaker, timeout_seconds=120, max_attempts=3, hedge=True,
+)
+overall_analyzer_resilience = AgentResilience.from_env(
+    "Overall_Call_Analyzer", "OVERALL_ANALYZER", provider_breaker, timeout_seconds=120, max_attempts=3, hedge=True,
+)
+# Transient provider errors are already retried by the policies above; the
+# shard / window loops only re-run outputs that were bad.
+BAD_OUTPUT_ERRORS = (UnexpectedModelBehavior, ValidationError)
+
+# --- Model Tiers ---
+# Each agent runs on the cheapest configured model first and escalates to the
+# next tier on bad output or a doubtful answer (model_tiers.py). The analyzers
+# start on the fast model; the transcriber defaults to the pro model only.
+transcriber_tiers = ModelTiers.from_env(
+    "Call_Transcritor", "TRANSCRIBER", [TRANSCRIBER_MODEL], escalate_on=BAD_OUTPUT_ERRORS,
+)
+turn_analyzer_tiers = ModelTiers.from_env(
+    "Call_Analyzer", "TURN_ANALYZER", [FAST_MODEL, PRO_MODEL], escalate_on=BAD_OUTPUT_ERRORS,
+)
+overall_analyzer_tiers = ModelTiers.from_env(
+    "Overall_Call_Analyzer", "OVERALL_ANALYZER", [FAST_MODEL, PRO_MODEL], escalate_on=BAD_OUTPUT_ERRORS,
+)
+
+# --- Request Coalescing ---
+# Identical requests that arrive together (a Streamlit rerun, two reviewers
+# opening the same call) share one model call: transcriptions are keyed by the
+# transcription cache key (audio hash), analyses by the transcript hash.
+transcription_flight = SingleFlight("transcribe")
+turn_analysis_flight = SingleFlight("analyze_turns")
+overall_analysis_flight = SingleFlight("analyze_call")
+
+
+def agent_http_error(e: Exception, action: str) -> Optional[HTTPException]:
+    """
+    Maps a provider failure to a response: 503 while the circuit is open, 504 on
+    a missed deadline, 502 for other provider errors. Returns None for anything
+    else so the caller can report its own 500.
+    """
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, CircuitOpenError):
+        return HTTPException(
+            status_code=503,
+            detail=f"{action}: model provider unavailable, retry later",
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+    if isinstance(e, asyncio.TimeoutError):
+        return HTTPException(status_code=504, detail=f"{action}: model did not respond in time")
+    if isinstance(e, ModelAPIError):
+        return HTTPException(status_code=502, detail=f"{action}: model provider error ({type(e).__name__})")
+    return None
+
+
+# --- Analysis Prompt Encoding ---
+# "compact": speaker dictionary + one tab-separated row per turn (compact_transcript).
+# "json": the full AudioAnalysis JSON, which repeats every key on every turn.
+ANALYSIS_PROMPT_FORMAT = os.getenv("ANALYSIS_PROMPT_FORMAT", "compact")
+
+
+def analysis_prompt(conversation: AudioAnalysis, include_times: bool = True) -> str:
+    if ANALYSIS_PROMPT_FORMAT == "json":
+        return conversation.model_dump_json()
+    return encode_conversation(conversation, include_times=include_times)
+
+
+# === Agent Runners ===
+# Shared by the single-step endpoints and /analyze-full so every path calls the
+# agents the same way.
+
+def transcription_cache_key(audio: SpooledAudio) -> str:
+    return TranscriptionCache.make_key(
+        audio.digest, transcriber_tiers.cache_tag, TRANSCRIBER_PROMPT_VERSION, preprocessing_tag(),
+    )
+
+
+def is_long_call(audio: SpooledAudio) -> bool:
+    """
+    Windowed or single-request transcription, decided on the original upload's
+    duration so the streaming and non-streaming paths always agree.
+    """
+    return long_audio_duration(audio.path, audio.media_type) is not None
+
+
+async def run_transcription(audio: SpooledAudio) -> AudioAnalysis:
+    """
+    Runs Transcritor_agent on a spooled upload and returns the validated AudioAnalysis.
+    Results are cached by audio hash + model + prompt version.
+    """
+    cache_key = transcription_cache_key(audio)
+    cached = transcription_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"Transcription cache hit ({cache_key[:12]})")
+        analytics_recorder.record(cached, audio_digest=audio.digest, filename=audio.filename)
+        return cached
+
+    async def transcribe() -> AudioAnalysis:
+        # Mono / 16 kHz / silence-collapsed copy for the model (None = send the upload as-is)
+        prepared = await asyncio.to_thread(preprocess_audio, audio.path, audio.media_type)
+        try:
+            if is_long_call(audio):
+                # Long call: transcribe overlapping windows concurrently and stitch them
+                path = prepared.wav_path if prepared else audio.path
+                duration = prepared.duration if prepared else long_audio_duration(audio.path, audio.media_type)
+                transcription = await transcribe_windowed(
+                    path, duration, transcribe_audio_bytes, retry_errors=BAD_OUTPUT_ERRORS,
+                )
+            elif prepared is not None:
+                audio_bytes, encoded_type = await asyncio.to_thread(prepared.encode)
+                transcription = await transcribe_audio_bytes(audio_bytes, encoded_type)
+            else:
+                # The audio is only loaded into memory here, on a cache miss, right before the model call
+                transcription = await transcribe_audio_bytes(audio.read_bytes(), audio.media_type)
+            if prepared is not None:
+                # Back onto the timeline of the original recording
+                transcription = prepared.offset_map.remap(transcription)
+        finally:
+            if prepared is not None:
+                prepared.close()
+        await asyncio.to_thread(transcription_cache.put, cache_key, transcription)
+        return transcription
+
+    transcription = await transcription_flight.do(cache_key, transcribe)
+    analytics_recorder.record(transcription, audio_digest=audio.digest, filename=audio.filename)
+    return transcription
+
+
+async def transcribe_audio_bytes(audio_bytes: bytes, media_type: str = "audio/wav") -> AudioAnalysis:
+    """Transcritor_agent call on an in-memory clip (a whole file or one window), escalating through the tiers."""
+    async def on_model(model: str) -> AudioAnalysis:
+        result = await transcriber_resilience.call(lambda: instrumented_run(Transcritor_agent, [
+            BinaryContent(data=audio_bytes, media_type=media_type)
+        ], model=model))
+        return result.output
+
+    return await transcriber_tiers.run(on_model, transcription_doubt)
+
+
+async def stream_transcription_turns(audio: SpooledAudio) -> AsyncIterator[ConversationTurn]:
+    """
+    Yields validated ConversationTurns as soon as the model has finished each one.
+
+    Uses the agent's partial structured output: while streaming, every turn
+    except the last one in the partial AudioAnalysis is complete (the model is
+    still writing the last one). Cache hits and long (windowed) calls are
+    yielded in one go. The stream leads the transcription single flight, so a
+    concurrent request for the same audio waits for it instead of calling the model.
+    """
+    cache_key = transcription_cache_key(audio)
+    cached = transcription_cache.get(cache_key)
+    if cached is None and (
+        transcription_flight.in_flight(cache_key) or is_long_call(audio)
+    ):
+        # Same audio already being transcribed by another request, or a long call: wait for the whole result
+        cached = await run_transcription(audio)
+    if cached is not None:
+        for turn in cached.conversation:
+            yield turn
+        return
+
+    async def model_stream() -> AsyncIterator[ConversationTurn]:
+        prepared = await asyncio.to_thread(preprocess_audio, audio.path, audio.media_type)
+        if prepared is not None:
+            with prepared:
+                audio_bytes, media_type = await asyncio.to_thread(prepared.encode)
+            offset_map = prepared.offset_map
+        else:
+            audio_bytes, media_type = audio.read_bytes(), audio.media_type
+            offset_map = OffsetMap.identity()
+
+        emitted = 0
+        async with track_agent_run(Transcritor_agent) as recorder:
+            # Turns are sent as they arrive, so there is no escalating afterwards: use the strongest tier
+            async with Transcritor_agent.run_stream([
+                BinaryContent(data=audio_bytes, media_type=media_type)
+            ], model=transcriber_tiers.strongest) as result:
+                async for partial in result.stream_output(debounce_by=TRANSCRIBE_STREAM_DEBOUNCE_SECONDS):
+                    turns = partial.conversation
+                    while emitted < len(turns) - 1:
+                        yield offset_map.remap_turn(turns[emitted])
+                        emitted += 1
+                transcription = offset_map.remap(await result.get_output())
+                recorder.record_result(result)
+
+        for turn in transcription.conversation[emitted:]:
+            yield turn
+        await asyncio.to_thread(transcription_cache.put, cache_key, transcription)
+        publish(transcription)
+
+    with transcription_flight.leading(cache_key) as publish:
+        # Deadline + circuit breaker only: turns already sent cannot be retried
+        async for turn in transcriber_resilience.stream(model_stream):
+            yield turn
+
+
+async def analyze_turn_shard(shard: AudioAnalysis) -> CallAnalysis:
+    """Single call_analyzer_agent call on one shard of turns."""
+    # Category / sentiment / translation do not depend on timestamps, so they are left out
+    shard_prompt = analysis_prompt(shard, include_times=False)
+    logger.debug(f"Passing shard ({ANALYSIS_PROMPT_FORMAT}) to call_analyzer_agent: {shard_prompt[:500]}...")
+
+    async def attempt(model: str) -> CallAnalysis:
+        async with track_agent_run(call_analyzer_agent) as recorder:
+            agent_result = await call_analyzer_agent.run(shard_prompt, model=model)
+            recorder.record_result(agent_result)
+            if len(agent_result.output.conversation_analysis) != len(shard.conversation):
+                # Valid JSON but misaligned with the input; turn_sharding retries the shard
+                recorder.record_validation_failure()
+        return agent_result.output
+
+    return await turn_analyzer_tiers.run(
+        lambda model: turn_analyzer_resilience.call(lambda: attempt(model)),
+        lambda output: turn_analysis_doubt(output, shard),
+    )
+
+
+async def run_turn_analysis(conversation: AudioAnalysis) -> CallAnalysis:
+    """
+    Classifies obvious turns locally (turn_classifier) and runs
+    call_analyzer_agent over the rest. Long calls are split into shards that
+    run concurrently; everything is merged back in turn order.
+    """
+    try:
+        turn_analysis = await turn_analysis_flight.do(transcript_call_id(conversation), lambda: analyze_with_preclassifier(
+            conversation,
+            lambda remaining: analyze_turns_sharded(remaining, analyze_turn_shard, retry_errors=BAD_OUTPUT_ERRORS),
+        ))
+        analytics_recorder.record(conversation, analysis=turn_analysis)
+        return turn_analysis
+    except Exception as e:
+        # Log the exception type and message clearly
+        logger.error(f"{type(e).__name__} during turn analysis: {e}", exc_info=True)
+        http_error = agent_http_error(e, "Error analyzing conversation turns")
+        if http_error is not None:
+            raise http_error
+
+        # Specific check for the TypeError
+        if isinstance(e, TypeError) and "BaseModel.__init__()" in str(e):
+             detail_msg = "Internal Error: Failed to parse LLM response into expected structure (BaseModel init error)."
+        elif isinstance(e, ShardCountMismatch):
+             detail_msg = "Internal Error: Turn analysis did not return one result per conversation turn."
+        else:
+             detail_msg = f"Error analyzing conversation turns: {type(e).__name__}"
+
+        raise HTTPException(status_code=500, detail=detail_msg)
+
+
+async def run_overall_analysis(conversation: AudioAnalysis) -> OverallCallAnalysisResult:
+    """Runs overallcall_analyzer_agent over the whole conversation."""
+    agent_result = None
+    try:
+        conversation_prompt = analysis_prompt(conversation)
+        logger.debug(f"Passing transcript ({ANALYSIS_PROMPT_FORMAT}) to overallcall_analyzer_agent: {conversation_prompt[:500]}...")
+        agent_result = await overall_analysis_flight.do(transcript_call_id(conversation), lambda: overall_analyzer_tiers.run(
+            lambda model: overall_analyzer_resilience.call(
+                lambda: instrumented_run(overallcall_analyzer_agent, conversation_prompt, model=model)
+            ),
+            lambda result: overall_analysis_doubt(result.output, conversation),
+        ))
+        logger.info("Overall call analysis successful and output validated.")
+        analytics_recorder.record(conversation, overall=agent_result.output)
+        return agent_result.output
+    except Exception as e:
+        logger.error(f"{type(e).__name__} during overall call analysis: {e}", exc_info=True)
+        if agent_result:
+             raw_output = getattr(agent_result, 'raw_output', str(agent_result))
+             logger.error(f"Raw overall agent output during error: {raw_output[:1000]}...")
+        http_error = agent_http_error(e, "Error generating overall call analysis")
+        if http_error is not None:
+            raise http_error
+
+        if isinstance(e, TypeError) and "BaseModel.__init__()" in str(e):
+             detail_msg = "Internal Error: Failed to parse LLM response into expected structure (BaseModel init error)."
+        else:
+             detail_msg = f"Error generating overall call analysis: {type(e).__name__}"
+
+        raise HTTPException(status_code=500, detail=detail_msg)
+
+
 # === API Endpoints ===
 
 @app.post("/transcribe")
@@ -105,25 +449,22 @@ async def transcribe_audio(file: UploadFile = File(...)):
         logger.warning(f"Received non-audio file type: {file.content_type}")
 
     try:
-        # --- Read File Content ---
-        audio_bytes = await file.read()
-        if not audio_bytes:
-             raise HTTPException(status_code=400, detail="Uploaded file is empty.")
-
-        logger.info(f"Read {len(audio_bytes)} bytes from {file.filename}")
-
-        # --- Call Agent ---
-        # Use await agent.run() for async endpoint
-        # Pass the correct media_type from the upload
-        result: AudioAnalysis = await Transcritor_agent.run([
-            BinaryContent(data=audio_bytes, media_type=file.content_type)
-        ])
+        # --- Spool File Content ---
+        # Streamed to disk in chunks (size-limited) instead of one big read()
+        with await spool_upload(file) as audio:
+            # --- Call Agent ---
+            transcription = await run_transcription(audio)
         logger.info(f"Transcription successful for {file.filename}")
-        return result.output.model_dump()
-
+        return transcription.model_dump()
 
+    except HTTPException:
+        # Upload validation errors (empty / too large) go back to the client as-is
+        raise
     except Exception as e:
         logger.error(f"Error during transcription for {file.filename}: {e}", exc_info=True)
+        raise agent_http_error(e, "Error transcribing audio") or HTTPException(
+            status_code=500, detail=f"Error transcribing audio: {type(e).__name__}"
+        )
     finally:
         # Ensure the file handle is closed
         await file.close()
@@ -132,6 +473,69 @@ async def transcribe_audio(file: UploadFile = File(...)):
 
 
 
+@app.post("/transcribe-stream")
+async def transcribe_stream(file: UploadFile = File(...), analyze: bool = False):
+    """
+    Streaming variant of /transcribe. Returns NDJSON events as they happen:
+    {"type": "turn", "index": i, "turn": {...}} for each ConversationTurn, then
+    {"type": "transcription", ...} with the full AudioAnalysis. With analyze=true
+    the turn and overall analyses then run concurrently and are emitted as
+    "turn_analysis" / "overall_analysis" events, so one request covers the whole
+    pipeline. Failures are reported as {"type": "error", "detail": ...}.
+    """
+    logger.info(f"Received file for streaming transcription: {file.filename}, Content-Type: {file.content_type}")
+    # Spool before streaming starts: the upload is closed once this handler returns
+    try:
+        audio = await spool_upload(file)
+    finally:
+        await file.close()
+
+    async def events():
+        turns = []
+        try:
+            async for turn in stream_transcription_turns(audio):
+                yield ndjson_event("turn", index=len(turns), turn=turn.model_dump())
+                turns.append(turn)
+            transcription = AudioAnalysis(conversation=turns)
+            logger.info(f"Streamed {len(turns)} turns for {audio.filename}")
+            analytics_recorder.record(transcription, audio_digest=audio.digest, filename=audio.filename)
+            yield ndjson_event("transcription", **transcription.model_dump())
+
+            if analyze:
+                async def labelled(event_type, coro):
+                    return event_type, await coro
+
+                pending = [
+                    asyncio.ensure_future(labelled("turn_analysis", run_turn_analysis(transcription))),
+                    asyncio.ensure_future(labelled("overall_analysis", run_overall_analysis(transcription))),
+                ]
+                try:
+                    # Emit whichever analysis finishes first
+                    for done in asyncio.as_completed(pending):
+                        event_type, output = await done
+                        yield ndjson_event(event_type, **output.model_dump())
+                finally:
+                    for task in pending:
+                        task.cancel()
+        except HTTPException as e:
+            yield ndjson_event("error", detail=e.detail, status=e.status_code)
+        except Exception as e:
+            logger.error(f"{type(e).__name__} during streaming transcription for {audio.filename}: {e}", exc_info=True)
+            http_error = agent_http_error(e, "Error transcribing audio")
+            if http_error is not None:
+                yield ndjson_event("error", detail=http_error.detail, status=http_error.status_code)
+            else:
+                yield ndjson_event("error", detail=f"Error transcribing audio: {type(e).__name__}")
+        finally:
+            audio.close()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+def ndjson_event(event_type: str, **payload) -> str:
+    return json.dumps({"type": event_type, **payload}) + "\n"
+
+
 @app.post("/analyze-turns")
 async def analyze_turns(conversation: AudioAnalysis): # FastAPI validates input into AudioAnalysis object
     """
@@ -139,67 +543,268 @@ async def analyze_turns(conversation: AudioAnalysis): # FastAPI validates input
     Expects input conforming to the AudioAnalysis model.
     """
     logger.info(f"Received conversation object for turn analysis with {len(conversation.conversation)} turns.")
-    agent_result = None # Initialize agent_result
-    try:
-        # --- FIX: Convert Pydantic object to a JSON-compatible dictionary ---
-        # Using mode='json' ensures complex types are pre-serialized correctly
-        conversation_dict = conversation.model_dump_json()
-        logger.debug(f"Passing dictionary (mode='json') to call_analyzer_agent: {str(conversation_dict)[:500]}...")
+    turn_analysis = await run_turn_analysis(conversation)
+    return turn_analysis.model_dump() # Return the validated Pydantic model
+
+
+@app.post("/analyze-call")
+async def analyze_overall(conversation: AudioAnalysis): # FastAPI validates input
+    """
+    Generates an overall analysis of the call (summary, purpose, etc.).
+    Expects input conforming to the AudioAnalysis model.
+    """
+    logger.info(f"Received conversation object for overall analysis with {len(conversation.conversation)} turns.")
+    overall_analysis = await run_overall_analysis(conversation)
+    return overall_analysis.model_dump()
 
-        # Pass the dictionary to the agent
-        agent_result = await call_analyzer_agent.run(conversation_dict) # agent_result holds the structured output or raw data if parsing failed
 
-        return agent_result.output.model_dump() # Return the validated Pydantic model
+@app.post("/analyze-full")
+async def analyze_full(file: UploadFile = File(...)):
+    """
+    Transcribes the audio once, then runs the turn analysis and the overall
+    analysis concurrently on the same transcript. Returns a FullCallAnalysis,
+    replacing the /transcribe -> /analyze-call -> /analyze-turns round trips.
+    """
+    logger.info(f"Received file for full analysis: {file.filename}, Content-Type: {file.content_type}")
+
+    if not file.content_type or not file.content_type.startswith("audio/"):
+        logger.warning(f"Received non-audio file type: {file.content_type}")
 
+    try:
+        with await spool_upload(file) as audio:
+            full_analysis = await run_full_analysis(audio)
+        return full_analysis.model_dump()
+    finally:
+        await file.close()
+        logger.debug(f"Closed file handle for {file.filename}")
+
+
+async def run_full_analysis(audio: SpooledAudio) -> FullCallAnalysis:
+    """Transcription followed by concurrent turn + overall analysis."""
+    # --- Step 1: Transcription ---
+    try:
+        transcription = await run_transcription(audio)
     except Exception as e:
-        # Log the exception type and message clearly
-        logger.error(f"{type(e).__name__} during turn analysis: {e}", exc_info=True)
+        logger.error(f"{type(e).__name__} during transcription for {audio.filename}: {e}", exc_info=True)
+        raise agent_http_error(e, "Error transcribing audio") or HTTPException(
+            status_code=500, detail=f"Error transcribing audio: {type(e).__name__}"
+        )
+    logger.info(f"Transcription successful for {audio.filename} ({len(transcription.conversation)} turns)")
+
+    # --- Step 2: Turn + Overall Analysis, concurrently ---
+    # Both agents only need the transcript, so there is no reason to wait
+    # for one before starting the other.
+    turn_analysis, overall_analysis = await asyncio.gather(
+        run_turn_analysis(transcription),
+        run_overall_analysis(transcription),
+    )
+
+    return FullCallAnalysis(
+        transcription=transcription,
+        turn_analysis=turn_analysis,
+        overall_analysis=overall_analysis,
+    )
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus scrape endpoint: request/agent latency, upload sizes, token usage, validation failures."""
+    body, content_type = metrics_response_body()
+    return Response(content=body, media_type=content_type)
+
+
+@app.post("/call-metrics", response_model=CallMetrics)
+async def call_metrics(conversation: AudioAnalysis):
+    """
+    Talk time per speaker, silence, overlaps/interruptions and an emotion
+    histogram over time, computed locally from the transcript (no model call).
+    """
+    return compute_metrics(conversation)
 
-        # Try to log raw agent output if available and exception occurred after agent call
-        if agent_result:
-             raw_output = getattr(agent_result, 'raw_output', str(agent_result)) # Attempt to get raw output
-             logger.error(f"Raw agent output during error: {raw_output[:1000]}...") # Log snippet
 
-        # Specific check for the TypeError
-        if isinstance(e, TypeError) and "BaseModel.__init__()" in str(e):
-             detail_msg = "Internal Error: Failed to parse LLM response into expected structure (BaseModel init error)."
-        else:
-             detail_msg = f"Error analyzing conversation turns: {type(e).__name__}"
+@app.post("/call-metrics/batch", response_model=List[CallMetrics])
+async def call_metrics_batch(conversations: List[AudioAnalysis]):
+    """Same as /call-metrics for many stored transcripts in one vectorized pass."""
+    return compute_metrics_batch(conversations)
 
-        raise HTTPException(status_code=500, detail=detail_msg)
 
+# === Analytics ===
+# Every transcript and analysis result is written (in bulk, in the background)
+# to an SQLite store, so reports across many calls need no model calls.
 
-@app.post("/analyze-call")
-async def analyze_overall(conversation: AudioAnalysis): # FastAPI validates input
+analytics_store = AnalyticsStore()
+analytics_recorder = AnalyticsRecorder(analytics_store)
+
+
+@app.get("/analytics/category-rate", response_model=List[CategoryRate])
+async def analytics_category_rate(
+    category: TurnCategory = TurnCategory.churn,
+    period: AnalyticsPeriod = AnalyticsPeriod.week,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+):
     """
-    Generates an overall analysis of the call (summary, purpose, etc.).
-    Expects input conforming to the AudioAnalysis model.
+    Share of analysed calls with at least one turn in `category` (default:
+    churn indicators) per day / week / month, for calls stored in [since, until).
+    """
+    return analytics_store.category_rate(category, period, since=since, until=until)
+
+
+@app.get("/analytics/turns", response_model=List[TurnBreakdown])
+async def analytics_turns(
+    group_by: TurnGroupBy = TurnGroupBy.category,
+    period: Optional[AnalyticsPeriod] = None,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    speaker: Optional[str] = None,
+    category: Optional[TurnCategory] = None,
+    sentiment: Optional[TurnSentiment] = None,
+):
+    """Analysed turn counts by category, sentiment, speaker role or emotion, optionally per period and filtered."""
+    return analytics_store.turn_breakdown(
+        group_by, period, since=since, until=until,
+        speaker=speaker, category=category, sentiment=sentiment,
+    )
+
+
+@app.get("/analytics/calls", response_model=List[StoredCall])
+async def analytics_calls(
+    category: Optional[TurnCategory] = None,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    limit: int = 100,
+):
+    """Stored calls, newest first, optionally only those with a turn in `category`."""
+    return analytics_store.list_calls(category, since=since, until=until, limit=limit)
+
+
+@app.get("/search", response_model=List[SearchHit])
+async def search_calls(
+    q: str,
+    fields: List[SearchField] = Query(default=list(SearchField)),
+    speaker: Optional[str] = None,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    limit: int = Query(default=50, ge=1, le=500),
+    offset: int = Query(default=0, ge=0),
+    sort: SearchSort = SearchSort.relevance,
+):
+    """
+    Full-text search over stored transcripts, translations and topic keywords.
+    `q` takes words, "exact phrases", AND / OR / NOT, parentheses and prefix*
+    terms, e.g. `"cancel my subscription" OR (switch AND competitor*)`.
+    `speaker` (Agent / Customer) restricts turn hits and skips keyword hits.
+    `sort=recent` lists the newest calls first, which is faster for very broad queries.
     """
-    logger.info(f"Received conversation object for overall analysis with {len(conversation.conversation)} turns.")
-    agent_result = None
     try:
-        # Convert Pydantic object to a JSON-compatible dictionary
-        conversation_dict = conversation.model_dump_json()
-        logger.debug(f"Passing dictionary (mode='json') to overallcall_analyzer_agent: {str(conversation_dict)[:500]}...")
+        return analytics_store.search(
+            q, fields, speaker=speaker, since=since, until=until, limit=limit, offset=offset, sort=sort
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Pass the dictionary to the agent
-        agent_result = await overallcall_analyzer_agent.run(conversation_dict)
 
-        logger.info("Overall call analysis successful and output validated.")
-        return agent_result.output.model_dump()
+# === Batch Jobs ===
+# Bulk submissions are queued in SQLite and drained by a bounded worker pool,
+# so clients submit once and poll/stream status instead of holding a request
+# open for each call.
 
-    except Exception as e:
-        logger.error(f"{type(e).__name__} during overall call analysis: {e}", exc_info=True)
-        if agent_result:
-             raw_output = getattr(agent_result, 'raw_output', str(agent_result))
-             logger.error(f"Raw overall agent output during error: {raw_output[:1000]}...")
+async def process_job(source: JobSource) -> FullCallAnalysis:
+    audio = await asyncio.to_thread(open_audio_path, source.path, source.media_type)
+    return await run_full_analysis(audio)
+
+job_store = JobStore()
+job_queue = JobQueue(job_store, process_job)
+
+
+@app.post("/jobs", response_model=List[str])
+async def submit_jobs(files: List[UploadFile] = File(...)):
+    """
+    Queues one full-analysis job per uploaded file and returns the job IDs.
+    Uploads are kept on disk until their job succeeds.
+    """
+    os.makedirs(JOBS_UPLOAD_DIR, exist_ok=True)
+    sources = []
+    try:
+        for file in files:
+            audio = await spool_upload(file, spool_dir=JOBS_UPLOAD_DIR)
+            sources.append(JobSource(audio.path, audio.media_type, audio.filename, owns_source=True))
+    except Exception:
+        # Nothing was queued yet: drop the files spooled so far
+        for source in sources:
+            os.remove(source.path)
+        raise
+    finally:
+        for file in files:
+            await file.close()
+
+    job_ids = await job_queue.submit(sources)
+    logger.info(f"Queued {len(job_ids)} uploaded jobs")
+    return job_ids
+
+
+@app.post("/jobs/paths", response_model=List[str])
+async def submit_job_paths(request: JobPathsRequest):
+    """
+    Queues one full-analysis job per server-side file path (e.g. a nightly
+    recordings directory). The files are read in place and never deleted.
+    Only files under JOBS_INPUT_ROOT are accepted.
+    """
+    if not JOBS_INPUT_ROOT:
+        raise HTTPException(status_code=400, detail="Path jobs are disabled; set JOBS_INPUT_ROOT to enable them")
+    root = os.path.realpath(JOBS_INPUT_ROOT)
+    resolved = [os.path.realpath(path) for path in request.paths]
+    outside = [path for path, real in zip(request.paths, resolved) if os.path.commonpath([root, real]) != root]
+    if outside:
+        raise HTTPException(status_code=400, detail=f"Paths outside JOBS_INPUT_ROOT: {outside[:10]}")
+    missing = [path for path, real in zip(request.paths, resolved) if not os.path.isfile(real)]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Files not found: {missing[:10]}")
+
+    job_ids = await job_queue.submit([JobSource(path, media_type=None) for path in resolved])
+    logger.info(f"Queued {len(job_ids)} path jobs")
+    return job_ids
+
+
+@app.get("/jobs", response_model=List[JobInfo])
+async def list_jobs(status: Optional[JobStatus] = None, limit: int = 100):
+    """Most recent jobs first, without results."""
+    return await asyncio.to_thread(job_store.list, status=status, limit=limit)
+
+
+@app.get("/jobs/events")
+async def stream_job_events(ids: str, poll_seconds: float = 1.0):
+    """
+    Streams NDJSON status updates for a comma-separated list of job IDs.
+    A line is emitted whenever a job changes, and the stream ends once every job has finished.
+    """
+    job_ids = [job_id for job_id in ids.split(",") if job_id]
+
+    async def events():
+        last_seen = {}
+        while True:
+            infos, done = await asyncio.to_thread(pending_statuses, job_store, job_ids)
+            for info in infos:
+                state = (info.status, info.attempts, info.updated_at)
+                if last_seen.get(info.job_id) != state:
+                    last_seen[info.job_id] = state
+                    yield info.model_dump_json() + "\n"
+            if done:
+                return
+            await asyncio.sleep(poll_seconds)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@app.get("/jobs/{job_id}", response_model=JobInfo)
+async def get_job(job_id: str):
+    """Job status, including the FullCallAnalysis once it has succeeded."""
+    info = await asyncio.to_thread(job_store.get, job_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return info
 
-        if isinstance(e, TypeError) and "BaseModel.__init__()" in str(e):
-             detail_msg = "Internal Error: Failed to parse LLM response into expected structure (BaseModel init error)."
-        else:
-             detail_msg = f"Error generating overall call analysis: {type(e).__name__}"
 
-        raise HTTPException(status_code=500, detail=detail_msg)
 if __name__ == "__main__":
     # Removed the extra comma at the end of the uvicorn.run line
     uvicorn.run("main:app", host="0.0.0.0", port=8001, reload=True)
\ No newline at end of file
@@ -0,0 +1,118 @@
+# model_tiers.py
+import logging
+import os
+import re
+from typing import Awaitable, Callable, List, Optional, Tuple, Type, TypeVar
+
+from models import AudioAnalysis, CallAnalysis, OverallCallAnalysisResult
+from observability import MODEL_TIER_RUNS
+from timeline import TurnTimeline
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+PRO_MODEL = "google-gla:gemini-2.5-pro-exp-03-25"
+FAST_MODEL = os.getenv("FAST_MODEL", "google-gla:gemini-2.5-flash")
+
+# A translation that still contains Arabic / other non-Latin letters was not translated
+_NON_LATIN_LETTER = re.compile(r"[^\W\d_a-zA-ZÀ-ɏ]")
+# Model timestamps have whole-second resolution, so back-to-back turns of one speaker can touch by up to this much
+_SELF_OVERLAP_MS = 1000
+
+
+class ModelTiers:
+    """
+    Ordered list of models for one agent, cheapest first. Each call runs on the
+    first tier and moves to the next one only when the output failed
+    validation (`escalate_on`) or the caller's `doubt` check found a reason not
+    to trust it. The last tier's answer is always accepted.
+
+    Configured with <PREFIX>_MODELS (comma-separated, fast to strong).
+    """
+
+    def __init__(self, name: str, models: List[str], escalate_on: Tuple[Type[BaseException], ...] = ()):
+        if not models:
+            raise ValueError(f"{name}: at least one model tier is required")
+        self.name = name
+        self.models = models
+        self.escalate_on = escalate_on
+
+    @classmethod
+    def from_env(cls, name: str, env_prefix: str, default_models: List[str],
+                 escalate_on: Tuple[Type[BaseException], ...] = ()) -> "ModelTiers":
+        configured = os.getenv(f"{env_prefix}_MODELS")
+        models = [m.strip() for m in configured.split(",") if m.strip()] if configured else default_models
+        return cls(name, models, escalate_on)
+
+    @property
+    def strongest(self) -> str:
+        return self.models[-1]
+
+    @property
+    def cache_tag(self) -> str:
+        """Identifies the tier list in cache keys, so changing tiers invalidates cached results."""
+        return ">".join(self.models)
+
+    async def run(self, call: Callable[[str], Awaitable[T]], doubt: Optional[Callable[[T], Optional[str]]] = None) -> T:
+        """`call(model)` runs the agent on one model; `doubt(output)` returns a reason to escalate, or None."""
+        for tier, model in enumerate(self.models):
+            last = tier == len(self.models) - 1
+            try:
+                output = await call(model)
+            except self.escalate_on as e:
+                MODEL_TIER_RUNS.labels(self.name, model, "failed" if last else "escalated_validation").inc()
+                if last:
+                    raise
+                logger.warning(f"{self.name}: {model} output failed validation ({type(e).__name__}); escalating")
+                continue
+            reason = None if last or doubt is None else doubt(output)
+            if reason is None:
+                MODEL_TIER_RUNS.labels(self.name, model, "accepted").inc()
+                return output
+            MODEL_TIER_RUNS.labels(self.name, model, "escalated_low_confidence").inc()
+            logger.info(f"{self.name}: {model} output doubtful ({reason}); escalating")
+
+
+# --- Confidence Checks ---
+# None of the agents reports a confidence, so these look for the ways cheaper
+# models typically go wrong on each task.
+
+def transcription_doubt(output: AudioAnalysis) -> Optional[str]:
+    turns = output.conversation
+    if not turns:
+        return "no_turns"
+    # Turns may overlap, but a turn starting well before the previous one means a garbled timeline
+    if any(b.startTime + 5000 < a.startTime for a, b in zip(turns, turns[1:])):
+        return "timeline_out_of_order"
+    # Different speakers talk over each other, but one speaker in two overlapping turns is a duplicated utterance
+    timeline = TurnTimeline(turns)
+    for i, j in timeline.overlaps():
+        a, b = turns[i], turns[j]
+        if a.speaker == b.speaker and min(a.endTime, b.endTime) - max(a.startTime, b.startTime) > _SELF_OVERLAP_MS:
+            return "speaker_overlaps_itself"
+    if not any(turn.transcript.strip() for turn in turns):
+        return "empty_transcript"
+    return None
+
+
+def turn_analysis_doubt(output: CallAnalysis, shard: AudioAnalysis) -> Optional[str]:
+    if len(output.conversation_analysis) != len(shard.conversation):
+        return "count_mismatch"
+    for turn, analysis in zip(shard.conversation, output.conversation_analysis):
+        if turn.transcript.strip() and not analysis.translation.strip():
+            return "empty_translation"
+        if _NON_LATIN_LETTER.search(analysis.translation):
+            return "untranslated"
+    return None
+
+
+def overall_analysis_doubt(output: OverallCallAnalysisResult, conversation: AudioAnalysis) -> Optional[str]:
+    if not output.summarization.strip() or not output.call_purpose.strip():
+        return "empty_field"
+    turns = len(conversation.conversation)
+    if turns >= 4 and not output.topics_keywords:
+        return "no_keywords"
+    if turns >= 10 and len(output.summarization.split()) < 8:
+        return "short_summary"
+    return None
@@ -1,17 +1,66 @@
 # models.py
 
-from typing import List, Literal
-from pydantic import BaseModel
+from typing import Annotated, Dict, List, Literal, Optional, Union
+from pydantic import BaseModel, BeforeValidator, WithJsonSchema, model_validator
 from enum import Enum
 
 
+def parse_timestamp_ms(value: Union[str, int, float]) -> int:
+    """
+    Normalizes a timestamp to integer milliseconds.
+    Strings are 'HH:MM:SS', 'MM:SS' or 'SS' (fractional seconds allowed); numbers are already milliseconds.
+    """
+    if isinstance(value, bool):
+        raise ValueError("timestamp must be a string or a number of milliseconds")
+    if isinstance(value, (int, float)):
+        ms = int(round(value))
+    elif isinstance(value, str):
+        parts = value.strip().split(":")
+        if not 1 <= len(parts) <= 3:
+            raise ValueError(f"invalid timestamp {value!r}, expected HH:MM:SS")
+        seconds = 0.0
+        try:
+            for part in parts:
+                seconds = seconds * 60 + float(part)
+        except ValueError:
+            raise ValueError(f"invalid timestamp {value!r}, expected HH:MM:SS") from None
+        ms = int(round(seconds * 1000))
+    else:
+        raise ValueError("timestamp must be a string or a number of milliseconds")
+    if ms < 0:
+        raise ValueError("timestamp must not be negative")
+    return ms
+
+
+# Stored and serialized as integer milliseconds. The validation schema still
+# advertises HH:MM:SS strings so the transcriber keeps emitting that format.
+TimestampMs = Annotated[
+    int,
+    BeforeValidator(parse_timestamp_ms),
+    WithJsonSchema(
+        {"type": "string", "description": "HH:MM:SS relative to the start of the audio (integer milliseconds are also accepted)"},
+        mode="validation",
+    ),
+]
+
+
 class ConversationTurn(BaseModel):
     speaker: str
-    startTime: str
-    endTime: str
+    startTime: TimestampMs
+    endTime: TimestampMs
     transcript: str
     emotion: str
 
+    @model_validator(mode="after")
+    def _check_order(self):
+        if self.endTime < self.startTime:
+            raise ValueError(f"endTime ({self.endTime} ms) is before startTime ({self.startTime} ms)")
+        return self
+
+    @property
+    def duration_ms(self) -> int:
+        return self.endTime - self.startTime
+
 class AudioAnalysis(BaseModel):
     conversation: List[ConversationTurn]
 
@@ -44,4 +93,123 @@ class OverallCallAnalysisResult(BaseModel):
     call_purpose: str
     topics_keywords: List[str]
     action_taken: str
-    next_action: str = None
+    next_action: Optional[str] = None
+
+
+class FullCallAnalysis(BaseModel):
+    transcription: AudioAnalysis
+    turn_analysis: CallAnalysis
+    overall_analysis: OverallCallAnalysisResult
+
+
+class SpeakerMetrics(BaseModel):
+    speaker: str
+    talk_time_ms: int
+    talk_ratio: float
+    turn_count: int
+    mean_turn_ms: float
+    interruptions: int # Turns this speaker started while someone else was still talking
+
+
+class EmotionBin(BaseModel):
+    start_ms: int
+    counts: Dict[str, int]
+
+
+class CallMetrics(BaseModel):
+    duration_ms: int
+    turn_count: int
+    total_talk_ms: int
+    silence_ms: int
+    longest_silence_ms: int
+    long_silence_count: int
+    overlap_ms: int
+    interruption_count: int
+    speakers: List[SpeakerMetrics]
+    emotion_timeline: List[EmotionBin]
+
+
+class JobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+
+class JobInfo(BaseModel):
+    job_id: str
+    status: JobStatus
+    filename: Optional[str] = None
+    attempts: int = 0
+    created_at: float
+    updated_at: float
+    error: Optional[str] = None
+    result: Optional[FullCallAnalysis] = None
+
+
+class JobPathsRequest(BaseModel):
+    paths: List[str]
+
+
+class AnalyticsPeriod(str, Enum):
+    day = "day"
+    week = "week"
+    month = "month"
+
+
+class TurnGroupBy(str, Enum):
+    category = "category"
+    sentiment = "sentiment"
+    speaker = "speaker"
+    emotion = "emotion"
+
+
+class CategoryRate(BaseModel):
+    period_start: str # YYYY-MM-DD; weeks start on Monday
+    calls: int
+    calls_with_category: int
+    rate: float # calls_with_category / calls
+    category_turns: int
+
+
+class TurnBreakdown(BaseModel):
+    period_start: Optional[str] = None
+    key: str
+    turns: int
+
+
+class StoredCall(BaseModel):
+    call_id: str # SHA-256 of the transcript, shared by every endpoint that saw it
+    created_at: float
+    filename: Optional[str] = None
+    turn_count: int
+    duration_ms: int
+    call_purpose: Optional[str] = None
+    summarization: Optional[str] = None
+
+
+class SearchField(str, Enum):
+    transcript = "transcript"
+    translation = "translation"
+    keywords = "keywords" # OverallCallAnalysisResult.topics_keywords
+
+
+class SearchSort(str, Enum):
+    relevance = "relevance"
+    recent = "recent"
+
+
+class SearchHit(BaseModel):
+    call_id: str
+    created_at: float
+    filename: Optional[str] = None
+    # Turn hits only; keyword hits match the call as a whole
+    turn_index: Optional[int] = None
+    speaker: Optional[str] = None
+    startTime: Optional[int] = None # milliseconds
+    endTime: Optional[int] = None
+    # Matched terms are wrapped in [ ]
+    transcript: Optional[str] = None
+    translation: Optional[str] = None
+    keywords: Optional[str] = None
+    score: float # BM25, higher is better
@@ -0,0 +1,225 @@
+# observability.py
+import asyncio
+import inspect
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from pydantic import ValidationError
+from pydantic_ai.exceptions import UnexpectedModelBehavior
+from pydantic_ai.messages import ModelRequest, RetryPromptPart
+from starlette.routing import Match
+
+# Route template of the request being served ("/analyze-turns", "/jobs/{job_id}", ...).
+# Set by MetricsMiddleware and inherited by every task the request spawns.
+current_endpoint: ContextVar[str] = ContextVar("current_endpoint", default="background")
+
+# --- Metric Definitions ---
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+BYTES_BUCKETS = tuple(2 ** i for i in range(10, 32, 2))  # 1 KiB .. 1 GiB
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 1000000)
+
+REQUESTS_IN_FLIGHT = Gauge(
+    "callanalysis_requests_in_flight", "HTTP requests currently being served", ["endpoint"]
+)
+REQUEST_DURATION = Histogram(
+    "callanalysis_request_duration_seconds", "HTTP request latency until the last body byte is sent",
+    ["endpoint", "method", "status"], buckets=LATENCY_BUCKETS,
+)
+UPLOAD_BYTES = Histogram(
+    "callanalysis_upload_bytes", "Size of uploaded audio files", ["endpoint"], buckets=BYTES_BUCKETS,
+)
+UPLOAD_SECONDS = Histogram(
+    "callanalysis_upload_read_seconds", "Time spent streaming an upload to disk", ["endpoint"], buckets=LATENCY_BUCKETS,
+)
+AGENT_IN_FLIGHT = Gauge(
+    "callanalysis_agent_runs_in_flight", "Agent runs currently waiting on the model", ["endpoint", "agent"]
+)
+AGENT_DURATION = Histogram(
+    "callanalysis_agent_run_seconds", "Wall time of one agent run (including output validation retries)",
+    ["endpoint", "agent", "outcome"], buckets=LATENCY_BUCKETS,
+)
+AGENT_INPUT_TOKENS = Histogram(
+    "callanalysis_agent_input_tokens", "Input tokens per agent run", ["endpoint", "agent"], buckets=TOKEN_BUCKETS,
+)
+AGENT_OUTPUT_TOKENS = Histogram(
+    "callanalysis_agent_output_tokens", "Output tokens per agent run", ["endpoint", "agent"], buckets=TOKEN_BUCKETS,
+)
+AGENT_OUTPUT_RETRIES = Counter(
+    "callanalysis_agent_output_retries_total", "Model outputs rejected by validation and retried within a run",
+    ["endpoint", "agent"],
+)
+AGENT_VALIDATION_FAILURES = Counter(
+    "callanalysis_agent_validation_failures_total", "Agent runs that failed because the output never validated",
+    ["endpoint", "agent"],
+)
+AGENT_ERRORS = Counter(
+    "callanalysis_agent_errors_total", "Agent runs that failed for any other reason", ["endpoint", "agent", "error"],
+)
+
+AGENT_RESILIENCE_EVENTS = Counter(
+    "callanalysis_agent_resilience_events_total",
+    "Retries, hedged requests, deadline timeouts and circuit-breaker rejections", ["agent", "event"],
+)
+CIRCUIT_STATE = Gauge(
+    "callanalysis_circuit_state", "Provider circuit breaker state (0 closed, 1 open, 2 half-open)", ["circuit"]
+)
+
+MODEL_TIER_RUNS = Counter(
+    "callanalysis_model_tier_runs_total",
+    "Agent outputs per model tier: accepted, escalated to the next tier (validation / low confidence) or failed",
+    ["agent", "model", "outcome"],
+)
+COALESCED_REQUESTS = Counter(
+    "callanalysis_coalesced_requests_total",
+    "Requests that waited on an identical in-flight request instead of calling the model", ["operation"],
+)
+PRECLASSIFIER_TURNS = Counter(
+    "callanalysis_preclassifier_turns_total",
+    "Turns resolved by the local pre-classifier, forwarded to the model, or both (shadow)", ["decision"],
+)
+PRECLASSIFIER_AGREEMENT = Counter(
+    "callanalysis_preclassifier_agreement_total",
+    "Shadowed turns where the local category / sentiment matched the model's", ["field", "rule", "outcome"],
+)
+
+
+def metrics_response_body():
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+# --- Agent Instrumentation ---
+
+class AgentRunRecorder:
+    """Handed out by track_agent_run so the caller can report usage/messages once it has a result."""
+
+    def __init__(self, endpoint: str, agent_name: str):
+        self.endpoint = endpoint
+        self.agent_name = agent_name
+
+    def record_result(self, result) -> None:
+        usage = result.usage
+        if inspect.ismethod(usage):
+            # A method before pydantic-ai made it a property
+            usage = usage()
+        # pydantic-ai renamed request/response_tokens to input/output_tokens
+        input_tokens = getattr(usage, "input_tokens", None) or getattr(usage, "request_tokens", None)
+        output_tokens = getattr(usage, "output_tokens", None) or getattr(usage, "response_tokens", None)
+        if input_tokens:
+            AGENT_INPUT_TOKENS.labels(self.endpoint, self.agent_name).observe(input_tokens)
+        if output_tokens:
+            AGENT_OUTPUT_TOKENS.labels(self.endpoint, self.agent_name).observe(output_tokens)
+
+        retries = sum(
+            1
+            for message in result.all_messages()
+            if isinstance(message, ModelRequest)
+            for part in message.parts
+            if isinstance(part, RetryPromptPart)
+        )
+        if retries:
+            AGENT_OUTPUT_RETRIES.labels(self.endpoint, self.agent_name).inc(retries)
+
+    def record_validation_failure(self) -> None:
+        AGENT_VALIDATION_FAILURES.labels(self.endpoint, self.agent_name).inc()
+
+
+@asynccontextmanager
+async def track_agent_run(agent):
+    """Times one agent run and tracks it in the in-flight gauge; exceptions are classified, then re-raised."""
+    endpoint = current_endpoint.get()
+    agent_name = agent.name or "agent"
+    recorder = AgentRunRecorder(endpoint, agent_name)
+    in_flight = AGENT_IN_FLIGHT.labels(endpoint, agent_name)
+    in_flight.inc()
+    started = time.perf_counter()
+    outcome = "success"
+    try:
+        yield recorder
+    except (UnexpectedModelBehavior, ValidationError):
+        outcome = "validation_failure"
+        recorder.record_validation_failure()
+        raise
+    except asyncio.CancelledError:
+        # Losing hedge or abandoned request; not a provider error
+        outcome = "cancelled"
+        raise
+    except BaseException as e:
+        outcome = "error"
+        AGENT_ERRORS.labels(endpoint, agent_name, type(e).__name__).inc()
+        raise
+    finally:
+        in_flight.dec()
+        AGENT_DURATION.labels(endpoint, agent_name, outcome).observe(time.perf_counter() - started)
+
+
+async def instrumented_run(agent, *args, **kwargs):
+    """agent.run(...) with latency, token usage, retries and failures recorded."""
+    async with track_agent_run(agent) as recorder:
+        result = await agent.run(*args, **kwargs)
+        recorder.record_result(result)
+        return result
+
+
+def observe_upload(size: int, seconds: float) -> None:
+    endpoint = current_endpoint.get()
+    UPLOAD_BYTES.labels(endpoint).observe(size)
+    UPLOAD_SECONDS.labels(endpoint).observe(seconds)
+
+
+# --- HTTP Middleware ---
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (so streaming responses are timed to their last byte)
+    that labels everything by route template rather than raw path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._endpoint_cache: Dict[str, str] = {}
+
+    def _endpoint(self, scope) -> str:
+        path = scope["path"]
+        endpoint = self._endpoint_cache.get(path)
+        if endpoint is None:
+            endpoint = "unmatched"
+            for route in scope["app"].router.routes:
+                match, _ = route.matches(scope)
+                if match == Match.FULL:
+                    endpoint = getattr(route, "path", path)
+                    break
+            # Only cache static routes: templated ones ("/jobs/{job_id}") and unmatched paths
+            # (404s, scanners) would grow the cache without bound
+            if endpoint != "unmatched" and "{" not in endpoint:
+                self._endpoint_cache[path] = endpoint
+        return endpoint
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = self._endpoint(scope)
+        token = current_endpoint.set(endpoint)
+        status: Optional[int] = None
+        in_flight = REQUESTS_IN_FLIGHT.labels(endpoint)
+        in_flight.inc()
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            REQUEST_DURATION.labels(endpoint, scope["method"], str(status or 500)).observe(
+                time.perf_counter() - started
+            )
+            current_endpoint.reset(token)
@@ -0,0 +1,102 @@
+# preclassifier_eval.py
+# python preclassifier_eval.py --db .cache/analytics.sqlite3
+"""
+Offline evaluation of the local turn pre-classifier (turn_classifier.py).
+
+Replays every analysed turn stored in the analytics database through the
+pre-classifier and compares its verdicts with the stored call_analyzer_agent
+labels. Reports coverage (share of turns that would not be sent to the model)
+and category / sentiment agreement per rule.
+
+Run it on calls analysed with PRECLASSIFIER_ENABLED=false: turns that were
+already classified locally would trivially agree with themselves.
+"""
+import argparse
+import json
+import sqlite3
+import sys
+from collections import Counter, defaultdict
+
+from analytics_store import ANALYTICS_DB_PATH
+from models import TurnCategory, TurnSentiment
+from turn_classifier import PRECLASSIFIER_MIN_CONFIDENCE, TurnPreClassifier
+
+
+def evaluate(db_path: str, min_confidence: float, limit: int) -> dict:
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    rows = conn.execute(
+        "SELECT t.transcript, a.category, a.sentiment FROM turns t "
+        "JOIN turn_analysis a ON a.call_id = t.call_id AND a.turn_index = t.turn_index "
+        "ORDER BY t.created_at DESC LIMIT ?",
+        (limit,),
+    )
+    classifier = TurnPreClassifier()
+    total = 0
+    per_rule = defaultdict(Counter)
+    confusion = Counter()
+    for transcript, category, sentiment in rows:
+        total += 1
+        verdict = classifier.classify(transcript)
+        if verdict is None or verdict.confidence < min_confidence:
+            continue
+        stats = per_rule[verdict.reason]
+        stats["turns"] += 1
+        stats["category"] += verdict.category == TurnCategory(category)
+        stats["sentiment"] += verdict.sentiment == TurnSentiment(sentiment)
+        confusion[(verdict.category.value, category)] += 1
+
+    local = sum(stats["turns"] for stats in per_rule.values())
+    return {
+        "turns": total,
+        "local": local,
+        "coverage": local / total if total else 0.0,
+        "category_agreement": sum(s["category"] for s in per_rule.values()) / local if local else None,
+        "sentiment_agreement": sum(s["sentiment"] for s in per_rule.values()) / local if local else None,
+        "rules": {
+            rule: {
+                "turns": stats["turns"],
+                "category_agreement": stats["category"] / stats["turns"],
+                "sentiment_agreement": stats["sentiment"] / stats["turns"],
+            }
+            for rule, stats in sorted(per_rule.items())
+        },
+        "category_confusion": [
+            {"local": local_category, "model": model_category, "turns": count}
+            for (local_category, model_category), count in confusion.most_common()
+        ],
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"Turns evaluated: {report['turns']}")
+    print(f"Resolved locally: {report['local']} ({report['coverage']:.1%})")
+    if not report["local"]:
+        return
+    print(f"Agreement with the model: category {report['category_agreement']:.1%}, "
+          f"sentiment {report['sentiment_agreement']:.1%}")
+    print(f"\n{'rule':<12} {'turns':>8} {'category':>9} {'sentiment':>10}")
+    for rule, stats in report["rules"].items():
+        print(f"{rule:<12} {stats['turns']:>8} {stats['category_agreement']:>9.1%} {stats['sentiment_agreement']:>10.1%}")
+    print("\nCategory disagreements (local -> model):")
+    for row in report["category_confusion"]:
+        if row["local"] != row["model"]:
+            print(f"  {row['local']} -> {row['model']}: {row['turns']}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=ANALYTICS_DB_PATH, help="Analytics SQLite database")
+    parser.add_argument("--min-confidence", type=float, default=PRECLASSIFIER_MIN_CONFIDENCE)
+    parser.add_argument("--limit", type=int, default=1_000_000, help="Most recent N analysed turns")
+    parser.add_argument("--json", help="Also write the report to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = evaluate(args.db, args.min_confidence, args.limit)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if report["turns"] else 1)
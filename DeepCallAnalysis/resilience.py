@@ -0,0 +1,288 @@
+# resilience.py
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+import httpx
+from pydantic_ai.exceptions import ModelAPIError, ModelHTTPError
+
+from observability import AGENT_RESILIENCE_EVENTS, CIRCUIT_STATE
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Shared defaults; per-agent deadlines / attempts / hedging are read by AgentResilience.from_env.
+RETRY_BASE_SECONDS = float(os.getenv("AGENT_RETRY_BASE_SECONDS", "0.5"))
+RETRY_MAX_SECONDS = float(os.getenv("AGENT_RETRY_MAX_SECONDS", "8"))
+# Every call deposits this many retry tokens; every retry or hedge spends one.
+RETRY_BUDGET_RATIO = float(os.getenv("AGENT_RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_CAP = float(os.getenv("AGENT_RETRY_BUDGET_CAP", "10"))
+HEDGE_MIN_SAMPLES = int(os.getenv("AGENT_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("AGENT_HEDGE_MIN_DELAY_SECONDS", "1"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("AGENT_CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("AGENT_CIRCUIT_RESET_SECONDS", "30"))
+
+
+class CircuitOpenError(Exception):
+    """The provider circuit is open; the call was rejected without reaching the model."""
+
+    def __init__(self, name: str, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"Circuit '{name}' is open; retry in {retry_after:.0f}s")
+
+
+def is_transient(error: BaseException) -> bool:
+    """Timeouts, connection failures, 408/429 and 5xx are worth retrying. Validation errors are not."""
+    if isinstance(error, ModelHTTPError):
+        return error.status_code in (408, 429) or error.status_code >= 500
+    return isinstance(error, (asyncio.TimeoutError, httpx.TransportError, ModelAPIError))
+
+
+# --- Building Blocks ---
+
+class RetryBudget:
+    """Token bucket that caps retries + hedges at roughly `ratio` of the call volume."""
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, cap: float = RETRY_BUDGET_CAP):
+        self.ratio = ratio
+        self.cap = cap
+        self.tokens = cap
+
+    def deposit(self) -> None:
+        self.tokens = min(self.cap, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies, used to pick the hedge delay."""
+
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive transient failures and rejects
+    calls for `reset_seconds`. Then a single probe is let through (half-open):
+    success closes the circuit, failure re-opens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        CIRCUIT_STATE.labels(name).set(self.state)
+
+    def _set_state(self, state: int) -> None:
+        if state != self.state:
+            logger.warning(f"Circuit '{self.name}': {('closed', 'open', 'half-open')[self.state]} -> "
+                           f"{('closed', 'open', 'half-open')[state]}")
+        self.state = state
+        CIRCUIT_STATE.labels(self.name).set(state)
+
+    def before_call(self) -> None:
+        """Raises CircuitOpenError unless the call may go to the provider."""
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(self.name, remaining)
+            self._set_state(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                raise CircuitOpenError(self.name, self.reset_seconds)
+            self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        self._probe_in_flight = False
+        self.failures = 0
+        self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+
+    def release(self) -> None:
+        """The call ended without telling us anything about the provider (cancelled, bad output)."""
+        self._probe_in_flight = False
+
+
+# --- Per-Agent Policy ---
+
+class AgentResilience:
+    """
+    Deadline, jittered retries (bounded by a RetryBudget), optional hedging and a
+    shared CircuitBreaker around one agent's calls.
+
+    `call(fn)` takes a zero-argument coroutine factory so each attempt or hedge
+    issues a fresh request.
+    """
+
+    def __init__(self, name: str, breaker: CircuitBreaker, timeout_seconds: float,
+                 max_attempts: int, hedge: bool, hedge_quantile: float = 0.95):
+        self.name = name
+        self.breaker = breaker
+        self.timeout_seconds = timeout_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.budget = RetryBudget()
+        self.latency = LatencyTracker()
+
+    @classmethod
+    def from_env(cls, name: str, env_prefix: str, breaker: CircuitBreaker, timeout_seconds: float,
+                 max_attempts: int, hedge: bool) -> "AgentResilience":
+        """Defaults can be overridden by <PREFIX>_TIMEOUT_SECONDS, <PREFIX>_MAX_ATTEMPTS and <PREFIX>_HEDGE."""
+        return cls(
+            name,
+            breaker,
+            timeout_seconds=float(os.getenv(f"{env_prefix}_TIMEOUT_SECONDS", str(timeout_seconds))),
+            max_attempts=int(os.getenv(f"{env_prefix}_MAX_ATTEMPTS", str(max_attempts))),
+            hedge=os.getenv(f"{env_prefix}_HEDGE", str(hedge)).lower() in ("1", "true", "yes"),
+        )
+
+    def _event(self, event: str) -> None:
+        AGENT_RESILIENCE_EVENTS.labels(self.name, event).inc()
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        self.budget.deposit()
+        for attempt in range(self.max_attempts):
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                self._event("circuit_rejected")
+                raise
+            try:
+                result = await self._attempt(fn)
+            except Exception as e:
+                if not is_transient(e):
+                    self.breaker.release()
+                    raise
+                self.breaker.record_failure()
+                if isinstance(e, asyncio.TimeoutError):
+                    self._event("timeout")
+                if attempt + 1 >= self.max_attempts or not self.budget.try_spend():
+                    raise
+                delay = random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt))
+                self._event("retry")
+                logger.warning(f"{self.name} attempt {attempt + 1} failed ({type(e).__name__}: {e}); "
+                               f"retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+            except BaseException:
+                self.breaker.release()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+
+    async def _attempt(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """One attempt under the deadline; after p95 without an answer, a duplicate request races the first."""
+        started = time.perf_counter()
+        async with asyncio.timeout(self.timeout_seconds):
+            primary = asyncio.ensure_future(fn())
+            tasks = [primary]
+            try:
+                hedge_delay = self.latency.percentile(self.hedge_quantile) if self.hedge else None
+                if hedge_delay is not None:
+                    done, _ = await asyncio.wait(tasks, timeout=max(hedge_delay, HEDGE_MIN_DELAY_SECONDS))
+                    if not done and self.budget.try_spend():
+                        self._event("hedge")
+                        tasks.append(asyncio.ensure_future(fn()))
+
+                # First success wins; a failure only counts once every request has failed
+                pending = set(tasks)
+                error: Optional[BaseException] = None
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            if task is not primary:
+                                self._event("hedge_won")
+                            self.latency.observe(time.perf_counter() - started)
+                            return task.result()
+                        error = task.exception()
+                raise error
+            finally:
+                for task in tasks:
+                    task.cancel()
+                # Let the losing request unwind (closes its HTTP stream) and collect its outcome
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def stream(self, make_iter: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """
+        Iterates a model stream under the circuit breaker and the deadline. Items
+        have already been handed out when a stream fails, so it is never retried
+        or hedged. The stream runs in its own task so the deadline cannot fire
+        while the consumer holds a yielded item.
+        """
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self._event("circuit_rejected")
+            raise
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        async def produce():
+            try:
+                async with asyncio.timeout(self.timeout_seconds):
+                    async for item in make_iter():
+                        await queue.put(item)
+            except Exception as e:
+                await queue.put(e)
+            else:
+                await queue.put(done)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        except Exception as e:
+            if is_transient(e):
+                self.breaker.record_failure()
+                if isinstance(e, asyncio.TimeoutError):
+                    self._event("timeout")
+            else:
+                self.breaker.release()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        else:
+            self.breaker.record_success()
+        finally:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
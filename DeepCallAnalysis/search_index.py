@@ -0,0 +1,190 @@
+# search_index.py
+import json
+import re
+import sqlite3
+from typing import List, Optional, Sequence
+
+from models import SearchField, SearchHit, SearchSort
+
+# Turn rows live at rowid (call_key << TURN_BITS) + turn_index, so one call's turns form a contiguous rowid range
+TURN_BITS = 20
+_TURN_MASK = (1 << TURN_BITS) - 1
+
+# porter: "cancel" also finds "cancelled" / "cancelling"; unicode61 folds case and diacritics for Arabic and English alike
+_TOKENIZE = "porter unicode61 remove_diacritics 2"
+
+SEARCH_SCHEMA = f"""
+-- Small integer key per call; the FTS tables are keyed by it
+CREATE TABLE IF NOT EXISTS search_keys (
+    call_key INTEGER PRIMARY KEY,
+    call_id TEXT NOT NULL UNIQUE
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS turn_fts USING fts5(
+    transcript, translation, tokenize = '{_TOKENIZE}', prefix = '3'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS keyword_fts USING fts5(
+    keywords, tokenize = '{_TOKENIZE}', prefix = '3'
+);
+"""
+
+_HIGHLIGHT = ("[", "]")
+
+# Quoted phrases, parentheses, or any run of other non-space characters
+_QUERY_TOKEN = re.compile(r'"[^"]*"?|[()]|[^\s()"]+')
+_BARE_TERM = re.compile(r"\w+\*?")
+
+
+def fts_query(query: str) -> str:
+    """
+    Normalises a user query into FTS5 syntax: "quoted phrases", AND / OR / NOT
+    (any case), parentheses and prefix* terms pass through; everything else
+    (e.g. "sign-up", "vodafone.com") is quoted so it is matched as a phrase
+    instead of raising a syntax error. Adjacent terms are ANDed.
+    """
+    parts: List[str] = []
+    for token in _QUERY_TOKEN.findall(query):
+        if token.upper() in ("AND", "OR", "NOT"):
+            # FTS5's NOT is binary ("a NOT b"), so "a AND NOT b" becomes "a NOT b"
+            if token.upper() == "NOT" and parts and parts[-1] == "AND":
+                parts.pop()
+            parts.append(token.upper())
+        elif token in ("(", ")") or _BARE_TERM.fullmatch(token):
+            parts.append(token)
+        else:
+            phrase = token.strip('"').replace('"', '""')
+            if phrase.strip():
+                parts.append(f'"{phrase}"')
+    return " ".join(parts)
+
+
+def index_calls(conn: sqlite3.Connection, call_ids: Sequence[str], reindex_turns: Sequence[str] = (),
+                reindex_keywords: Sequence[str] = ()) -> None:
+    """
+    Brings the index up to date for one write batch, inside the caller's
+    transaction. Calls seen for the first time get their turns indexed;
+    `reindex_turns` (new translations) and `reindex_keywords` (new summary) are
+    replaced. Everything else is left untouched, so cost is per batch, not per corpus.
+    """
+    ids = json.dumps(list(call_ids))
+    new_ids = [row[0] for row in conn.execute(
+        "SELECT value FROM json_each(?) WHERE value NOT IN (SELECT call_id FROM search_keys)", (ids,)
+    )]
+    conn.execute("INSERT OR IGNORE INTO search_keys (call_id) SELECT value FROM json_each(?)", (ids,))
+
+    stale = json.dumps(list(reindex_turns))
+    conn.executemany(
+        "DELETE FROM turn_fts WHERE rowid BETWEEN ? AND ?",
+        [
+            (key << TURN_BITS, (key << TURN_BITS) | _TURN_MASK)
+            for (key,) in conn.execute(
+                "SELECT call_key FROM search_keys WHERE call_id IN (SELECT value FROM json_each(?))", (stale,)
+            ).fetchall()
+        ],
+    )
+    conn.execute(
+        f"INSERT INTO turn_fts (rowid, transcript, translation) "
+        f"SELECT (k.call_key << {TURN_BITS}) + t.turn_index, t.transcript, COALESCE(a.translation, '') "
+        "FROM search_keys k JOIN turns t ON t.call_id = k.call_id "
+        "LEFT JOIN turn_analysis a ON a.call_id = t.call_id AND a.turn_index = t.turn_index "
+        "WHERE k.call_id IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(set(new_ids) | set(reindex_turns))),),
+    )
+
+    if reindex_keywords:
+        keywords = json.dumps(list(reindex_keywords))
+        conn.execute(
+            "DELETE FROM keyword_fts WHERE rowid IN "
+            "(SELECT call_key FROM search_keys WHERE call_id IN (SELECT value FROM json_each(?)))",
+            (keywords,),
+        )
+        conn.execute(
+            "INSERT INTO keyword_fts (rowid, keywords) "
+            "SELECT k.call_key, (SELECT group_concat(value, '; ') FROM json_each(s.topics_keywords)) "
+            "FROM search_keys k JOIN call_summaries s ON s.call_id = k.call_id "
+            "WHERE k.call_id IN (SELECT value FROM json_each(?))",
+            (keywords,),
+        )
+
+
+def unindexed_calls(conn: sqlite3.Connection) -> List[str]:
+    """Calls stored before the index existed."""
+    return [row[0] for row in conn.execute(
+        "SELECT call_id FROM calls WHERE call_id NOT IN (SELECT call_id FROM search_keys)"
+    )]
+
+
+def search(
+    conn: sqlite3.Connection,
+    query: str,
+    fields: Sequence[SearchField],
+    speaker: Optional[str],
+    since: float,
+    until: float,
+    limit: int,
+    offset: int,
+    sort: SearchSort = SearchSort.relevance,
+) -> List[SearchHit]:
+    """
+    Best matches first (BM25), or most recently stored calls first. Turn hits
+    carry the turn's index, speaker and timestamps; keyword hits are call-level.
+    Matched terms are wrapped in [ ]. Raises ValueError for a query FTS5 cannot parse.
+
+    Ranking scores every match, so very broad queries (short prefixes) are
+    cheaper with sort=recent, which FTS5 answers by walking rowids backwards.
+    """
+    match = fts_query(query)
+    if not match:
+        raise ValueError("Empty search query")
+    hits: List[SearchHit] = []
+    # Enough rows from each table to fill the requested page after merging
+    window = limit + offset
+    order = "f.rank" if sort == SearchSort.relevance else "f.rowid DESC"
+    turn_columns = [f.value for f in fields if f in (SearchField.transcript, SearchField.translation)]
+    try:
+        if turn_columns:
+            conditions = ["turn_fts MATCH ?", "c.created_at >= ?", "c.created_at < ?"]
+            params: list = [f"{{{' '.join(turn_columns)}}} : ({match})", since, until]
+            if speaker is not None:
+                conditions.append("t.speaker_role = ?")
+                params.append(speaker)
+            rows = conn.execute(
+                "SELECT k.call_id, c.created_at, c.filename, t.turn_index, t.speaker, t.start_ms, t.end_ms, "
+                f"highlight(turn_fts, 0, ?, ?) AS transcript, highlight(turn_fts, 1, ?, ?) AS translation, "
+                "f.rank AS score "
+                f"FROM turn_fts f JOIN search_keys k ON k.call_key = f.rowid >> {TURN_BITS} "
+                f"JOIN turns t ON t.call_id = k.call_id AND t.turn_index = f.rowid & {_TURN_MASK} "
+                "JOIN calls c ON c.call_id = k.call_id "
+                f"WHERE {' AND '.join(conditions)} ORDER BY {order} LIMIT ?",
+                [*_HIGHLIGHT, *_HIGHLIGHT, *params, window],
+            ).fetchall()
+            hits += [
+                SearchHit(
+                    call_id=row["call_id"], created_at=row["created_at"], filename=row["filename"],
+                    turn_index=row["turn_index"], speaker=row["speaker"], startTime=row["start_ms"],
+                    endTime=row["end_ms"], transcript=row["transcript"], translation=row["translation"] or None,
+                    score=-row["score"],
+                )
+                for row in rows
+            ]
+        if SearchField.keywords in fields and speaker is None:
+            rows = conn.execute(
+                "SELECT k.call_id, c.created_at, c.filename, highlight(keyword_fts, 0, ?, ?) AS keywords, "
+                "f.rank AS score FROM keyword_fts f JOIN search_keys k ON k.call_key = f.rowid "
+                "JOIN calls c ON c.call_id = k.call_id "
+                f"WHERE keyword_fts MATCH ? AND c.created_at >= ? AND c.created_at < ? ORDER BY {order} LIMIT ?",
+                [*_HIGHLIGHT, match, since, until, window],
+            ).fetchall()
+            hits += [
+                SearchHit(call_id=row["call_id"], created_at=row["created_at"], filename=row["filename"],
+                          keywords=row["keywords"], score=-row["score"])
+                for row in rows
+            ]
+    except sqlite3.OperationalError as e:
+        if "fts5" in str(e) or "syntax error" in str(e):
+            raise ValueError(f"Invalid search query: {query!r}") from e
+        raise
+    if sort == SearchSort.relevance:
+        hits.sort(key=lambda hit: hit.score, reverse=True)
+    else:
+        hits.sort(key=lambda hit: (hit.created_at, -(hit.turn_index or 0)), reverse=True)
+    return hits[offset:offset + limit]
@@ -0,0 +1,109 @@
+# single_flight.py
+import asyncio
+import logging
+import os
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Generic, Iterator, Optional, TypeVar
+
+from observability import COALESCED_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+REQUEST_COALESCING = os.getenv("REQUEST_COALESCING", "true").lower() in ("1", "true", "yes")
+
+
+class SingleFlight(Generic[T]):
+    """
+    Coalesces concurrent calls for the same key: the first caller (the leader)
+    runs the work, later callers wait for its outcome instead of repeating it.
+
+    * The leader runs the work inline rather than in a detached task, so
+      resources it owns (its spooled upload) are valid exactly as long as the
+      work runs.
+    * A result or an exception from the leader is handed to every follower.
+    * If the leader is cancelled (its client went away), followers are not:
+      they retry, and one of them becomes the new leader.
+    * A follower that is cancelled just stops waiting.
+
+    Only calls that overlap in time are coalesced; results are not kept once
+    the leader finishes (that is what the caches are for).
+    """
+
+    def __init__(self, name: str, enabled: bool = REQUEST_COALESCING):
+        self.name = name
+        self.enabled = enabled
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    def in_flight(self, key: str) -> Optional[asyncio.Future]:
+        return self._in_flight.get(key)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        if not self.enabled:
+            return await fn()
+        while key in self._in_flight:
+            future = self._in_flight[key]
+            COALESCED_REQUESTS.labels(self.name).inc()
+            logger.info(f"{self.name}: waiting on in-flight request {key[:12]}")
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise  # we were cancelled ourselves
+                logger.info(f"{self.name}: leader for {key[:12]} was cancelled; retrying")
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # followers re-raise it; don't log it as never retrieved
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    @contextmanager
+    def leading(self, key: str) -> Iterator[Callable[[T], None]]:
+        """
+        Registers the caller as the leader for `key` while it produces the result
+        itself (e.g. while streaming it out), so concurrent do() calls for the
+        same key wait for it. Check in_flight() first, with no await in between.
+
+        Yields a function that publishes the result to the followers. Leaving
+        the block with an exception hands it to them; leaving it without a
+        result (the client went away) releases them to retry.
+        """
+        if not self.enabled:
+            yield lambda result: None
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+
+        def publish(result: T) -> None:
+            if not future.done():
+                future.set_result(result)
+
+        try:
+            yield publish
+        except (asyncio.CancelledError, GeneratorExit):
+            future.cancel()
+            raise
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                future.exception()
+            raise
+        else:
+            future.cancel()  # no-op once published
+        finally:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
@@ -0,0 +1,80 @@
+# test_timeline.py
+import random
+
+import pytest
+
+from models import AudioAnalysis, ConversationTurn
+from model_tiers import transcription_doubt
+from timeline import TurnTimeline
+
+
+def _turn(start, end, speaker="Agent"):
+    return ConversationTurn(speaker=speaker, startTime=start, endTime=end, transcript="text", emotion="Neutral")
+
+
+def _brute_overlapping(turns, start, end):
+    hits = [i for i, t in enumerate(turns) if t.startTime < end and t.endTime > start and t.endTime > t.startTime]
+    return sorted(hits, key=lambda i: (turns[i].startTime, turns[i].endTime, i))
+
+
+@pytest.fixture
+def turns():
+    # One long early turn spanning the whole call, as in a hold message
+    return [_turn(0, 100_000, "System")] + [
+        _turn(s, s + 4_000, "Agent" if k % 2 else "Customer") for k, s in enumerate(range(1_000, 90_000, 3_000))
+    ]
+
+
+def test_active_at(turns):
+    timeline = TurnTimeline(turns)
+    assert timeline.active_at(0) == [0]
+    assert timeline.active_at(4_500) == [0, 1, 2]
+    assert timeline.active_at(99_999) == [0]
+    assert timeline.active_at(100_000) == []
+    assert timeline.active_at(-1) == []
+
+
+def test_overlapping_matches_brute_force():
+    rng = random.Random(7)
+    turns = []
+    for _ in range(300):
+        start = rng.randrange(0, 600_000)
+        turns.append(_turn(start, start + rng.choice([0, 500, 3_000, 20_000, 200_000])))
+    timeline = TurnTimeline(turns)
+    for _ in range(500):
+        start = rng.randrange(-1_000, 800_000)
+        end = start + rng.randrange(1, 30_000)
+        assert timeline.overlapping(start, end) == _brute_overlapping(turns, start, end)
+        assert timeline.active_at(start) == _brute_overlapping(turns, start, start + 1)
+
+
+def test_empty_and_degenerate_ranges():
+    turns = [_turn(5_000, 5_000), _turn(3_000, 8_000)]
+    timeline = TurnTimeline(turns)
+    assert timeline.active_at(5_000) == [1]
+    assert timeline.overlapping(6_000, 6_000) == []
+    assert timeline.overlaps() == []
+    assert TurnTimeline([]).active_at(0) == []
+    assert TurnTimeline([]).last_end() == 0
+
+
+def test_overlaps_and_starting_between(turns):
+    timeline = TurnTimeline(turns)
+    pairs = set(timeline.overlaps())
+    expected = {
+        (i, j) for i in range(len(turns)) for j in range(len(turns))
+        if i != j and (turns[i].startTime, i) < (turns[j].startTime, j)
+        and turns[i].startTime < turns[j].endTime and turns[j].startTime < turns[i].endTime
+    }
+    assert pairs == expected
+    assert timeline.starting_between(1_000, 7_000) == [1, 2]
+    assert timeline.last_end() == 100_000
+
+
+def test_transcription_doubt_flags_a_speaker_overlapping_itself():
+    talking_over = AudioAnalysis(conversation=[_turn(0, 5_000, "Agent"), _turn(3_000, 9_000, "Customer")])
+    duplicated = AudioAnalysis(conversation=[_turn(0, 5_000, "Agent"), _turn(2_000, 6_000, "Agent")])
+    touching = AudioAnalysis(conversation=[_turn(0, 5_000, "Agent"), _turn(4_000, 9_000, "Agent")])
+    assert transcription_doubt(talking_over) is None
+    assert transcription_doubt(duplicated) == "speaker_overlaps_itself"
+    assert transcription_doubt(touching) is None
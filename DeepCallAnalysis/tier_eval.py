@@ -0,0 +1,238 @@
+# tier_eval.py
+# python tier_eval.py --db .cache/analytics.sqlite3 --calls 50 --price google-gla:gemini-2.5-flash=0.3:2.5
+"""
+Offline evaluation of model tiering for the two analysis agents.
+
+Takes stored transcripts from the analytics database and analyses each one
+several ways: on every configured tier on its own, and through the tier
+router (cheapest first, escalating on bad or doubtful output). Every mode is
+compared with the strongest tier, and the report gives agreement, latency,
+tokens, cost and the escalation rate.
+
+This calls the real models and uses quota. The transcriber is not
+evaluated because stored calls keep transcripts, not audio.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+# The calls to evaluate come from the real analytics database; read its path
+# before the stores are redirected below
+DEFAULT_DB = os.getenv("ANALYTICS_DB_PATH", ".cache/analytics.sqlite3")
+
+# Keep caches / stores of a real deployment out of the evaluation
+_EVAL_DIR = tempfile.mkdtemp(prefix="tiereval-")
+os.environ.setdefault("TRANSCRIPTION_CACHE_DIR", os.path.join(_EVAL_DIR, "transcriptions"))
+os.environ.setdefault("JOBS_DB_PATH", os.path.join(_EVAL_DIR, "jobs.sqlite3"))
+os.environ.setdefault("ANALYTICS_DB_PATH", os.path.join(_EVAL_DIR, "analytics.sqlite3"))
+
+import main
+from model_tiers import ModelTiers, overall_analysis_doubt, turn_analysis_doubt
+from models import AudioAnalysis, CallAnalysis, ConversationTurn, OverallCallAnalysisResult
+from turn_sharding import analyze_turns_sharded
+
+ROUTED = "routed"
+
+
+def load_calls(db_path: str, limit: int) -> List[AudioAnalysis]:
+    """Most recent stored transcripts, rebuilt from the turns table."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    call_ids = [row[0] for row in conn.execute(
+        "SELECT call_id FROM calls ORDER BY created_at DESC LIMIT ?", (limit,)
+    )]
+    calls = []
+    for call_id in call_ids:
+        rows = conn.execute(
+            "SELECT speaker, start_ms, end_ms, transcript, emotion FROM turns WHERE call_id = ? ORDER BY turn_index",
+            (call_id,),
+        ).fetchall()
+        calls.append(AudioAnalysis(conversation=[
+            ConversationTurn(speaker=s, startTime=start, endTime=end, transcript=text, emotion=emotion)
+            for s, start, end, text, emotion in rows
+        ]))
+    return calls
+
+
+class Usage:
+    """Latency and tokens per model for one analysis (several model calls when sharded or escalated)."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.tokens: Dict[str, Tuple[int, int]] = defaultdict(lambda: (0, 0))
+        self.escalated = False
+
+    def add(self, model: str, result) -> None:
+        usage = result.usage() if callable(result.usage) else result.usage
+        inp, out = self.tokens[model]
+        self.tokens[model] = (inp + (usage.input_tokens or 0), out + (usage.output_tokens or 0))
+
+    def cost(self, prices: Dict[str, Tuple[float, float]]) -> Optional[float]:
+        if any(model not in prices for model in self.tokens):
+            return None
+        return sum(inp * prices[m][0] / 1e6 + out * prices[m][1] / 1e6 for m, (inp, out) in self.tokens.items())
+
+
+async def run_turns(conversation: AudioAnalysis, tiers: ModelTiers, usage: Usage) -> CallAnalysis:
+    async def shard(part: AudioAnalysis) -> CallAnalysis:
+        prompt = main.analysis_prompt(part, include_times=False)
+
+        async def on_model(model: str) -> CallAnalysis:
+            if model != tiers.models[0]:
+                usage.escalated = True
+            result = await main.call_analyzer_agent.run(prompt, model=model)
+            usage.add(model, result)
+            return result.output
+
+        return await tiers.run(on_model, lambda output: turn_analysis_doubt(output, part))
+
+    started = time.perf_counter()
+    output = await analyze_turns_sharded(conversation, shard, retry_errors=main.BAD_OUTPUT_ERRORS)
+    usage.seconds = time.perf_counter() - started
+    return output
+
+
+async def run_overall(conversation: AudioAnalysis, tiers: ModelTiers, usage: Usage) -> OverallCallAnalysisResult:
+    prompt = main.analysis_prompt(conversation)
+
+    async def on_model(model: str) -> OverallCallAnalysisResult:
+        if model != tiers.models[0]:
+            usage.escalated = True
+        result = await main.overallcall_analyzer_agent.run(prompt, model=model)
+        usage.add(model, result)
+        return result.output
+
+    started = time.perf_counter()
+    output = await tiers.run(on_model, lambda output: overall_analysis_doubt(output, conversation))
+    usage.seconds = time.perf_counter() - started
+    return output
+
+
+def turn_agreement(output: CallAnalysis, reference: CallAnalysis) -> Tuple[int, int, int]:
+    """(turns, same category, same sentiment)"""
+    pairs = list(zip(output.conversation_analysis, reference.conversation_analysis))
+    return (
+        len(pairs),
+        sum(a.category == b.category for a, b in pairs),
+        sum(a.sentiment == b.sentiment for a, b in pairs),
+    )
+
+
+def keyword_overlap(output: OverallCallAnalysisResult, reference: OverallCallAnalysisResult) -> float:
+    """Jaccard similarity of the lower-cased topics_keywords."""
+    a = {k.strip().lower() for k in output.topics_keywords}
+    b = {k.strip().lower() for k in reference.topics_keywords}
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+async def evaluate(calls: List[AudioAnalysis], agents: List[str], prices: Dict[str, Tuple[float, float]],
+                   concurrency: int) -> Dict:
+    configured = {"turns": main.turn_analyzer_tiers, "overall": main.overall_analyzer_tiers}
+    runners = {"turns": run_turns, "overall": run_overall}
+    semaphore = asyncio.Semaphore(concurrency)
+    report = {}
+
+    for agent in agents:
+        router = configured[agent]
+        modes = {model: ModelTiers(router.name, [model], router.escalate_on) for model in router.models}
+        if len(router.models) > 1:
+            modes[ROUTED] = router
+        reference_mode = router.strongest
+
+        async def one(call: AudioAnalysis, tiers: ModelTiers):
+            usage = Usage()
+            async with semaphore:
+                try:
+                    return await runners[agent](call, tiers, usage), usage
+                except Exception as e:
+                    print(f"  {agent}/{'>'.join(tiers.models)}: {type(e).__name__}: {e}", file=sys.stderr)
+                    return None, usage
+
+        results = {}
+        for mode, tiers in modes.items():
+            print(f"{agent}: running {len(calls)} calls on {mode}", file=sys.stderr)
+            results[mode] = await asyncio.gather(*(one(call, tiers) for call in calls))
+
+        report[agent] = {}
+        for mode, runs in results.items():
+            ok = [(i, out, usage) for i, (out, usage) in enumerate(runs) if out is not None]
+            latencies = sorted(usage.seconds for _, _, usage in ok)
+            costs = [usage.cost(prices) for _, _, usage in ok]
+            entry = {
+                "calls": len(runs),
+                "failed": len(runs) - len(ok),
+                "p50_seconds": statistics.median(latencies) if latencies else None,
+                "p95_seconds": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else None,
+                "input_tokens": sum(inp for _, _, u in ok for inp, _ in u.tokens.values()),
+                "output_tokens": sum(out for _, _, u in ok for _, out in u.tokens.values()),
+                "cost_usd": sum(costs) if costs and None not in costs else None,
+            }
+            if mode == ROUTED:
+                entry["escalation_rate"] = sum(u.escalated for _, _, u in ok) / len(ok) if ok else None
+            if mode != reference_mode:
+                references = results[reference_mode]
+                compared = [(out, references[i][0]) for i, out, _ in ok if references[i][0] is not None]
+                if agent == "turns":
+                    totals = [turn_agreement(out, ref) for out, ref in compared]
+                    turns = sum(t[0] for t in totals)
+                    entry["category_agreement"] = sum(t[1] for t in totals) / turns if turns else None
+                    entry["sentiment_agreement"] = sum(t[2] for t in totals) / turns if turns else None
+                else:
+                    overlaps = [keyword_overlap(out, ref) for out, ref in compared]
+                    entry["keyword_overlap"] = statistics.mean(overlaps) if overlaps else None
+            report[agent][mode] = entry
+    return report
+
+
+def print_report(report: Dict) -> None:
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else "-".rjust(int(spec.split(".")[0]))
+
+    for agent, modes in report.items():
+        agreement_key = "category_agreement" if agent == "turns" else "keyword_overlap"
+        print(f"\n{agent} analyzer")
+        print(f"{'mode':<40} {'fail':>5} {'p50 s':>7} {'p95 s':>7} {'in tok':>9} {'out tok':>8} {'cost $':>8} "
+              f"{'agree':>6} {'sent.':>6} {'esc.':>5}")
+        for mode, e in modes.items():
+            print(f"{mode:<40} {e['failed']:>5} {fmt(e['p50_seconds'], '7.2f')} {fmt(e['p95_seconds'], '7.2f')} "
+                  f"{e['input_tokens']:>9} {e['output_tokens']:>8} {fmt(e['cost_usd'], '8.4f')} "
+                  f"{fmt(e.get(agreement_key), '6.1%')} {fmt(e.get('sentiment_agreement'), '6.1%')} "
+                  f"{fmt(e.get('escalation_rate'), '5.0%')}")
+    print("\nAgreement is measured against the strongest tier (turns: category / sentiment; overall: keyword Jaccard).")
+
+
+def parse_price(value: str) -> Tuple[str, Tuple[float, float]]:
+    model, _, rates = value.rpartition("=")
+    input_rate, _, output_rate = rates.partition(":")
+    return model, (float(input_rate), float(output_rate or input_rate))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DEFAULT_DB, help="Analytics SQLite database with stored calls")
+    parser.add_argument("--calls", type=int, default=50, help="Most recent N stored calls")
+    parser.add_argument("--agents", default="turns,overall", help="Comma-separated: turns, overall")
+    parser.add_argument("--concurrency", type=int, default=4, help="Calls analysed at once per mode")
+    parser.add_argument("--price", action="append", type=parse_price, default=[],
+                        help="MODEL=INPUT:OUTPUT USD per 1M tokens (repeatable); cost is shown when all models are priced")
+    parser.add_argument("--json", help="Also write the report to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    calls = load_calls(args.db, args.calls)
+    if not calls:
+        sys.exit(f"No stored calls in {args.db}")
+    report = asyncio.run(evaluate(calls, args.agents.split(","), dict(args.price), args.concurrency))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
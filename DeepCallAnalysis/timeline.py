@@ -0,0 +1,147 @@
+# timeline.py
+import heapq
+from bisect import bisect_left
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from models import ConversationTurn
+
+
+def sweep_order(start: np.ndarray, end: np.ndarray, group: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Chronological order of turns (by group, start, end) and the running maximum
+    of end times in that order, restarting at each group. The running max-end at
+    a turn is the end of the floor it starts on: anything before it is over.
+    """
+    if group is None:
+        group = np.zeros(len(start), dtype=np.int64)
+    order = np.lexsort((end, start, group))
+    end, group = end[order], group[order]
+    # Offsetting each group by a constant larger than any timestamp lets one
+    # global maximum.accumulate respect group boundaries.
+    span = int(end.max()) + 1 if len(end) else 1
+    max_end = np.maximum.accumulate(end + group * span) - group * span
+    return order, max_end
+
+
+class _Node:
+    """Centered interval tree node: the intervals containing `center`, sorted both ways."""
+
+    __slots__ = ("center", "by_start", "by_end", "left", "right")
+
+    def __init__(self, center: int, here: List[Tuple[int, int, int]]):
+        self.center = center
+        self.by_start = sorted(here)  # (start, end, index), ascending start
+        self.by_end = sorted(here, key=lambda iv: -iv[1])  # descending end
+        self.left: Optional["_Node"] = None
+        self.right: Optional["_Node"] = None
+
+
+def _build(intervals: List[Tuple[int, int, int]]) -> Optional[_Node]:
+    """
+    Centers are median start times, so each side holds at most half of the
+    intervals and the tree is O(log n) deep.
+    """
+    if not intervals:
+        return None
+    starts = sorted(iv[0] for iv in intervals)
+    center = starts[len(starts) // 2]
+    left = [iv for iv in intervals if iv[1] <= center]
+    right = [iv for iv in intervals if iv[0] > center]
+    node = _Node(center, [iv for iv in intervals if iv[0] <= center < iv[1]])
+    node.left = _build(left)
+    node.right = _build(right)
+    return node
+
+
+class TurnTimeline:
+    """
+    Interval index over a call's turns (half-open [startTime, endTime) in ms).
+
+    A centered interval tree answers "active at t" and range queries in
+    O(log n + k) for k results, however long the individual turns are. Query
+    results are indices into the original turn list, in start order, which
+    keeps them aligned with CallAnalysis. Zero-length turns are never active.
+    """
+
+    def __init__(self, turns: Sequence[ConversationTurn]):
+        self.turns = turns
+        starts = np.fromiter((t.startTime for t in turns), dtype=np.int64, count=len(turns))
+        ends = np.fromiter((t.endTime for t in turns), dtype=np.int64, count=len(turns))
+        order, max_end = sweep_order(starts, ends)
+        self._order: List[int] = order.tolist()
+        self._starts: List[int] = starts[order].tolist()
+        self._ends: List[int] = ends[order].tolist()
+        self._last_end = int(max_end[-1]) if len(max_end) else 0
+        # Position of each turn in start order, to sort query results
+        self._rank = [0] * len(turns)
+        for k, i in enumerate(self._order):
+            self._rank[i] = k
+        self._root = _build([
+            (start, end, i) for start, end, i in zip(self._starts, self._ends, self._order) if end > start
+        ])
+
+    def __len__(self):
+        return len(self._order)
+
+    def active_at(self, t_ms: int) -> List[int]:
+        """Indices of turns with startTime <= t_ms < endTime, in start order."""
+        return self.overlapping(t_ms, t_ms + 1)
+
+    def overlapping(self, start_ms: int, end_ms: int) -> List[int]:
+        """Indices of turns that intersect [start_ms, end_ms), in start order."""
+        hits = []
+        if end_ms <= start_ms:
+            return hits
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if end_ms <= node.center:
+                # Every interval here ends after the center, so it overlaps iff it starts before end_ms
+                for start, _, i in node.by_start:
+                    if start >= end_ms:
+                        break
+                    hits.append(i)
+                stack.append(node.left)
+            elif start_ms > node.center:
+                # Every interval here starts at or before the center, so it overlaps iff it ends after start_ms
+                for _, end, i in node.by_end:
+                    if end <= start_ms:
+                        break
+                    hits.append(i)
+                stack.append(node.right)
+            else:
+                hits.extend(i for _, _, i in node.by_start)
+                stack.append(node.left)
+                stack.append(node.right)
+        hits.sort(key=self._rank.__getitem__)
+        return hits
+
+    def starting_between(self, start_ms: int, end_ms: int) -> List[int]:
+        """Indices of turns whose startTime falls in [start_ms, end_ms)."""
+        lo = bisect_left(self._starts, start_ms)
+        hi = bisect_left(self._starts, end_ms)
+        return self._order[lo:hi]
+
+    def overlaps(self) -> List[Tuple[int, int]]:
+        """
+        All pairs of turns whose intervals overlap, as (earlier, later) index pairs.
+        Single sweep over the start-sorted turns with a heap of active end times.
+        """
+        pairs = []
+        active: List[Tuple[int, int]] = []  # (endTime, turn index)
+        for start, end, idx in zip(self._starts, self._ends, self._order):
+            if end <= start:
+                continue
+            while active and active[0][0] <= start:
+                heapq.heappop(active)
+            pairs.extend((other, idx) for _, other in active)
+            heapq.heappush(active, (end, idx))
+        return pairs
+
+    def last_end(self) -> int:
+        """End of the latest turn (0 for an empty call)."""
+        return self._last_end
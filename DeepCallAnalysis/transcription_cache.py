@@ -0,0 +1,92 @@
+# transcription_cache.py
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from models import AudioAnalysis
+
+logger = logging.getLogger(__name__)
+
+
+def prompt_version(prompt: str) -> str:
+    """Short, stable fingerprint of a system prompt so prompt edits invalidate old entries."""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+
+
+class TranscriptionCache:
+    """
+    Content-addressed cache of AudioAnalysis results.
+
+    Two tiers: a bounded in-memory LRU in front of a directory of JSON files.
+    Keys combine the audio digest with the model name, prompt version and audio
+    preprocessing settings, so the same recording transcribed by a different
+    model or prompt, or sent to the model differently, is a miss.
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = 256):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[str, AudioAnalysis]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(digest: str, model_name: str, prompt_version: str, preprocessing: str = "raw") -> str:
+        return hashlib.sha256(f"{digest}:{model_name}:{prompt_version}:{preprocessing}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        # Two-character fan-out keeps directories small on large caches
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[AudioAnalysis]:
+        with self._lock:
+            analysis = self._memory.get(key)
+            if analysis is not None:
+                self._memory.move_to_end(key)
+                return analysis
+
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                analysis = AudioAnalysis.model_validate_json(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            # A corrupt entry is treated as a miss; the next put() overwrites it
+            logger.warning(f"Ignoring unreadable cache entry {path}: {e}")
+            return None
+
+        self._remember(key, analysis)
+        return analysis
+
+    def put(self, key: str, analysis: AudioAnalysis) -> None:
+        """Blocking (writes a file); call it with asyncio.to_thread from async code."""
+        self._remember(key, analysis)
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(analysis.model_dump_json())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to persist cache entry {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _remember(self, key: str, analysis: AudioAnalysis) -> None:
+        with self._lock:
+            self._memory[key] = analysis
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._memory.clear()
@@ -0,0 +1,370 @@
+# turn_classifier.py
+import logging
+import os
+import random
+import re
+import unicodedata
+from collections import deque
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from models import AudioAnalysis, CallAnalysis, ConversationTurn, TurnAnalysis, TurnCategory, TurnSentiment
+from observability import PRECLASSIFIER_AGREEMENT, PRECLASSIFIER_TURNS
+
+logger = logging.getLogger(__name__)
+
+PRECLASSIFIER_ENABLED = os.getenv("PRECLASSIFIER_ENABLED", "true").lower() in ("1", "true", "yes")
+# Turns classified locally with less confidence than this are sent to the model.
+PRECLASSIFIER_MIN_CONFIDENCE = float(os.getenv("PRECLASSIFIER_MIN_CONFIDENCE", "0.85"))
+# Share of locally classified turns that are also sent to the model to measure agreement.
+PRECLASSIFIER_SHADOW_RATE = float(os.getenv("PRECLASSIFIER_SHADOW_RATE", "0.05"))
+# Competitor brand names; mentioning one counts as a churn indicator.
+PRECLASSIFIER_COMPETITORS = [
+    name.strip() for name in os.getenv("PRECLASSIFIER_COMPETITORS", "").split(",") if name.strip()
+]
+# Turns up to this many words made only of greeting / thanks / acknowledgement words are small talk.
+SHORT_TURN_WORDS = int(os.getenv("PRECLASSIFIER_SHORT_TURN_WORDS", "6"))
+
+
+# --- Text Normalisation ---
+
+_ARABIC_DIACRITICS = re.compile(r"[ً-ٰٟـ]")  # harakat, dagger alef, tatweel
+_ARABIC_LETTERS = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ى": "ي", "ة": "ه", "ؤ": "و", "ئ": "ي"})
+_ARABIC_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+_PUNCTUATION = re.compile(r"[^\w\s@.+-]|(?<!\w)[.+-]|[.+-](?!\w)")
+_NON_ASCII_LETTER = re.compile(r"[^\W\d_a-zA-Z]")
+
+
+def normalize(text: str) -> str:
+    """Case-folded, punctuation-free, single-spaced text with Arabic letter variants and digits unified."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _ARABIC_DIACRITICS.sub("", text).translate(_ARABIC_LETTERS).translate(_ARABIC_DIGITS)
+    text = text.replace("’", "'").replace("'", "")
+    return " ".join(_PUNCTUATION.sub(" ", text).split())
+
+
+# --- Aho-Corasick Automaton ---
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over normalised phrases: every occurrence of every
+    phrase in one pass over the text, independent of the number of phrases.
+    Matches must start and end on word boundaries.
+    """
+
+    def __init__(self, phrases: Iterable[Tuple[str, str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, str]]] = [[]]
+        for phrase, label in phrases:
+            phrase = normalize(phrase)
+            if not phrase:
+                continue
+            state = 0
+            for char in phrase:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._out[state].append((len(phrase), label))
+
+        # Breadth-first failure links; each state inherits the outputs of its failure state
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """(start, end, label) of each word-bounded match in already-normalised `text`."""
+        matches = []
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for length, label in self._out[state]:
+                start, end = i + 1 - length, i + 1
+                if (start == 0 or text[start - 1] == " ") and (end == len(text) or text[end] == " "):
+                    matches.append((start, end, label))
+        return matches
+
+
+# --- Lexicons ---
+# English and Arabic (MSA and Egyptian). Phrases are normalised when the automaton is built.
+
+_CATEGORY_PHRASES = {
+    TurnCategory.churn: [
+        "cancel my", "cancel the subscription", "cancel my subscription", "close my account", "terminate my",
+        "terminate the contract", "switch to another", "switching to", "move to another provider", "port my number",
+        "want to cancel", "going to cancel", "leave your company", "leaving your company", "leaving you",
+        "not renewing", "end my contract", "unsubscribe",
+        "الغاء الاشتراك", "الغي الاشتراك", "عايز الغي", "اقفل الحساب", "اقفل الخط", "الغي الخط", "هحول على",
+        "هنقل على", "انتقل الى شركه", "مش هجدد",
+    ],
+    TurnCategory.complaint: [
+        "i want to complain", "file a complaint", "make a complaint", "this is unacceptable", "unacceptable",
+        "ridiculous", "worst service", "overcharged", "you charged me twice", "nobody helped", "third time calling",
+        "شكوي", "عايز اشتكي", "اقدم شكوي", "مش مقبول", "اسوا خدمه", "خصمتوا مني", "تالت مره اتصل",
+    ],
+    TurnCategory.product: [
+        "not working", "doesnt work", "stopped working", "no signal", "no internet", "internet is slow",
+        "slow internet", "keeps disconnecting", "keeps dropping", "error message", "outage", "cant log in",
+        "app crashes", "مش شغال", "النت بطيء", "النت فاصل", "مفيش شبكه", "الشبكه واقعه", "عطل", "بيفصل",
+        "رساله خطا",
+    ],
+    TurnCategory.suggestion: [
+        "i suggest", "my suggestion", "you should add", "it would be better if", "why dont you", "you could improve",
+        "اقترح", "اقتراحي", "ياريت تعملوا", "ياريت يكون", "المفروض تعملوا",
+    ],
+}
+
+# Phrases that introduce personal data; only count when digits or an email follow in the same turn
+_PII_TRIGGERS = [
+    "card number", "credit card", "account number", "national id", "id number", "date of birth", "my email is",
+    "my phone number is", "my number is", "password", "iban", "رقم البطاقه", "الرقم القومي", "رقم الحساب",
+    "تاريخ الميلاد", "رقم التليفون", "رقمي", "الباسورد",
+]
+
+_SENTIMENT_WORDS = {
+    TurnSentiment.positive: [
+        "thank you", "thanks", "great", "excellent", "perfect", "appreciate", "happy", "wonderful", "amazing",
+        "helpful", "good", "awesome", "شكرا", "متشكر", "ممتاز", "تمام", "جميل", "حلو", "الله يخليك",
+    ],
+    TurnSentiment.negative: [
+        "angry", "terrible", "worst", "unacceptable", "frustrated", "disappointed", "bad", "horrible",
+        "ridiculous", "annoyed", "upset", "useless", "problem", "زعلان", "سيء", "وحش", "زهقت", "مش معقول",
+        "مشكله", "حرام عليكم",
+    ],
+}
+_NEGATORS = {"not", "no", "never", "dont", "isnt", "wasnt", "arent", "cant", "مش", "لا", "مو", "ما"}
+
+# Complete small-talk turns in other languages, with their translation (English turns translate to themselves)
+_FORMULAS = {
+    "شكرا": ("Thank you", TurnSentiment.positive),
+    "شكرا جزيلا": ("Thank you very much", TurnSentiment.positive),
+    "شكرا مع السلامه": ("Thank you, goodbye", TurnSentiment.positive),
+    "متشكر": ("Thank you", TurnSentiment.positive),
+    "متشكر جدا": ("Thank you very much", TurnSentiment.positive),
+    "مع السلامه": ("Goodbye", TurnSentiment.neutral),
+    "الله يسلمك": ("God keep you safe", TurnSentiment.positive),
+    "اهلا": ("Hello", TurnSentiment.neutral),
+    "اهلا وسهلا": ("Welcome", TurnSentiment.neutral),
+    "السلام عليكم": ("Peace be upon you", TurnSentiment.neutral),
+    "وعليكم السلام": ("And peace be upon you", TurnSentiment.neutral),
+    "تمام": ("Okay", TurnSentiment.neutral),
+    "ماشي": ("Okay", TurnSentiment.neutral),
+    "حاضر": ("Sure", TurnSentiment.neutral),
+    "ايوه": ("Yes", TurnSentiment.neutral),
+    "نعم": ("Yes", TurnSentiment.neutral),
+    "لا": ("No", TurnSentiment.neutral),
+    "العفو": ("You're welcome", TurnSentiment.neutral),
+    "ثانيه واحده": ("One second", TurnSentiment.neutral),
+    "لحظه من فضلك": ("One moment, please", TurnSentiment.neutral),
+}
+_FORMULAS = {normalize(text): value for text, value in _FORMULAS.items()}
+
+# English words a whole small-talk turn may consist of ("ok", "thank you, goodbye", "good morning")
+_SMALL_TALK_WORDS = {
+    "hi", "hello", "hey", "good", "morning", "afternoon", "evening", "thanks", "thank", "you", "very", "much",
+    "so", "a", "lot", "ok", "okay", "alright", "sure", "yes", "yeah", "yep", "right", "great", "perfect", "fine",
+    "bye", "goodbye", "have", "nice", "day", "welcome", "youre", "please", "one", "moment", "second", "just",
+    "sir", "madam", "mm", "hmm", "uh", "um", "got", "it", "i", "see", "understood", "understand", "cool",
+    "appreciate", "that", "and", "too", "the", "same", "to",
+}
+
+_EMAIL = re.compile(r"\b[\w.+-]+@[\w-]+\.[\w.]+\b")
+# Card-length digit runs, possibly grouped by spaces or dashes ("4111 1111 1111 1111"); must pass Luhn
+_CARD_RUN = re.compile(r"(?<!\d)\d(?:[ -]?\d){12,18}(?!\d)")
+# Ungrouped runs of phone / account / national ID length
+_LONG_NUMBER = re.compile(r"(?<!\d)\d{9,}(?!\d)")
+# Grouped phone numbers: "010-1234-5678", "+20 100 123 4567", "(02) 2345 6789"
+_PHONE = re.compile(r"(?:\+\d{1,3}[ -]?)?\(?\d{2,4}\)?[ -]\d{3,4}[ -]\d{4}(?!\d)")
+
+
+def _luhn_valid(digits: str) -> bool:
+    total = 0
+    for i, digit in enumerate(reversed(digits)):
+        value = int(digit) * (2 if i % 2 else 1)
+        total += value - 9 if value > 9 else value
+    return total % 10 == 0
+
+
+# --- Classifier ---
+
+class LocalClassification:
+    """Pre-classifier verdict for one turn; translation is None when it cannot be produced locally."""
+
+    def __init__(self, category: TurnCategory, sentiment: TurnSentiment, confidence: float,
+                 translation: Optional[str], reason: str):
+        self.category = category
+        self.sentiment = sentiment
+        self.confidence = confidence
+        self.translation = translation
+        self.reason = reason
+
+    def to_turn_analysis(self) -> TurnAnalysis:
+        return TurnAnalysis(category=self.category, sentiment=self.sentiment, translation=self.translation)
+
+
+class TurnPreClassifier:
+    """
+    Rule and lexicon first pass over turns:
+
+    * PII: e-mail addresses, Luhn-valid card numbers, phone-formatted or long
+      ungrouped numbers, or a PII
+      phrase ("card number", "رقم البطاقه") followed by digits.
+    * Category phrases (churn, complaint, product issue, suggestion, competitor
+      names) found with one Aho-Corasick pass; exactly one category must match,
+      and a negated phrase ("not going to cancel") sends the turn to the model.
+    * Short turns made only of greeting, thanks or acknowledgement words ("ok",
+      "thank you, goodbye") are category None; other short turns go to the model.
+    * Sentiment from a word lexicon with negation ("not happy").
+
+    Only turns whose translation is trivial are resolved: English turns (the
+    translation is the transcript) and whole-turn formulas such as "شكرا مع السلامه".
+    """
+
+    def __init__(self, competitors: Iterable[str] = PRECLASSIFIER_COMPETITORS):
+        self._categories = KeywordAutomaton(
+            [(phrase, category.value) for category, phrases in _CATEGORY_PHRASES.items() for phrase in phrases]
+            + [(name, TurnCategory.churn.value) for name in competitors]
+        )
+        self._pii = KeywordAutomaton((phrase, TurnCategory.pii.value) for phrase in _PII_TRIGGERS)
+        self._sentiment = KeywordAutomaton(
+            (word, sentiment.value) for sentiment, words in _SENTIMENT_WORDS.items() for word in words
+        )
+
+    def _has_pii(self, text: str) -> bool:
+        if _EMAIL.search(text):
+            return True
+        if any(_luhn_valid(re.sub(r"\D", "", run)) for run in _CARD_RUN.findall(text)):
+            return True
+        if _LONG_NUMBER.search(text) or _PHONE.search(text):
+            return True
+        for _, end, _ in self._pii.find(text):
+            if re.search(r"\d{4,}|@", text[end:]):
+                return True
+        return False
+
+    @staticmethod
+    def _negated(text: str, start: int) -> bool:
+        """True if one of the two words before `start` is a negator ("not happy", "not going to cancel")."""
+        return any(word in _NEGATORS for word in text[:start].split()[-2:])
+
+    def _sentiment_score(self, text: str) -> int:
+        score = 0
+        for start, _, label in self._sentiment.find(text):
+            sign = -1 if self._negated(text, start) else 1
+            score += sign if label == TurnSentiment.positive.value else -sign
+        return score
+
+    def classify(self, transcript: str) -> Optional[LocalClassification]:
+        text = normalize(transcript)
+        if not text:
+            return None
+        if text in _FORMULAS:
+            translation, sentiment = _FORMULAS[text]
+            return LocalClassification(TurnCategory.none, sentiment, 0.95, translation, "formula")
+        if _NON_ASCII_LETTER.search(text):
+            return None  # needs a real translation
+
+        translation = transcript.strip()
+        score = self._sentiment_score(text)
+        sentiment = (
+            TurnSentiment.positive if score > 0 else TurnSentiment.negative if score < 0 else TurnSentiment.neutral
+        )
+        if self._has_pii(text):
+            return LocalClassification(TurnCategory.pii, sentiment, 0.95, translation, "pii")
+
+        matches = self._categories.find(text)
+        if any(self._negated(text, start) for start, _, _ in matches):
+            return None  # "I'm not going to cancel" - let the model decide
+        categories = {TurnCategory(label) for _, _, label in matches}
+        if len(categories) == 1:
+            category = categories.pop()
+            if category != TurnCategory.suggestion and sentiment == TurnSentiment.positive:
+                return None  # "thanks, the internet is not working anymore?" - let the model decide
+            return LocalClassification(category, sentiment, 0.85, translation, "keyword")
+        if categories:
+            return None  # several categories: ambiguous
+
+        # Only explicit pleasantries; any other short turn ("my bill is wrong") goes to the model
+        words = text.split()
+        if len(words) <= SHORT_TURN_WORDS and set(words) <= _SMALL_TALK_WORDS and sentiment != TurnSentiment.negative:
+            return LocalClassification(TurnCategory.none, sentiment, 0.9, translation, "small_talk")
+        return None
+
+
+default_classifier = TurnPreClassifier()
+
+
+# --- Pipeline Integration ---
+
+async def analyze_with_preclassifier(
+    conversation: AudioAnalysis,
+    analyze_turns: Callable[[AudioAnalysis], Awaitable[CallAnalysis]],
+    classifier: TurnPreClassifier = default_classifier,
+    min_confidence: float = PRECLASSIFIER_MIN_CONFIDENCE,
+    shadow_rate: float = PRECLASSIFIER_SHADOW_RATE,
+    enabled: bool = PRECLASSIFIER_ENABLED,
+) -> CallAnalysis:
+    """
+    Classifies what it can locally and sends only the remaining turns to
+    `analyze_turns`, then merges both back in turn order. A `shadow_rate`
+    sample of the local verdicts is also sent to the model; those turns use
+    the model's answer and feed the agreement metric.
+    """
+    turns = conversation.conversation
+    if not enabled:
+        return await analyze_turns(conversation)
+
+    local = {
+        i: verdict
+        for i, verdict in enumerate(preclassify_turns(turns, classifier, min_confidence))
+        if verdict is not None
+    }
+    shadow = [i for i in local if random.random() < shadow_rate]
+
+    forwarded = [i for i in range(len(turns)) if i not in local or i in shadow]
+    PRECLASSIFIER_TURNS.labels("local").inc(len(turns) - len(forwarded))
+    PRECLASSIFIER_TURNS.labels("forwarded").inc(len(forwarded) - len(shadow))
+    PRECLASSIFIER_TURNS.labels("shadow").inc(len(shadow))
+    logger.info(f"Pre-classifier resolved {len(turns) - len(forwarded)}/{len(turns)} turns locally "
+                f"({len(shadow)} shadowed)")
+
+    remote: Dict[int, TurnAnalysis] = {}
+    if forwarded:
+        result = await analyze_turns(AudioAnalysis(conversation=[turns[i] for i in forwarded]))
+        remote = dict(zip(forwarded, result.conversation_analysis))
+    for i in shadow:
+        record_agreement(local[i], remote[i])
+
+    return CallAnalysis(conversation_analysis=[
+        remote[i] if i in remote else local[i].to_turn_analysis() for i in range(len(turns))
+    ])
+
+
+def record_agreement(local: LocalClassification, model: TurnAnalysis) -> Tuple[bool, bool]:
+    """Counts whether the local category / sentiment matched the model's; returns both outcomes."""
+    category_agrees = local.category == model.category
+    sentiment_agrees = local.sentiment == model.sentiment
+    PRECLASSIFIER_AGREEMENT.labels("category", local.reason, "agree" if category_agrees else "disagree").inc()
+    PRECLASSIFIER_AGREEMENT.labels("sentiment", local.reason, "agree" if sentiment_agrees else "disagree").inc()
+    return category_agrees, sentiment_agrees
+
+
+def preclassify_turns(turns: List[ConversationTurn], classifier: TurnPreClassifier = default_classifier,
+                      min_confidence: float = PRECLASSIFIER_MIN_CONFIDENCE) -> List[Optional[LocalClassification]]:
+    """Local verdict per turn (None where the model is needed); used by the offline evaluation."""
+    verdicts = []
+    for turn in turns:
+        verdict = classifier.classify(turn.transcript)
+        verdicts.append(verdict if verdict is not None and verdict.confidence >= min_confidence else None)
+    return verdicts
@@ -0,0 +1,72 @@
+# turn_sharding.py
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, List, Tuple, Type
+
+from models import AudioAnalysis, CallAnalysis, TurnAnalysis
+
+logger = logging.getLogger(__name__)
+
+TURN_SHARD_SIZE = int(os.getenv("TURN_SHARD_SIZE", "25"))
+TURN_SHARD_CONCURRENCY = int(os.getenv("TURN_SHARD_CONCURRENCY", "8"))
+# Extra attempts for a shard whose output does not line up with its input turns.
+TURN_SHARD_RETRIES = int(os.getenv("TURN_SHARD_RETRIES", "2"))
+
+
+class ShardCountMismatch(Exception):
+    """The model returned a different number of TurnAnalysis items than turns it was given."""
+
+    def __init__(self, shard_index: int, expected: int, received: int):
+        self.shard_index = shard_index
+        self.expected = expected
+        self.received = received
+        super().__init__(f"Shard {shard_index}: expected {expected} turn analyses, received {received}")
+
+
+def split_shards(conversation: AudioAnalysis, shard_size: int) -> List[AudioAnalysis]:
+    turns = conversation.conversation
+    return [
+        AudioAnalysis(conversation=turns[i:i + shard_size])
+        for i in range(0, len(turns), shard_size)
+    ]
+
+
+async def analyze_turns_sharded(
+    conversation: AudioAnalysis,
+    analyze_shard: Callable[[AudioAnalysis], Awaitable[CallAnalysis]],
+    shard_size: int = TURN_SHARD_SIZE,
+    max_concurrency: int = TURN_SHARD_CONCURRENCY,
+    retries: int = TURN_SHARD_RETRIES,
+    retry_errors: Tuple[Type[BaseException], ...] = (Exception,),
+) -> CallAnalysis:
+    """
+    Splits the conversation into shards of shard_size turns, analyses up to
+    max_concurrency shards at a time and concatenates the results in turn order.
+
+    Every shard's output length is checked against its input; only a shard that
+    fails (a mismatch or one of retry_errors) is re-run. Raises the last error
+    once a shard runs out of retries.
+    """
+    shards = split_shards(conversation, shard_size)
+    if not shards:
+        return CallAnalysis(conversation_analysis=[])
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    logger.info(f"Analyzing {len(conversation.conversation)} turns in {len(shards)} shards of <= {shard_size}")
+
+    async def run_shard(index: int, shard: AudioAnalysis) -> List[TurnAnalysis]:
+        async with semaphore:
+            for attempt in range(retries + 1):
+                try:
+                    result = await analyze_shard(shard)
+                    if len(result.conversation_analysis) != len(shard.conversation):
+                        raise ShardCountMismatch(index, len(shard.conversation), len(result.conversation_analysis))
+                    return result.conversation_analysis
+                except (ShardCountMismatch, *retry_errors) as e:
+                    if attempt >= retries:
+                        raise
+                    logger.warning(f"Turn shard {index} attempt {attempt + 1} failed ({type(e).__name__}: {e}); retrying")
+
+    shard_results = await asyncio.gather(*(run_shard(i, shard) for i, shard in enumerate(shards)))
+    return CallAnalysis(conversation_analysis=[turn for shard in shard_results for turn in shard])
@@ -0,0 +1,177 @@
+# windowed_transcription.py
+import asyncio
+import io
+import logging
+import os
+import wave
+from typing import Awaitable, Callable, List, Optional, Tuple, Type
+
+from models import AudioAnalysis, ConversationTurn
+
+logger = logging.getLogger(__name__)
+
+# Calls longer than this (seconds) are transcribed in windows instead of one blob.
+LONG_AUDIO_THRESHOLD_SECONDS = float(os.getenv("LONG_AUDIO_THRESHOLD_SECONDS", "600"))
+LONG_AUDIO_WINDOW_SECONDS = float(os.getenv("LONG_AUDIO_WINDOW_SECONDS", "300"))
+LONG_AUDIO_OVERLAP_SECONDS = float(os.getenv("LONG_AUDIO_OVERLAP_SECONDS", "15"))
+LONG_AUDIO_MAX_CONCURRENCY = int(os.getenv("LONG_AUDIO_MAX_CONCURRENCY", "8"))
+LONG_AUDIO_WINDOW_RETRIES = int(os.getenv("LONG_AUDIO_WINDOW_RETRIES", "1"))
+
+WAV_MEDIA_TYPES = {"audio/wav", "audio/x-wav", "audio/wave", "audio/vnd.wave"}
+
+
+# --- Windowing ---
+
+class AudioWindow:
+    """A [start, end) slice of the source audio, in seconds."""
+
+    def __init__(self, index: int, start: float, end: float):
+        self.index = index
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return f"AudioWindow(index={self.index}, start={self.start:.1f}, end={self.end:.1f})"
+
+
+def wav_duration(path: str) -> Optional[float]:
+    """Duration of a WAV file in seconds, or None if it is not a readable PCM WAV."""
+    try:
+        with wave.open(path, "rb") as wav:
+            return wav.getnframes() / float(wav.getframerate())
+    except (wave.Error, EOFError):
+        return None
+
+
+def plan_windows(duration: float, window_seconds: float, overlap_seconds: float) -> List[AudioWindow]:
+    """Splits [0, duration) into windows of window_seconds that overlap by overlap_seconds."""
+    if overlap_seconds >= window_seconds:
+        raise ValueError("overlap_seconds must be smaller than window_seconds")
+    step = window_seconds - overlap_seconds
+    windows = []
+    start = 0.0
+    while True:
+        end = min(start + window_seconds, duration)
+        windows.append(AudioWindow(len(windows), start, end))
+        if end >= duration:
+            break
+        start += step
+    return windows
+
+
+def read_wav_window(path: str, window: AudioWindow) -> bytes:
+    """Reads only the frames of one window and returns them as a standalone WAV file."""
+    with wave.open(path, "rb") as src:
+        rate = src.getframerate()
+        first = int(window.start * rate)
+        count = int((window.end - window.start) * rate)
+        src.setpos(first)
+        frames = src.readframes(count)
+        params = src.getparams()
+
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as dst:
+        dst.setparams(params)
+        dst.writeframes(frames)
+    return buf.getvalue()
+
+
+# --- Stitching ---
+
+def _normalize_text(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def stitch_windows(
+    windows: List[AudioWindow],
+    results: List[AudioAnalysis],
+    overlap_seconds: float,
+) -> AudioAnalysis:
+    """
+    Merges per-window transcriptions into one AudioAnalysis on the original timeline.
+
+    Timestamps are shifted by each window's start. Each overlap is split at its
+    midpoint and a turn is kept only by the window that owns its start time, so
+    utterances heard by two windows appear once. A text match against the last
+    kept turn catches the rare duplicate that straddles the midpoint.
+    """
+    merged: List[ConversationTurn] = []
+
+    half_overlap_ms = int(overlap_seconds * 500)
+
+    for i, (window, analysis) in enumerate(zip(windows, results)):
+        offset_ms = int(window.start * 1000)
+        owned_start = offset_ms + half_overlap_ms if i > 0 else float("-inf")
+        owned_end = int(window.end * 1000) - half_overlap_ms if i < len(windows) - 1 else float("inf")
+
+        for turn in analysis.conversation:
+            start = turn.startTime + offset_ms
+            if not (owned_start <= start < owned_end):
+                continue
+
+            if merged:
+                previous = merged[-1]
+                if (
+                    previous.speaker == turn.speaker
+                    and _normalize_text(previous.transcript) == _normalize_text(turn.transcript)
+                    and start - previous.startTime <= overlap_seconds * 1000
+                ):
+                    continue
+
+            merged.append(turn.model_copy(update={
+                "startTime": start,
+                "endTime": turn.endTime + offset_ms,
+            }))
+
+    return AudioAnalysis(conversation=merged)
+
+
+# --- Orchestration ---
+
+async def transcribe_windowed(
+    path: str,
+    duration: float,
+    transcribe_window: Callable[[bytes], Awaitable[AudioAnalysis]],
+    window_seconds: float = LONG_AUDIO_WINDOW_SECONDS,
+    overlap_seconds: float = LONG_AUDIO_OVERLAP_SECONDS,
+    max_concurrency: int = LONG_AUDIO_MAX_CONCURRENCY,
+    retries: int = LONG_AUDIO_WINDOW_RETRIES,
+    retry_errors: Tuple[Type[BaseException], ...] = (Exception,),
+) -> AudioAnalysis:
+    """
+    Transcribes a long WAV file as overlapping windows, at most max_concurrency
+    at a time, and stitches the results. Each window is read from disk only
+    when its slot opens, and a window failing with one of retry_errors is
+    retried on its own.
+    """
+    windows = plan_windows(duration, window_seconds, overlap_seconds)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    logger.info(f"Transcribing {duration:.0f}s of audio in {len(windows)} windows (concurrency={max_concurrency})")
+
+    async def run_window(window: AudioWindow) -> AudioAnalysis:
+        async with semaphore:
+            window_bytes = await asyncio.to_thread(read_wav_window, path, window)
+            for attempt in range(retries + 1):
+                try:
+                    return await transcribe_window(window_bytes)
+                except retry_errors as e:
+                    if attempt >= retries:
+                        raise
+                    logger.warning(f"{window} failed ({type(e).__name__}: {e}); retrying")
+
+    results = await asyncio.gather(*(run_window(w) for w in windows))
+    return stitch_windows(windows, list(results), overlap_seconds)
+
+
+def long_audio_duration(path: str, media_type: Optional[str]) -> Optional[float]:
+    """
+    Returns the duration in seconds if the file should use windowed mode, else None.
+    Only PCM WAV can be sliced without a decoder, so other formats always take
+    the single-request path.
+    """
+    if media_type not in WAV_MEDIA_TYPES:
+        return None
+    duration = wav_duration(path)
+    if duration is None or duration <= LONG_AUDIO_THRESHOLD_SECONDS:
+        return None
+    return duration
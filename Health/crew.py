@@ -1,14 +1,28 @@
 from crewai_tools import ScrapeWebsiteTool, SerperDevTool
+import asyncio
+import hashlib
+import json
+import logging
 import os
+import time
+from contextlib import asynccontextmanager, contextmanager
 from crewai import LLM
 from crewai import Agent, Task, Crew, Process
 from typing import List, Optional, Literal
 from crewai.tools import BaseTool
-from langchain_community.tools import DuckDuckGoSearchRun
-from fastapi import  FastAPI
-from schemas import diet, fitness, mental_wellness, general, FitnessPlan, MealPlan
+from fastapi import  FastAPI, HTTPException
+from schemas import diet, fitness, mental_wellness, general, FitnessPlan, MealPlan, full_profile, SectionResult, FullPlan
+from crew_executor import CrewBusy, CrewExecutor, CrewTimeout
+from crew_pool import CrewPool
+from search_client import SearchClient
+from nutrition import NUTRITION_ENABLED, NutritionTable
+from plan_cache import (
+    PLAN_CACHE_ENABLED, PlanCache, cacheable_inputs, canonical_diet, canonical_fitness, canonical_general, plan_key,
+)
 import uvicorn
 
+logger = logging.getLogger(__name__)
+
 
 # --------------------------------------
 # LLM
@@ -17,6 +31,9 @@ llm = LLM(model="gemini/gemini-2.0-flash",provider="google",api_key="GEMINI_API_
 
 # --------------------------------------
 # Tool
+# Shared by every agent (and every pooled crew copy): cached, rate-limited, optionally offline
+search_client = SearchClient()
+
 class MyCustomDuckDuckGoTool(BaseTool):
     name: str = "DuckDuckGo Search Tool"
     description: str = "Search the web for a given query."
@@ -24,9 +41,7 @@ class MyCustomDuckDuckGoTool(BaseTool):
     def _run(self, query: str) -> str:
         if not query.strip():
             return "Please provide a valid search query."
-        duckduckgo_tool = DuckDuckGoSearchRun(backend="auto")
-        response = duckduckgo_tool.invoke(query)
-        return response
+        return search_client.search(query)
 
     def _get_tool(self):
         # Create an instance of the tool when needed
@@ -35,6 +50,20 @@ class MyCustomDuckDuckGoTool(BaseTool):
 Duck_search = MyCustomDuckDuckGoTool()
 
 
+# Bundled food table: calorie facts without a web search, and totals checked after generation
+nutrition_table = NutritionTable() if NUTRITION_ENABLED else None
+
+class NutritionLookupTool(BaseTool):
+    name: str = "Nutrition Lookup Tool"
+    description: str = ("Look up the calories of a food, e.g. food_name='chicken breast', quantity='150 g'. "
+                        "Quantity may be in g, oz, ml, cups, tbsp, tsp or pieces; leave it empty for kcal per 100 g.")
+
+    def _run(self, food_name: str, quantity: str = "") -> str:
+        return nutrition_table.describe(food_name, quantity)
+
+nutrition_tools = [NutritionLookupTool()] if nutrition_table else []
+
+
 # --------------------------------------
 # Agents
 # Dietitian Agent
@@ -43,7 +72,7 @@ dietitian_agent = Agent(
     goal='Create personalized meal plans, recipes, and nutritional insights based on user details (preferences, allergies, goals etc) and evidence-based nutritional science.',
     backstory='A knowledgeable and empathetic AI dietitian focused on creating healthy, delicious, and achievable eating plans tailored to individual needs.',
     llm=llm,
-    tools=[Duck_search], # Can search for recipe ideas or nutritional info
+    tools=[Duck_search, *nutrition_tools], # Can search for recipe ideas; calories come from the nutrition table
     verbose=True,
     allow_delegation=False # Might delegate complex recipe searches or saving tasks
 )
@@ -92,7 +121,7 @@ meal_plan_task = Task(
         "2. Based *only* on the retrieved profile information, create a personalized 3-day meal plan f. "
         "3. Ensure the plan avoids any allergies mentioned in the profile. "
         "4. Include breakfast, lunch, dinner, and one snack per day. "
-        "5. Provide estimated calorie counts for each meal. "
+        "5. Give every food item a quantity with a unit (e.g. 150 g, 1 cup, 2 slices) and provide calorie counts for each meal, using the Nutrition Lookup Tool for calorie facts where available. "
         "6. Format the output clearly (e.g., Day 1 Breakfast: ..., Day 1 Lunch: ...). "
     ),
     expected_output=(
@@ -154,6 +183,7 @@ chronic_support_task = Task(
 
 # --------------------------------------
 # --- Define Crews ---
+# These are templates: requests run on copies from the crew pools below
 dietitian_crew = Crew(agents=[dietitian_agent],tasks=[meal_plan_task], process=Process.sequential, verbose=True)
 fitness_crew = Crew(agents=[fitness_coach_agent],tasks=[workout_plan_task],process=Process.sequential,  verbose=True)
 wellness_crew = Crew(agents=[mental_wellness_agent],tasks=[meditation_task], process=Process.sequential, verbose=True)
@@ -195,29 +225,176 @@ chronic_support_crew = Crew(agents=[chronic_support_agent],tasks=[chronic_suppor
 # print(result.pydantic)
 
 
+# --------------------------------------
+# --- Execution ---
+# kickoff blocks for the whole LLM conversation, so each crew runs in its own
+# bounded worker pool instead of on the event loop. Every worker kicks off its
+# own pre-built copy of the crew, since tasks and agents keep per-run state.
+crews = {
+    'diet': dietitian_crew,
+    'fitness': fitness_crew,
+    'mental': wellness_crew,
+    'chronic': chronic_support_crew,
+}
+executors = {name: CrewExecutor.from_env(name) for name in crews}
+pools = {name: CrewPool(name, crew.copy, size=executors[name].workers) for name, crew in crews.items()}
+
+
+async def run_crew(name: str, inputs: dict):
+    return await executors[name].run(pools[name].kickoff, inputs)
+
+
+@contextmanager
+def crew_http_errors():
+    """429 when a crew's queue is full, 504 on timeout."""
+    try:
+        yield
+    except CrewBusy as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    except CrewTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+
+# --------------------------------------
+# --- Plan Cache ---
+# Diet and fitness plans are reused for profiles that are the same once
+# canonicalised (see plan_cache.py)
+plan_models = {'diet': MealPlan, 'fitness': FitnessPlan}
+plan_cache = PlanCache() if PLAN_CACHE_ENABLED else None
+
+
+def crew_version(crew: Crew) -> str:
+    """Changes whenever a task's prompt or output schema does."""
+    parts = [
+        (task.description, task.expected_output,
+         task.output_pydantic.model_json_schema() if task.output_pydantic else None)
+        for task in crew.tasks
+    ]
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:16]
+
+
+crew_versions = {name: crew_version(crews[name]) for name in plan_models}
+
+
+def profile_key(name: str, inputs: dict) -> str:
+    profile = {'general': canonical_general(inputs['general_user'])}
+    if name == 'diet':
+        profile['diet'] = canonical_diet(inputs['diet_user'])
+    else:
+        profile['fitness'] = canonical_fitness(inputs['fitness_user'])
+    return plan_key(name, crew_versions[name], **profile)
+
+
+async def generate_plan(name: str, inputs: dict):
+    """Structured plan from a diet / fitness crew, or from the cache; None when the crew produced no plan."""
+    key = profile_key(name, inputs) if plan_cache else None
+    if key:
+        cached = plan_cache.get(name, key, plan_models[name])
+        if cached is not None:
+            return cached
+    if key:
+        # The plan will be served to everyone sharing the key, so build it from what the key sees
+        inputs = cacheable_inputs(inputs)
+    result = await run_crew(name, inputs)
+    plan = result.pydantic
+    if name == 'diet' and plan is not None and nutrition_table:
+        report = nutrition_table.correct_meal_plan(plan)
+        logger.info(f"diet: computed {report['meals_computed']}/{report['meals']} meals, corrected "
+                    f"{report['meals_corrected']} meals and {report['days_corrected']} day totals")
+    if key and plan is not None:
+        plan_cache.put(name, key, plan)
+    return plan
+
+
 # --------------------------------------
 # --- Create APIs ---
-app = FastAPI(title="Eunoia AI Health API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.gather(*(asyncio.to_thread(pool.prewarm) for pool in pools.values()))
+    yield
+    for executor in executors.values():
+        executor.shutdown()
+
+app = FastAPI(title="Eunoia AI Health API", lifespan=lifespan)
 
 @app.post("/diet-plan/")
 async def get_diet_plan(general_user:general, diet_user:diet):
-    result = dietitian_crew.kickoff(inputs={'general_user':general_user,'diet_user':diet_user})
-    return result.pydantic
+    with crew_http_errors():
+        return await generate_plan('diet', {'general_user':general_user,'diet_user':diet_user})
 
 @app.post("/fitness-plan/")
 async def get_fitness_plan(general_user:general,fitness_user:fitness):
-    result = fitness_crew.kickoff(inputs={'general_user':general_user,'fitness_user':fitness_user})
-    return result
+    with crew_http_errors():
+        return await generate_plan('fitness', {'general_user':general_user,'fitness_user':fitness_user})
 
 @app.post("/mental-support/")
 async def get_mental_support(general_user:general, wellness_user:mental_wellness):
-    result = wellness_crew.kickoff(inputs={'general_user':general_user,'wellness_user':wellness_user})
-    return result
+    with crew_http_errors():
+        return await run_crew('mental', {'general_user':general_user,'wellness_user':wellness_user})
 
 @app.post("/chronic-support/")
 async def get_chronic_support(general_user: general):
-    result = chronic_support_crew.kickoff(inputs={'general_user':general_user})
-    return result
+    with crew_http_errors():
+        return await run_crew('chronic', {'general_user':general_user})
+
+@app.get("/plan-cache/stats")
+async def get_plan_cache_stats():
+    """Hits, misses and live entries per plan kind since the server started."""
+    if plan_cache is None:
+        raise HTTPException(status_code=404, detail="Plan cache is disabled")
+    return plan_cache.stats()
+
+@app.get("/search/stats")
+async def get_search_stats():
+    """Where the agents' searches were answered from since the server started."""
+    return search_client.stats()
+
+
+# --------------------------------------
+# --- Full Plan ---
+async def run_section(name: str, inputs: dict, structured: bool) -> SectionResult:
+    """Runs one crew through its executor; failures, timeouts and a full queue are reported, not raised."""
+    started = time.perf_counter()
+    try:
+        output = await generate_plan(name, inputs) if structured else (await run_crew(name, inputs)).raw
+    except CrewBusy as e:
+        return SectionResult(status='busy', error=str(e))
+    except CrewTimeout as e:
+        return SectionResult(status='timeout', seconds=time.perf_counter() - started, error=str(e))
+    except Exception as e:
+        logger.exception(f"full-plan: {name} failed")
+        return SectionResult(status='failed', seconds=time.perf_counter() - started, error=f"{type(e).__name__}: {e}")
+    if output is None:
+        return SectionResult(status='failed', seconds=time.perf_counter() - started,
+                             error="Crew returned no structured output")
+    return SectionResult(status='ok', seconds=time.perf_counter() - started, result=output)
+
+
+async def skipped(reason: str) -> SectionResult:
+    return SectionResult(status='skipped', error=reason)
+
+
+@app.post("/full-plan/", response_model=FullPlan)
+async def get_full_plan(profile: full_profile):
+    """
+    Runs the four crews concurrently, so the response takes as long as the
+    slowest crew instead of all four together. Each section carries its own
+    status: a section is skipped when its part of the profile is missing (or,
+    for chronic support, when no chronic conditions are given), and a failed,
+    timed-out or busy crew does not affect the others.
+    """
+    general_user = profile.general_user
+    diet_section, fitness_section, mental_section, chronic_section = await asyncio.gather(
+        run_section('diet', {'general_user': general_user, 'diet_user': profile.diet_user}, True)
+        if profile.diet_user else skipped("No diet profile given"),
+        run_section('fitness', {'general_user': general_user, 'fitness_user': profile.fitness_user}, True)
+        if profile.fitness_user else skipped("No fitness profile given"),
+        run_section('mental', {'general_user': general_user, 'wellness_user': profile.wellness_user}, False)
+        if profile.wellness_user else skipped("No mental wellness profile given"),
+        run_section('chronic', {'general_user': general_user}, False)
+        if general_user.chronic_conditions else skipped("No chronic conditions given"),
+    )
+    return FullPlan(diet=diet_section, fitness=fitness_section, mental=mental_section, chronic=chronic_section)
 
 if __name__ == "__main__":
     uvicorn.run("crew:app", host="0.0.0.0", port=8000, reload=True)
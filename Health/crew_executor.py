@@ -0,0 +1,83 @@
+# crew_executor.py
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Defaults for every crew; <NAME>_CREW_WORKERS / _QUEUE / _TIMEOUT override them per crew
+CREW_WORKERS = int(os.getenv("CREW_WORKERS", "8"))
+CREW_QUEUE = int(os.getenv("CREW_QUEUE", "32"))
+CREW_TIMEOUT_SECONDS = float(os.getenv("CREW_TIMEOUT_SECONDS", "300"))
+
+
+class CrewBusy(Exception):
+    """All workers are busy and the waiting queue is full."""
+
+
+class CrewTimeout(Exception):
+    """The crew did not finish within the request timeout."""
+
+
+class CrewExecutor:
+    """
+    Runs the blocking `crew.kickoff` for one crew in its own bounded thread
+    pool, so the event loop stays free while the LLM calls are in flight.
+
+    * At most `workers` kickoffs of the crew run at once; up to `queue` more
+      wait for a free worker. Beyond that `run` raises CrewBusy right away.
+    * A caller that waits longer than `timeout` gets CrewTimeout. A kickoff
+      that already started cannot be interrupted, so it keeps its slot until
+      it finishes; one that was still queued is dropped.
+    """
+
+    def __init__(self, name: str, workers: int = CREW_WORKERS, queue: int = CREW_QUEUE,
+                 timeout: float = CREW_TIMEOUT_SECONDS):
+        self.name = name
+        self.workers = workers
+        self.queue = queue
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"crew-{name}")
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @classmethod
+    def from_env(cls, name: str) -> "CrewExecutor":
+        prefix = f"{name.upper()}_CREW"
+        return cls(
+            name,
+            workers=int(os.getenv(f"{prefix}_WORKERS", CREW_WORKERS)),
+            queue=int(os.getenv(f"{prefix}_QUEUE", CREW_QUEUE)),
+            timeout=float(os.getenv(f"{prefix}_TIMEOUT", CREW_TIMEOUT_SECONDS)),
+        )
+
+    @property
+    def pending(self) -> int:
+        """Kickoffs running or waiting for a worker."""
+        return self._pending
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn: Callable[..., T], *args, timeout: Optional[float] = None, **kwargs) -> T:
+        with self._lock:
+            if self._pending >= self.workers + self.queue:
+                raise CrewBusy(f"{self.name} crew is busy ({self._pending} requests in progress)")
+            self._pending += 1
+        future = self._pool.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._release)
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self.name} crew: no result after {timeout:g}s")
+            raise CrewTimeout(f"{self.name} crew did not finish within {timeout:g} seconds") from None
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
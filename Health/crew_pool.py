@@ -0,0 +1,74 @@
+# crew_pool.py
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, List
+
+from crewai import Crew
+
+logger = logging.getLogger(__name__)
+
+
+def reset_crew(crew: Crew) -> None:
+    """Clears what a kickoff leaves behind on the crew's tasks and agents."""
+    for task in crew.tasks:
+        task.output = None
+    for agent in crew.agents:
+        if getattr(agent, "tools_results", None):
+            agent.tools_results = []
+
+
+class CrewPool:
+    """
+    Pre-built copies of one crew, so concurrent kickoffs never share Task or
+    Agent state and requests do not pay for building a crew.
+
+    * `checkout` hands out an idle copy for exclusive use, or builds a new one
+      when all copies are busy.
+    * A copy is reset and returned to the pool after a successful kickoff.
+      One whose kickoff raised is thrown away, since it may be half-updated.
+    * At most `size` idle copies are kept; extras built under load are dropped.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Crew], size: int):
+        self.name = name
+        self.factory = factory
+        self.size = size
+        self._idle: List[Crew] = []
+        self._lock = threading.Lock()
+        self.built = 0
+
+    def _build(self) -> Crew:
+        crew = self.factory()
+        with self._lock:
+            self.built += 1
+        return crew
+
+    def prewarm(self) -> None:
+        """Fills the pool up to `size` idle copies."""
+        missing = self.size - len(self._idle)
+        fresh = [self._build() for _ in range(missing)]
+        with self._lock:
+            self._idle.extend(fresh[:self.size - len(self._idle)])
+        logger.info(f"{self.name} crew pool: {len(self._idle)} copies ready")
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    @contextmanager
+    def checkout(self) -> Iterator[Crew]:
+        with self._lock:
+            crew = self._idle.pop() if self._idle else None
+        if crew is None:
+            crew = self._build()
+        yield crew  # an exception from the kickoff propagates and the copy is discarded
+        reset_crew(crew)
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(crew)
+
+    def kickoff(self, inputs: dict):
+        """Blocking; run it in the crew's executor."""
+        with self.checkout() as crew:
+            return crew.kickoff(inputs=inputs)
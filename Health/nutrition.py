@@ -0,0 +1,274 @@
+# nutrition.py
+import csv
+import logging
+import os
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import List, Optional
+
+from schemas import FoodItem, Meal, MealPlan
+
+logger = logging.getLogger(__name__)
+
+NUTRITION_ENABLED = os.getenv("NUTRITION_ENABLED", "true").lower() in ("1", "true", "yes")
+NUTRITION_TABLE = os.getenv("NUTRITION_TABLE", os.path.join(os.path.dirname(__file__), "data", "foods.csv"))
+# How close a food name must be to a table entry (0-1) to use its calories
+NUTRITION_MIN_SIMILARITY = float(os.getenv("NUTRITION_MIN_SIMILARITY", "0.6"))
+
+_SCHEMA = """
+CREATE TABLE foods (
+    food_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    kcal_per_100g REAL NOT NULL,
+    unit_g REAL,
+    cup_g REAL
+);
+CREATE TABLE food_names (
+    name TEXT PRIMARY KEY,
+    food_id INTEGER NOT NULL REFERENCES foods (food_id)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE food_names_fts USING fts5(name, food_id UNINDEXED, tokenize = 'porter unicode61');
+"""
+
+_WORD = re.compile(r"[a-z]+")
+
+# --- Quantities ---
+_FRACTIONS = {"½": 0.5, "⅓": 1 / 3, "⅔": 2 / 3, "¼": 0.25, "¾": 0.75}
+_AMOUNT = re.compile(
+    r"^\s*(?P<a>\d+(?:\.\d+)?)(?:\s+(?P<b>\d+)/(?P<c>\d+)|/(?P<d>\d+))?"
+    r"(?:\s*(?:-|to)\s*(?P<e>\d+(?:\.\d+)?))?\s*(?P<rest>.*)$"
+)
+_GRAMS = {
+    "g": 1, "gr": 1, "gram": 1, "grams": 1, "kg": 1000, "kilogram": 1000, "kilograms": 1000,
+    "oz": 28.35, "ounce": 28.35, "ounces": 28.35, "lb": 453.6, "lbs": 453.6, "pound": 453.6, "pounds": 453.6,
+}
+_MILLILITRES = {"ml": 1, "millilitre": 1, "milliliter": 1, "millilitres": 1, "milliliters": 1,
+                "l": 1000, "litre": 1000, "liter": 1000, "litres": 1000, "liters": 1000}
+_CUPS = {"cup": 1, "cups": 1, "tbsp": 1 / 16, "tablespoon": 1 / 16, "tablespoons": 1 / 16,
+         "tsp": 1 / 48, "teaspoon": 1 / 48, "teaspoons": 1 / 48}
+_SIZES = {"small": 0.75, "medium": 1.0, "large": 1.25}
+# An explicit weight anywhere in the quantity wins: '1 fillet (150g)'
+_WEIGHT = re.compile(r"(\d+(?:\.\d+)?)\s*(g|grams?|kg|oz|ounces?|lbs?|pounds?)\b")
+# Dishes made of several foods ('yogurt with berries') cannot be costed as one food
+_COMBINED = re.compile(r"\b(?:with|and|plus|topped)\b|[&,+]")
+_HANDFUL_G = 30
+# Words that describe how a food is prepared or served, not what it is: 'grilled chicken breast'
+_DESCRIPTORS = {
+    "a", "an", "of", "the", "fresh", "raw", "cooked", "grilled", "baked", "boiled", "steamed", "roasted",
+    "sauteed", "poached", "scrambled", "toasted", "sliced", "chopped", "diced", "mashed", "shredded", "plain",
+    "organic", "natural", "unsweetened", "frozen", "ripe", "lean", "skinless", "boneless", "fillet", "fillets",
+    "slice", "slices", "piece", "pieces", "serving", "portion", "cup", "cups", "bowl", "small", "medium", "large",
+    "low", "fat", "nonfat", "reduced", "light", "extra", "virgin",
+}
+# Spelling variants of one word ('blueberry' / 'blueberries') are at least this similar
+_SAME_WORD = 0.8
+_NEGLIGIBLE = re.compile(r"\b(?:to taste|pinch|dash|sprinkle|as needed)\b")
+
+
+@dataclass
+class Food:
+    name: str
+    kcal_per_100g: float
+    unit_g: Optional[float]
+    cup_g: Optional[float]
+
+
+@dataclass
+class ItemCalories:
+    item: FoodItem
+    food: Optional[Food]
+    grams: Optional[float]
+    calories: Optional[float]
+
+
+def parse_amount(quantity: str):
+    """('2 1/2 cups' -> (2.5, 'cups')); ranges ('2-3 eggs') use the midpoint."""
+    for symbol, value in _FRACTIONS.items():
+        quantity = quantity.replace(symbol, f" {value} ")
+    match = _AMOUNT.match(quantity.lower())
+    if not match:
+        return 1.0, quantity.lower().strip()
+    amount = float(match["a"])
+    if match["b"]:
+        amount += float(match["b"]) / float(match["c"])
+    elif match["d"]:
+        amount /= float(match["d"])
+    if match["e"]:
+        amount = (amount + float(match["e"])) / 2
+    return amount, match["rest"].strip()
+
+
+def quantity_grams(quantity: Optional[str], food: Food) -> Optional[float]:
+    """Weight of a FoodItem quantity such as '150 g', '1/2 cup', '2 large' or '2 slices'; None if unknown."""
+    if not quantity or not quantity.strip():
+        return None
+    if _NEGLIGIBLE.search(quantity.lower()):
+        return 0.0
+    weight = _WEIGHT.search(quantity.lower())
+    if weight:
+        return float(weight[1]) * _GRAMS[weight[2]]
+    amount, rest = parse_amount(quantity)
+    words = rest.replace(".", " ").replace("(", " ").split()
+    unit = words[0] if words else ""
+    if unit in _GRAMS:
+        return amount * _GRAMS[unit]
+    if unit in _MILLILITRES:
+        # Liquids are weighed via their cup weight (a cup is 240 ml)
+        return amount * _MILLILITRES[unit] * (food.cup_g / 240 if food.cup_g else 1.0)
+    if unit in _CUPS:
+        return amount * _CUPS[unit] * food.cup_g if food.cup_g else None
+    if unit in ("handful", "handfuls"):
+        return amount * _HANDFUL_G
+    # Anything else counts pieces: '2', '2 slices', '1 medium', '3 eggs'
+    if food.unit_g is None:
+        return None
+    return amount * food.unit_g * _SIZES.get(unit, 1.0)
+
+
+# --- Food Table ---
+
+class NutritionTable:
+    """
+    The bundled food table (data/foods.csv: kcal per 100 g, grams per piece and
+    per cup) in an in-memory SQLite database, with an FTS5 index over food names
+    and aliases for fuzzy lookup.
+    """
+
+    def __init__(self, path: str = NUTRITION_TABLE, min_similarity: float = NUTRITION_MIN_SIMILARITY):
+        self.min_similarity = min_similarity
+        self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+            with open(path, encoding="utf-8", newline="") as f:
+                for row in csv.DictReader(f):
+                    food_id = self._conn.execute(
+                        "INSERT INTO foods (name, kcal_per_100g, unit_g, cup_g) VALUES (?, ?, ?, ?)",
+                        (row["name"], float(row["kcal_per_100g"]),
+                         float(row["unit_g"]) if row["unit_g"] else None,
+                         float(row["cup_g"]) if row["cup_g"] else None),
+                    ).lastrowid
+                    names = [row["name"]] + [a.strip() for a in row["aliases"].split(";") if a.strip()]
+                    for name in names:
+                        # Normalised like lookups, so 'hard-boiled egg' matches exactly
+                        name = " ".join(_WORD.findall(name.lower()))
+                        self._conn.execute("INSERT OR IGNORE INTO food_names VALUES (?, ?)", (name, food_id))
+                        self._conn.execute("INSERT INTO food_names_fts VALUES (?, ?)", (name, food_id))
+        self.lookup = lru_cache(maxsize=4096)(self._lookup)
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM foods").fetchone()[0]
+
+    def _food(self, food_id: int) -> Food:
+        return Food(*self._conn.execute(
+            "SELECT name, kcal_per_100g, unit_g, cup_g FROM foods WHERE food_id = ?", (food_id,)
+        ).fetchone())
+
+    def _lookup(self, name: str) -> Optional[Food]:
+        """Exact name or alias first, then the most similar of the full-text candidates."""
+        combined = _COMBINED.search(name.lower())
+        name = " ".join(_WORD.findall(name.lower()))
+        if not name:
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT food_id FROM food_names WHERE name = ?", (name,)).fetchone()
+            if row:
+                return self._food(row[0])
+            if combined:
+                return None
+            match = " OR ".join(f'"{w}"' for w in dict.fromkeys(name.split()))
+            candidates = self._conn.execute(
+                "SELECT name, food_id FROM food_names_fts WHERE food_names_fts MATCH ? ORDER BY rank LIMIT 20",
+                (match,),
+            ).fetchall()
+            # Ties go to the longer name: 'greek yogurt' over 'yogurt'
+            scored = [(self._similarity(name, candidate), len(candidate), food_id) for candidate, food_id in candidates]
+            best = max(scored, default=None)
+            if best is None or best[0] < self.min_similarity:
+                return None
+            return self._food(best[2])
+
+    @staticmethod
+    def _similarity(name: str, candidate: str) -> float:
+        """
+        0 unless every word of the name that is not a descriptor appears in the
+        candidate, so a dish is never costed as one of its ingredients ('apple pie'
+        is not 'apple'). Otherwise, how much of the candidate the name covers.
+        """
+        words = name.split()
+        candidate_words = candidate.split()
+
+        def closeness(word: str, others: List[str]) -> float:
+            best = max((SequenceMatcher(None, word, other).ratio() for other in others), default=0.0)
+            return best if best >= _SAME_WORD else 0.0
+
+        if any(closeness(w, candidate_words) == 0 for w in words if w not in _DESCRIPTORS):
+            return 0.0
+        covered = sum(len(w) * closeness(w, words) for w in candidate_words)
+        return covered / len(candidate.replace(" ", ""))
+
+    # --- Calories ---
+
+    def item_calories(self, item: FoodItem) -> ItemCalories:
+        food = self.lookup(item.name)
+        if item.quantity and _NEGLIGIBLE.search(item.quantity.lower()):
+            return ItemCalories(item, food, 0.0, 0.0)
+        grams = quantity_grams(item.quantity, food) if food else None
+        calories = grams * food.kcal_per_100g / 100 if grams is not None else None
+        return ItemCalories(item, food, grams, calories)
+
+    def meal_calories(self, meal: Meal) -> Optional[int]:
+        """Total for the meal, or None unless every food item could be computed."""
+        items = [self.item_calories(item) for item in meal.food_items]
+        if not items or any(i.calories is None for i in items):
+            return None
+        return round(sum(i.calories for i in items))
+
+    def correct_meal_plan(self, plan: MealPlan) -> dict:
+        """
+        Replaces meal calories with computed ones where every food item is known,
+        and sets each day's total to the sum of its meals. Modifies `plan` in place
+        and returns what was changed.
+        """
+        report = {"meals": 0, "meals_computed": 0, "meals_corrected": 0, "days_corrected": 0, "unknown_items": []}
+        for day in plan.days:
+            meals = [day.breakfast, day.snack, day.lunch, day.dinner]
+            for meal in meals:
+                report["meals"] += 1
+                computed = self.meal_calories(meal)
+                if computed is None:
+                    report["unknown_items"] += [
+                        i.item.name for i in map(self.item_calories, meal.food_items) if i.calories is None
+                    ]
+                    continue
+                report["meals_computed"] += 1
+                if computed != meal.calories:
+                    report["meals_corrected"] += 1
+                    meal.calories = computed
+            total = sum(meal.calories for meal in meals)
+            if total != day.total_calories:
+                report["days_corrected"] += 1
+                day.total_calories = total
+        return report
+
+    def describe(self, food_name: str, quantity: str = "") -> str:
+        """Text answer for the agents' nutrition tool."""
+        food = self.lookup(food_name)
+        if food is None:
+            return f"'{food_name}' is not in the nutrition table."
+        per = f"{food.name}: {food.kcal_per_100g:g} kcal per 100 g"
+        sizes: List[str] = []
+        if food.unit_g:
+            sizes.append(f"one piece/serving is about {food.unit_g:g} g")
+        if food.cup_g:
+            sizes.append(f"one cup is about {food.cup_g:g} g")
+        if sizes:
+            per += " (" + ", ".join(sizes) + ")"
+        grams = quantity_grams(quantity, food)
+        if grams is None:
+            return per + "."
+        return f"{per}. {quantity.strip()} (about {grams:.0f} g) = {grams * food.kcal_per_100g / 100:.0f} kcal."
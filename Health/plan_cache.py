@@ -0,0 +1,208 @@
+# plan_cache.py
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, Optional, Type, TypeVar
+
+from pydantic import BaseModel
+
+from schemas import diet, fitness, general
+
+logger = logging.getLogger(__name__)
+
+P = TypeVar("P", bound=BaseModel)
+
+PLAN_CACHE_ENABLED = os.getenv("PLAN_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+PLAN_CACHE_PATH = os.getenv("PLAN_CACHE_PATH", ".cache/plans.sqlite3")
+PLAN_CACHE_TTL_SECONDS = float(os.getenv("PLAN_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+PLAN_CACHE_MAX_ENTRIES = int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "10000"))
+# Profiles whose numbers fall in the same bucket share a cached plan
+AGE_BUCKET_YEARS = int(os.getenv("PLAN_CACHE_AGE_BUCKET", "5"))
+CALORIE_BUCKET_KCAL = int(os.getenv("PLAN_CACHE_CALORIE_BUCKET", "100"))
+MINUTES_BUCKET = int(os.getenv("PLAN_CACHE_MINUTES_BUCKET", "15"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    plan TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    used_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_plans_used ON plans (used_at);
+"""
+
+_NOTHING = {"", "none", "n/a", "na", "no", "nothing", "none reported"}
+
+
+# --- Canonical Profiles ---
+
+def _text(value: Optional[str]) -> Optional[str]:
+    value = " ".join((value or "").split()).lower()
+    return None if value in _NOTHING else value
+
+
+def _items(values: Iterable[str]) -> list:
+    return sorted({item for item in map(_text, values) if item})
+
+
+def _csv(value: Optional[str]) -> list:
+    """Free-text condition fields are comma-separated lists."""
+    return _items((value or "").split(","))
+
+
+def _bucket(value: int, size: int) -> int:
+    """Nearest multiple of `size`; a positive value never rounds down to 0 (no 0-minute sessions)."""
+    if size <= 1:
+        return value
+    rounded = int(round(value / size)) * size
+    return rounded if rounded or value <= 0 else size
+
+
+def canonical_general(user: general) -> dict:
+    # The name only changes how the plan addresses the user, so it is not part of the key
+    return {
+        "age": _bucket(user.age, AGE_BUCKET_YEARS),
+        "gender": user.gender,
+        "known_conditions": _csv(user.known_conditions),
+        "chronic_conditions": _csv(user.chronic_conditions),
+    }
+
+
+def canonical_diet(user: diet) -> dict:
+    return {
+        "preferences": user.preferences,
+        "calories": _bucket(user.calories, CALORIE_BUCKET_KCAL),
+        "allergies": _items(user.allergies),
+        "intolerances": _items(user.intolerances),
+        "disliked_foods": _items(user.disliked_foods),
+        "cooking_time_preference": user.cooking_time_preference,
+        "budget_preference": user.budget_preference,
+    }
+
+
+def canonical_fitness(user: fitness) -> dict:
+    return {
+        "activity_level": user.activity_level,
+        "goals": _items(user.goals),
+        "available_equipment": _items(user.available_equipment),
+        "time_per_session_minutes": _bucket(user.time_per_session_minutes, MINUTES_BUCKET),
+        "sessions_per_week": user.sessions_per_week,
+        "preferred_activities": _items(user.preferred_activities),
+        "current_fitness_level": user.current_fitness_level,
+        "injuries_limitations": _text(user.injuries_limitations),
+    }
+
+
+def cacheable_inputs(inputs: dict) -> dict:
+    """
+    The crew inputs as the cache key sees them: no name, and age, calories and
+    session length rounded to their buckets. A plan generated from these fits
+    everyone whose profile shares its key, not just the first user in the bucket.
+    """
+    inputs = dict(inputs)
+    user = inputs['general_user']
+    inputs['general_user'] = user.model_copy(update={'name': 'the user', 'age': _bucket(user.age, AGE_BUCKET_YEARS)})
+    if inputs.get('diet_user') is not None:
+        user = inputs['diet_user']
+        inputs['diet_user'] = user.model_copy(update={'calories': _bucket(user.calories, CALORIE_BUCKET_KCAL)})
+    if inputs.get('fitness_user') is not None:
+        user = inputs['fitness_user']
+        inputs['fitness_user'] = user.model_copy(update={
+            'time_per_session_minutes': _bucket(user.time_per_session_minutes, MINUTES_BUCKET),
+        })
+    return inputs
+
+
+def plan_key(kind: str, version: str, **profile: dict) -> str:
+    """`version` identifies the prompt, so editing a task invalidates its cached plans."""
+    payload = json.dumps({"kind": kind, "version": version, **profile}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+# --- Store ---
+
+class PlanCache:
+    """
+    Generated plans in SQLite, keyed on the canonical profile. Entries expire
+    after `ttl` seconds; beyond `max_entries` the least recently used ones are
+    evicted. Hits and misses are counted per plan kind.
+    """
+
+    def __init__(self, db_path: str = PLAN_CACHE_PATH, ttl: float = PLAN_CACHE_TTL_SECONDS,
+                 max_entries: int = PLAN_CACHE_MAX_ENTRIES):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute("DELETE FROM plans WHERE created_at < ?", (time.time() - ttl,))
+
+    def get(self, kind: str, key: str, model: Type[P]) -> Optional[P]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT plan FROM plans WHERE key = ? AND created_at >= ?", (key, now - self.ttl)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE plans SET used_at = ? WHERE key = ?", (now, key))
+        if row is None:
+            self.misses[kind] += 1
+            return None
+        try:
+            plan = model.model_validate_json(row[0])
+        except ValueError:
+            logger.warning(f"Dropping unreadable cached {kind} plan {key[:12]}")
+            self.delete(key)
+            self.misses[kind] += 1
+            return None
+        self.hits[kind] += 1
+        return plan
+
+    def put(self, kind: str, key: str, plan: BaseModel) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO plans (key, kind, plan, created_at, used_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET plan = excluded.plan, created_at = excluded.created_at, "
+                "used_at = excluded.used_at",
+                (key, kind, plan.model_dump_json(), now, now),
+            )
+            excess = self._conn.execute("SELECT COUNT(*) FROM plans").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM plans WHERE key IN (SELECT key FROM plans ORDER BY used_at LIMIT ?)", (excess,)
+                )
+
+    def delete(self, key: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM plans WHERE key = ?", (key,))
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            entries = dict(self._conn.execute(
+                "SELECT kind, COUNT(*) FROM plans WHERE created_at >= ? GROUP BY kind", (time.time() - self.ttl,)
+            ).fetchall())
+        kinds = sorted(set(self.hits) | set(self.misses) | set(entries))
+        return {
+            kind: {
+                "hits": self.hits[kind],
+                "misses": self.misses[kind],
+                "hit_rate": self.hits[kind] / (self.hits[kind] + self.misses[kind])
+                if self.hits[kind] + self.misses[kind] else None,
+                "entries": entries.get(kind, 0),
+            }
+            for kind in kinds
+        }
@@ -1,4 +1,4 @@
-from typing import List, Optional, Literal
+from typing import List, Optional, Literal, Union
 from pydantic import BaseModel
 
 #------------------------
@@ -92,3 +92,26 @@ class WorkoutDay(BaseModel):
 
 class FitnessPlan(BaseModel):
     workout_days: List[WorkoutDay]
+
+
+#------------------------
+# -- Full Plan (all four crews in one request) --
+class full_profile(BaseModel):
+    general_user: general
+    diet_user: Optional[diet] = None
+    fitness_user: Optional[fitness] = None
+    wellness_user: Optional[mental_wellness] = None
+
+
+class SectionResult(BaseModel):
+    status: Literal['ok', 'failed', 'timeout', 'busy', 'skipped']
+    seconds: float = 0.0
+    result: Optional[Union[MealPlan, FitnessPlan, str]] = None
+    error: Optional[str] = None
+
+
+class FullPlan(BaseModel):
+    diet: SectionResult
+    fitness: SectionResult
+    mental: SectionResult
+    chronic: SectionResult
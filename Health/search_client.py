@@ -0,0 +1,222 @@
+# search_client.py
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from langchain_community.tools import DuckDuckGoSearchRun
+
+logger = logging.getLogger(__name__)
+
+# online: DuckDuckGo (falls back to the corpus when it fails); offline: cache and corpus only
+SEARCH_MODE = os.getenv("SEARCH_MODE", "online").lower()
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", ".cache/search.sqlite3")
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", str(3 * 24 * 3600)))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "10000"))
+SEARCH_MAX_CONCURRENCY = int(os.getenv("SEARCH_MAX_CONCURRENCY", "4"))
+# Folder of .md / .txt documents searched in offline mode (a small health corpus ships in data/corpus)
+SEARCH_CORPUS_DIR = os.getenv("SEARCH_CORPUS_DIR", os.path.join(os.path.dirname(__file__), "data", "corpus"))
+SEARCH_CORPUS_RESULTS = int(os.getenv("SEARCH_CORPUS_RESULTS", "3"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    query_key TEXT PRIMARY KEY,
+    query TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    mtime REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+    title, body, tokenize = 'porter unicode61'
+);
+"""
+
+_WORD = re.compile(r"\w+")
+# Words that only make web queries read naturally; they would only add noise to FTS matching
+_STOPWORDS = {
+    "a", "an", "and", "are", "best", "for", "how", "in", "is", "of", "on", "or", "the", "to", "what", "with",
+}
+
+
+def normalize_query(query: str) -> str:
+    """Case, spacing and surrounding punctuation do not change a search."""
+    return " ".join(query.lower().split()).strip(" .?!\"'")
+
+
+def query_key(query: str) -> str:
+    return hashlib.sha256(normalize_query(query).encode()).hexdigest()
+
+
+def corpus_match(query: str) -> Optional[str]:
+    """FTS5 query matching any of the query's words, best matches first by bm25."""
+    words = [w for w in _WORD.findall(normalize_query(query)) if w not in _STOPWORDS]
+    return " OR ".join(f'"{w}"' for w in dict.fromkeys(words)) or None
+
+
+class SearchClient:
+    """
+    One web search client shared by every agent's search tool.
+
+    * Results are cached in SQLite by normalised query for `ttl` seconds, so
+      repeated recipe / exercise lookups do not go to the network. Expired
+      results are purged, and beyond `max_entries` the oldest are evicted.
+    * At most `max_concurrency` web searches run at once across all crews.
+    * Offline mode never touches the network: it answers from the cache, and
+      otherwise from a full-text index over the documents in `corpus_dir`.
+      Online, the corpus is also the fallback when the web search fails.
+    """
+
+    def __init__(self, mode: str = SEARCH_MODE, db_path: str = SEARCH_CACHE_PATH,
+                 ttl: float = SEARCH_CACHE_TTL_SECONDS, max_concurrency: int = SEARCH_MAX_CONCURRENCY,
+                 corpus_dir: str = SEARCH_CORPUS_DIR, max_entries: int = SEARCH_CACHE_MAX_ENTRIES):
+        if mode not in ("online", "offline"):
+            raise ValueError(f"SEARCH_MODE must be 'online' or 'offline', not {mode!r}")
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.mode = mode
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.corpus_dir = corpus_dir
+        self.counts: Counter = Counter()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._web = DuckDuckGoSearchRun(backend="auto")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute("DELETE FROM results WHERE created_at < ?", (time.time() - ttl,))
+        self.index_corpus()
+
+    # --- Corpus ---
+
+    def index_corpus(self) -> None:
+        """Brings the FTS index in line with the corpus folder (new, changed and removed files)."""
+        files = {}
+        if os.path.isdir(self.corpus_dir):
+            for root, _, names in os.walk(self.corpus_dir):
+                for name in names:
+                    if name.endswith((".md", ".txt")):
+                        path = os.path.join(root, name)
+                        files[os.path.relpath(path, self.corpus_dir)] = path
+        with self._lock, self._conn:
+            indexed = dict(self._conn.execute("SELECT path, mtime FROM documents").fetchall())
+            for rel in set(indexed) - set(files):
+                self._remove_document(rel)
+            changed = [rel for rel, path in files.items() if indexed.get(rel) != os.path.getmtime(path)]
+            for rel in changed:
+                self._remove_document(rel)
+                with open(files[rel], encoding="utf-8") as f:
+                    text = f.read()
+                first_line, _, rest = text.partition("\n")
+                title = first_line.lstrip("# ").strip() or rel
+                doc_id = self._conn.execute(
+                    "INSERT INTO documents (path, mtime) VALUES (?, ?)", (rel, os.path.getmtime(files[rel]))
+                ).lastrowid
+                self._conn.execute(
+                    "INSERT INTO documents_fts (rowid, title, body) VALUES (?, ?, ?)", (doc_id, title, rest)
+                )
+        if changed:
+            logger.info(f"Indexed {len(changed)} search corpus documents")
+
+    def _remove_document(self, rel: str) -> None:
+        row = self._conn.execute("SELECT doc_id FROM documents WHERE path = ?", (rel,)).fetchone()
+        if row:
+            self._conn.execute("DELETE FROM documents_fts WHERE rowid = ?", row)
+            self._conn.execute("DELETE FROM documents WHERE doc_id = ?", row)
+
+    def search_corpus(self, query: str, limit: int = SEARCH_CORPUS_RESULTS) -> Optional[str]:
+        match = corpus_match(query)
+        if match is None:
+            return None
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT title, snippet(documents_fts, 1, '', '', ' ... ', 48) FROM documents_fts "
+                "WHERE documents_fts MATCH ? ORDER BY bm25(documents_fts, 5.0, 1.0) LIMIT ?",
+                (match, limit),
+            ).fetchall()
+        if not rows:
+            return None
+        return "\n\n".join(f"{title}: {snippet.strip()}" for title, snippet in rows)
+
+    # --- Cache ---
+
+    def _cached(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM results WHERE query_key = ? AND created_at >= ?", (key, time.time() - self.ttl)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _store(self, key: str, query: str, result: str) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (query_key, query, result, created_at) VALUES (?, ?, ?, ?)",
+                (key, normalize_query(query), result, now),
+            )
+            self._conn.execute("DELETE FROM results WHERE created_at < ?", (now - self.ttl,))
+            excess = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM results WHERE query_key IN "
+                    "(SELECT query_key FROM results ORDER BY created_at LIMIT ?)", (excess,)
+                )
+
+    def _count(self, source: str) -> None:
+        # Searches run in several crew worker threads at once
+        with self._lock:
+            self.counts[source] += 1
+
+    # --- Search ---
+
+    def _web_search(self, query: str) -> str:
+        with self._slots:
+            return self._web.invoke(query)
+
+    def search(self, query: str) -> str:
+        """Blocking; called from the agents' tool in the crew worker threads."""
+        key = query_key(query)
+        cached = self._cached(key)
+        if cached is not None:
+            self._count("cache")
+            return cached
+
+        if self.mode == "offline":
+            self._count("corpus")
+            return self.search_corpus(query) or "No results found in the offline corpus."
+
+        try:
+            result = self._web_search(query)
+        except Exception as e:
+            fallback = self.search_corpus(query)
+            if fallback is None:
+                raise
+            logger.warning(f"Web search failed ({type(e).__name__}: {e}); answering from the corpus")
+            self._count("corpus")
+            return fallback
+        self._count("web")
+        if result.strip():
+            self._store(key, query, result)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            cached = self._conn.execute(
+                "SELECT COUNT(*) FROM results WHERE created_at >= ?", (time.time() - self.ttl,)
+            ).fetchone()[0]
+            documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            answered_from = dict(self.counts)
+        return {"mode": self.mode, "answered_from": answered_from, "cached_queries": cached,
+                "corpus_documents": documents}
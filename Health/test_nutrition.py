@@ -0,0 +1,72 @@
+# test_nutrition.py
+import pytest
+
+from nutrition import NutritionTable, quantity_grams
+from schemas import DayMealPlan, FoodItem, Meal, MealPlan
+
+
+@pytest.fixture(scope="module")
+def table():
+    return NutritionTable()
+
+
+@pytest.mark.parametrize("name", [
+    "Egg fried rice",
+    "Chocolate cake",
+    "Chicken curry",
+    "Apple pie",
+    "Cheese pizza",
+    "Beef burger",
+    "Greek yogurt with berries",
+])
+def test_dishes_are_not_costed_as_one_ingredient(table, name):
+    assert table.lookup(name) is None
+
+
+@pytest.mark.parametrize("name, food", [
+    ("Eggs", "egg"),
+    ("Hard-boiled eggs", "egg"),
+    ("Grilled chicken breast", "chicken breast"),
+    ("Steamed broccoli", "broccoli"),
+    ("Blueberry", "blueberries"),
+    ("Low-fat Greek yogurt", "greek yogurt"),
+    ("Roasted sweet potato", "sweet potato"),
+    ("Baked salmon fillet", "salmon"),
+])
+def test_foods_match_despite_preparation_and_plurals(table, name, food):
+    assert table.lookup(name).name == food
+
+
+@pytest.mark.parametrize("quantity, grams", [
+    ("150 g", 150),
+    ("1 fillet (150g)", 150),
+    ("2 large", 125),
+    ("1/2 cup", 121.5),
+    ("to taste", 0),
+])
+def test_quantity_grams(table, quantity, grams):
+    assert quantity_grams(quantity, table.lookup("egg")) == pytest.approx(grams)
+
+
+def _meal(calories, *items):
+    return Meal(meal_type="meal", calories=calories, notes=None,
+                food_items=[FoodItem(name=name, quantity=quantity, notes=None) for name, quantity in items])
+
+
+def test_correct_meal_plan_leaves_dishes_alone(table):
+    plan = MealPlan(days=[DayMealPlan(
+        day_number=1,
+        breakfast=_meal(500, ("Eggs", "2 large"), ("Whole wheat toast", "1 slice")),
+        snack=_meal(250, ("Apple pie", "1 slice")),
+        lunch=_meal(600, ("Egg fried rice", "1 plate")),
+        dinner=_meal(700, ("Grilled chicken breast", "150 g"), ("Brown rice", "1 cup")),
+        total_calories=0,
+    )])
+    report = table.correct_meal_plan(plan)
+    day = plan.days[0]
+    assert day.snack.calories == 250
+    assert day.lunch.calories == 600
+    assert day.breakfast.calories == round(2 * 62.5 * 1.43 + 32 * 2.47)
+    assert report["meals_computed"] == 2
+    assert set(report["unknown_items"]) == {"Apple pie", "Egg fried rice"}
+    assert day.total_calories == sum(m.calories for m in (day.breakfast, day.snack, day.lunch, day.dinner))